@@ -0,0 +1,311 @@
+# admissao.py
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+import openai
+
+import metricas
+
+logger = logging.getLogger("uvicorn")
+
+# Limites da conta na OpenAI (requisições e tokens por minuto); 0 desliga o limite
+LLM_LIMITE_RPM = float(os.getenv("LLM_LIMITE_RPM", "500"))
+LLM_LIMITE_TPM = float(os.getenv("LLM_LIMITE_TPM", "200000"))
+# Novas tentativas em 429, 5xx e falhas de conexão (o cliente da OpenAI fica com max_retries=0)
+LLM_TENTATIVAS = int(os.getenv("LLM_TENTATIVAS", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+INTERATIVA = 0
+SEGUNDO_PLANO = 1
+_NOMES_PRIORIDADE = {INTERATIVA: "interativa", SEGUNDO_PLANO: "segundo_plano"}
+
+# Chamadas feitas dentro de segundo_plano() (pré-aquecimento, lotes) esperam as interativas
+prioridade: contextvars.ContextVar[int] = contextvars.ContextVar("prioridade_llm", default=INTERATIVA)
+
+
+@contextmanager
+def segundo_plano():
+    token = prioridade.set(SEGUNDO_PLANO)
+    try:
+        yield
+    finally:
+        prioridade.reset(token)
+
+
+class BaldeTokens:
+    """Token bucket com capacidade de um minuto de `por_minuto`; por_minuto <= 0 não limita."""
+
+    def __init__(self, por_minuto: float):
+        self.capacidade = por_minuto
+        self.taxa = por_minuto / 60
+        self.disponivel = por_minuto
+        self._atualizado = time.monotonic()
+
+    @property
+    def ilimitado(self) -> bool:
+        return self.capacidade <= 0
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    def segundos_ate(self, quantidade: float) -> float:
+        if self.ilimitado:
+            return 0.0
+        self._repor()
+        return max(0.0, (quantidade - self.disponivel) / self.taxa)
+
+    def consumir(self, quantidade: float):
+        # Pode ficar negativo quando o uso real passa da estimativa: as próximas esperam mais
+        if not self.ilimitado:
+            self._repor()
+            self.disponivel = min(self.capacidade, self.disponivel - quantidade)
+
+
+class _Estimativa:
+    """Custo esperado de uma chamada por rótulo, ajustado pelo `usage` das respostas anteriores."""
+
+    _PESO = 0.2  # média móvel exponencial
+
+    def __init__(self):
+        self.tokens_por_caractere: dict[str, float] = {}
+        self.completion: dict[str, float] = {}
+
+    @staticmethod
+    def _caracteres(kwargs: dict) -> int:
+        return sum(len(str(m.get("content") or "")) for m in kwargs.get("messages") or ())
+
+    def custo(self, rotulo: str, kwargs: dict) -> int:
+        prompt = self._caracteres(kwargs) * self.tokens_por_caractere.get(rotulo, 0.25)
+        max_tokens = kwargs.get("max_tokens")
+        if max_tokens is None:
+            max_tokens = 1000
+        return int(prompt + min(max_tokens, self.completion.get(rotulo, max_tokens)))
+
+    def aprender(self, rotulo: str, kwargs: dict, usage):
+        caracteres = self._caracteres(kwargs)
+        if caracteres:
+            self._media(self.tokens_por_caractere, rotulo, usage.prompt_tokens / caracteres)
+        self._media(self.completion, rotulo, usage.completion_tokens)
+
+    def _media(self, medias: dict, rotulo: str, valor: float):
+        anterior = medias.get(rotulo)
+        medias[rotulo] = valor if anterior is None else anterior + self._PESO * (valor - anterior)
+
+
+class Reserva:
+    """Tokens reservados para uma chamada admitida; ajustar() acerta o balde com o uso real."""
+
+    def __init__(self, controlador: "ControladorAdmissao", rotulo: str, kwargs: dict, custo: int):
+        self._controlador = controlador
+        self.rotulo = rotulo
+        self.kwargs = kwargs
+        self.custo = custo
+
+    def ajustar(self, usage):
+        usado = usage.total_tokens if usage is not None else 0
+        if usage is not None:
+            self._controlador.estimativa.aprender(self.rotulo, self.kwargs, usage)
+        self._controlador.devolver(self.custo - usado)
+        self.custo = usado
+
+
+class ControladorAdmissao:
+    """
+    Controle de admissão das chamadas à OpenAI.
+
+    Cada chamada reserva 1 requisição e o custo estimado em tokens dos baldes de RPM e TPM;
+    sem saldo, espera em uma fila de prioridade (interativas antes das de segundo plano,
+    e por ordem de chegada dentro de cada prioridade). Um 429 pausa a admissão de todas.
+    """
+
+    def __init__(self, rpm: float = LLM_LIMITE_RPM, tpm: float = LLM_LIMITE_TPM):
+        self.requisicoes = BaldeTokens(rpm)
+        self.tokens = BaldeTokens(tpm)
+        self.estimativa = _Estimativa()
+        self._fila: list[tuple[int, int, asyncio.Future, int]] = []
+        self._sequencia = itertools.count()
+        self._despertador: tuple[asyncio.TimerHandle, asyncio.AbstractEventLoop] | None = None
+        self._pausado_ate = 0.0
+
+        self.admitidas = 0
+        self.enfileiradas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.limitadas = 0  # respostas 429
+        self.novas_tentativas = 0
+
+    def _segundos_ate_caber(self, custo: int) -> float:
+        return max(
+            self._pausado_ate - time.monotonic(),
+            self.requisicoes.segundos_ate(1),
+            self.tokens.segundos_ate(custo),
+        )
+
+    def _consumir(self, custo: int):
+        self.requisicoes.consumir(1)
+        self.tokens.consumir(custo)
+
+    def devolver(self, tokens: float):
+        if tokens:
+            self.tokens.consumir(-tokens)
+            if tokens > 0:
+                self._despachar()
+
+    def pausar(self, segundos: float):
+        self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+
+    def _despachar(self):
+        while self._fila:
+            _, _, futuro, custo = self._fila[0]
+            if futuro.done():  # quem esperava foi cancelado
+                heapq.heappop(self._fila)
+                continue
+            if self._segundos_ate_caber(custo) > 0:
+                break
+            heapq.heappop(self._fila)
+            self._consumir(custo)
+            futuro.set_result(None)
+        self._atualizar_profundidade()
+
+        # Um despertador por vez; o de um event loop já encerrado (ex.: testes) é descartado
+        if self._fila and (self._despertador is None or self._despertador[1].is_closed()):
+            futuro, custo = self._fila[0][2], self._fila[0][3]
+            loop = futuro.get_loop()
+            self._despertador = (loop.call_later(self._segundos_ate_caber(custo), self._acordar), loop)
+
+    def _acordar(self):
+        self._despertador = None
+        self._despachar()
+
+    def _atualizar_profundidade(self):
+        for valor, nome in _NOMES_PRIORIDADE.items():
+            total = sum(1 for p, _, futuro, _ in self._fila if p == valor and not futuro.done())
+            metricas.registro.definir("llm_fila_profundidade", total, prioridade=nome)
+
+    async def admitir(self, rotulo: str, kwargs: dict) -> Reserva:
+        custo = self.estimativa.custo(rotulo, kwargs)
+        if not self.tokens.ilimitado:
+            custo = min(custo, int(self.tokens.capacidade))
+        nivel = prioridade.get()
+        inicio = time.monotonic()
+
+        if not self._fila and self._segundos_ate_caber(custo) == 0:
+            self._consumir(custo)
+        else:
+            self.enfileiradas += 1
+            futuro = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._fila, (nivel, next(self._sequencia), futuro, custo))
+            self._despachar()
+            try:
+                await futuro
+            except asyncio.CancelledError:
+                # Admitida e cancelada antes de usar: os tokens voltam para o balde
+                if futuro.done() and not futuro.cancelled():
+                    self.requisicoes.consumir(-1)
+                    self.devolver(custo)
+                self._atualizar_profundidade()
+                raise
+
+        espera = time.monotonic() - inicio
+        self.admitidas += 1
+        self.espera_total += espera
+        self.espera_maxima = max(self.espera_maxima, espera)
+        metricas.registro.observar("llm_fila_espera_segundos", espera, prioridade=_NOMES_PRIORIDADE[nivel])
+        if espera > 0:
+            metricas.registrar_etapa("llm_fila", espera, rotulo)
+        return Reserva(self, rotulo, kwargs, custo)
+
+    async def executar(self, rotulo: str, kwargs: dict, chamada, prazo: float | None = None) -> tuple:
+        """
+        Admite e executa `chamada()` com novas tentativas; retorna (resultado, reserva).
+
+        `prazo` limita cada tentativa depois de admitida (asyncio.TimeoutError ao passar dele);
+        a espera na fila e os intervalos entre tentativas não contam.
+
+        Quem chama acerta a reserva com o `usage` da resposta (reserva.ajustar). Se a chamada
+        falhar ou for cancelada, a reserva é devolvida inteira aqui mesmo.
+        """
+        for tentativa in range(LLM_TENTATIVAS + 1):
+            reserva = await self.admitir(rotulo, kwargs)
+            try:
+                resultado = await asyncio.wait_for(chamada(), prazo)
+            except openai.RateLimitError as erro:
+                # A chamada recusada não consumiu tokens na OpenAI
+                reserva.ajustar(None)
+                if getattr(erro, "code", None) == "insufficient_quota" or tentativa == LLM_TENTATIVAS:
+                    metricas.registro.incrementar("llm_tentativas_total", rotulo=rotulo, resultado="429")
+                    raise
+                self.limitadas += 1
+                motivo = "429"
+                espera = _backoff(tentativa, _retry_after(erro))
+                # Os outros também seriam recusados: segura a fila inteira
+                self.pausar(espera)
+            except (openai.APIConnectionError, openai.InternalServerError) as erro:
+                reserva.ajustar(None)
+                if tentativa == LLM_TENTATIVAS:
+                    metricas.registro.incrementar("llm_tentativas_total", rotulo=rotulo, resultado="erro")
+                    raise
+                motivo = type(erro).__name__
+                espera = _backoff(tentativa, _retry_after(erro))
+            except BaseException:
+                # Cancelada ou com erro sem nova tentativa: sem usage, os tokens estimados voltam
+                # para o balde em vez de ficarem debitados até ele se repor
+                reserva.ajustar(None)
+                raise
+            else:
+                metricas.registro.incrementar("llm_tentativas_total", rotulo=rotulo, resultado="ok")
+                return resultado, reserva
+
+            self.novas_tentativas += 1
+            metricas.registro.incrementar("llm_tentativas_total", rotulo=rotulo, resultado="nova_tentativa")
+            logger.warning(f"Chamada à IA ({rotulo}) falhou ({motivo}); nova tentativa em {round(espera, 2)} segundos.")
+            await asyncio.sleep(espera)
+
+    def estatisticas(self) -> dict:
+        fila = {nome: 0 for nome in _NOMES_PRIORIDADE.values()}
+        for nivel, _, futuro, _ in self._fila:
+            if not futuro.done():
+                fila[_NOMES_PRIORIDADE[nivel]] += 1
+        return {
+            "limite_rpm": self.requisicoes.capacidade,
+            "limite_tpm": self.tokens.capacidade,
+            "disponivel_requisicoes": None if self.requisicoes.ilimitado else round(self.requisicoes.disponivel, 1),
+            "disponivel_tokens": None if self.tokens.ilimitado else round(self.tokens.disponivel),
+            "fila": fila,
+            "admitidas": self.admitidas,
+            "enfileiradas": self.enfileiradas,
+            "espera_media": round(self.espera_total / self.admitidas, 4) if self.admitidas else 0.0,
+            "espera_maxima": round(self.espera_maxima, 4),
+            "respostas_429": self.limitadas,
+            "novas_tentativas": self.novas_tentativas,
+            "pausado_por": round(max(0.0, self._pausado_ate - time.monotonic()), 3),
+        }
+
+
+def _retry_after(erro) -> float:
+    resposta = getattr(erro, "response", None)
+    if resposta is None:
+        return 0.0
+    try:
+        return float(resposta.headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+def _backoff(tentativa: int, minimo: float = 0.0) -> float:
+    # Exponencial com jitter completo, nunca antes do retry-after informado pela OpenAI
+    return max(minimo, random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** tentativa)))
+
+
+controlador = ControladorAdmissao()
@@ -1,25 +1,189 @@
-def gerar_insights_para_persona(df):
-    from collections import Counter
+# analytics.py
+
+import asyncio
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import metricas
+from db import fetch_all, fetch_all_async, fetch_one, fetch_one_async
+from queries import (
+    GET_AGREGADO_TICKET_MEDIO,
+    GET_AGREGADO_TOP_CLIENTES,
+    GET_AGREGADO_TOP_PRODUTOS,
+    GET_AGREGADO_TOP_HORAS,
+    GET_AGREGADO_TOP_DIAS,
+    GET_AGREGADO_TOP_CAMPANHAS,
+    GET_AGREGADO_GENERO,
+)
+
+logger = logging.getLogger("uvicorn")
+
 
-    top_clientes = df["cliente_nome"].value_counts().head(3)
-    ticket_medio_produtos = round(df["pedido_venda_valor_subtotal"].mean(), 2)
+def _extrair_horas(hora_pedido: pd.Series) -> np.ndarray:
+    # "HH:MM:SS" -> HH: converte os dois primeiros bytes de todas as linhas de uma vez
+    # (dtype S2) e calcula a hora pelos códigos ASCII; valores nulos ou inválidos são descartados
+    brutos = hora_pedido.fillna("").to_numpy(dtype="S2")
+    digitos = np.frombuffer(brutos.tobytes(), dtype=np.uint8).reshape(-1, 2).astype(np.int64) - ord("0")
+    validos = ((digitos >= 0) & (digitos <= 9)).all(axis=1)
+    return digitos[validos, 0] * 10 + digitos[validos, 1]
 
-    todos_produtos = []
-    df["produtos"].str.split(" | ").apply(todos_produtos.extend)
-    mais_vendidos = Counter(todos_produtos).most_common(3)
 
-    df["hora"] = df["hora_pedido"].str.slice(0, 2).astype(int)
-    top_horas = df["hora"].value_counts().head(3)
-    dias_semana = df["dia_semana_pedido"].value_counts().head(3)
-    campanhas = df["pedido_venda_utm_campaign"].dropna().value_counts().head(3)
-    genero = df["cliente_sexo"].value_counts()
+def _separar_produtos(produtos: pd.Series) -> np.ndarray:
+    # Une os GROUP_CONCAT e separa uma única vez (separador literal, sem regex)
+    validos = produtos.dropna().tolist()
+    if not validos:
+        return np.array([], dtype=object)
+    return np.array(" | ".join(validos).split(" | "), dtype=object)
 
+
+def _contar(colunas: dict) -> dict:
+    """
+    Conta os valores de todas as colunas em uma única passada.
+
+    Cada coluna (ou array) vira códigos inteiros (pd.factorize, na ordem de aparição); os códigos
+    recebem um deslocamento por coluna e são contados juntos com um único np.bincount. Só a
+    ordenação é feita por coluna (um np.lexsort único sobre todas sai mais lento). Nulos são
+    ignorados, como no value_counts, e empates ficam na ordem de aparição, como no
+    Counter.most_common, para que os mesmos pedidos gerem sempre o mesmo prompt.
+    """
+    codigos, valores, inicios = [], [], [0]
+    for serie in colunas.values():
+        codigo, unicos = pd.factorize(serie, sort=False)
+        codigos.append(codigo[codigo >= 0] + inicios[-1])
+        valores.append(unicos)
+        inicios.append(inicios[-1] + len(unicos))
+
+    totais = np.bincount(np.concatenate(codigos), minlength=inicios[-1])
     return {
-        "top_clientes": top_clientes.to_dict(),
+        nome: pd.Series(totais[inicios[i]:inicios[i + 1]], index=valores[i]).sort_values(ascending=False, kind="stable")
+        for i, nome in enumerate(colunas)
+    }
+
+
+@metricas.medir("gerar_insights")
+def gerar_insights_para_persona(df):
+    # Não altera nem copia o DataFrame recebido: só cria as séries derivadas necessárias
+    colunas = {
+        "cliente_nome": df["cliente_nome"],
+        "hora": _extrair_horas(df["hora_pedido"]),
+        "dia_semana_pedido": df["dia_semana_pedido"],
+        "pedido_venda_utm_campaign": df["pedido_venda_utm_campaign"],
+        "cliente_sexo": df["cliente_sexo"],
+        "produto": _separar_produtos(df["produtos"]),
+    }
+    contagens = _contar(colunas)
+    ticket_medio_produtos = round(float(pd.to_numeric(df["pedido_venda_valor_subtotal"], errors="coerce").mean()), 2)
+
+    return {
+        "top_clientes": contagens["cliente_nome"].head(3).to_dict(),
         "ticket_medio_produtos": ticket_medio_produtos,
-        "produtos_mais_vendidos": mais_vendidos,
-        "horas_com_mais_vendas": top_horas.to_dict(),
-        "dias_com_mais_pedidos": dias_semana.to_dict(),
-        "campanhas_mais_ativas": campanhas.to_dict(),
-        "pedidos_por_genero": genero.to_dict(),
+        "produtos_mais_vendidos": list(contagens["produto"].head(3).to_dict().items()),
+        "horas_com_mais_vendas": contagens["hora"].head(3).to_dict(),
+        "dias_com_mais_pedidos": contagens["dia_semana_pedido"].head(3).to_dict(),
+        "campanhas_mais_ativas": contagens["pedido_venda_utm_campaign"].head(3).to_dict(),
+        "pedidos_por_genero": contagens["cliente_sexo"].to_dict(),
     }
+
+
+def contar_produtos_vendidos(df) -> pd.Series:
+    """Vendas de cada produto nos pedidos (mesma contagem de produtos_mais_vendidos), em ordem decrescente."""
+    return _contar({"produto": _separar_produtos(df["produtos"])})["produto"]
+
+
+# "agregado": estatísticas calculadas no StarRocks sobre toda a janela de 30 dias;
+# "pandas": calculadas a partir dos pedidos carregados (no máximo 500);
+# "comparar": calcula pelos dois caminhos, registra as diferenças no log e usa o agregado.
+INSIGHTS_MODO = os.getenv("INSIGHTS_MODO", "agregado")
+
+_CONSULTAS_TOP = {
+    "top_clientes": GET_AGREGADO_TOP_CLIENTES,
+    "produtos_mais_vendidos": GET_AGREGADO_TOP_PRODUTOS,
+    "horas_com_mais_vendas": GET_AGREGADO_TOP_HORAS,
+    "dias_com_mais_pedidos": GET_AGREGADO_TOP_DIAS,
+    "campanhas_mais_ativas": GET_AGREGADO_TOP_CAMPANHAS,
+    "pedidos_por_genero": GET_AGREGADO_GENERO,
+}
+
+
+def _montar_insights_agregados(ticket_medio, tops: dict) -> dict:
+    insights = {chave: {linha["valor"]: linha["total"] for linha in linhas} for chave, linhas in tops.items()}
+    insights["ticket_medio_produtos"] = round(float(ticket_medio), 2) if ticket_medio is not None else None
+    insights["produtos_mais_vendidos"] = [(linha["valor"], linha["total"]) for linha in tops["produtos_mais_vendidos"]]
+    return insights
+
+
+def gerar_insights_agregados(conta_id: int) -> dict:
+    with metricas.medir("insights_agregados"):
+        ticket_medio = fetch_one(GET_AGREGADO_TICKET_MEDIO, (conta_id,))
+        tops = {chave: fetch_all(query, (conta_id,)) for chave, query in _CONSULTAS_TOP.items()}
+        return _montar_insights_agregados(ticket_medio, tops)
+
+
+async def gerar_insights_agregados_async(conta_id: int) -> dict:
+    with metricas.medir("insights_agregados"):
+        ticket_medio, *resultados = await asyncio.gather(
+            fetch_one_async(GET_AGREGADO_TICKET_MEDIO, (conta_id,)),
+            *(fetch_all_async(query, (conta_id,)) for query in _CONSULTAS_TOP.values()),
+        )
+        return _montar_insights_agregados(ticket_medio, dict(zip(_CONSULTAS_TOP, resultados)))
+
+
+def comparar_insights(agregado: dict, pandas_: dict) -> dict:
+    # Retorna só as estatísticas que diferem entre os dois caminhos
+    return {
+        chave: {"agregado": agregado.get(chave), "pandas": pandas_.get(chave)}
+        for chave in sorted(set(agregado) | set(pandas_))
+        if agregado.get(chave) != pandas_.get(chave)
+    }
+
+
+def _registrar_comparacao(conta_id: int, agregado: dict, pandas_: dict):
+    diferencas = comparar_insights(agregado, pandas_)
+    if diferencas:
+        logger.info(f"Insights da conta {conta_id} diferem entre agregado e pandas: {diferencas}")
+    else:
+        logger.info(f"Insights da conta {conta_id} iguais nos dois caminhos.")
+
+
+def obter_insights(conta_id: int, df, modo: str | None = None) -> dict:
+    modo = modo or INSIGHTS_MODO
+    if modo == "pandas":
+        return gerar_insights_para_persona(df)
+    try:
+        agregado = gerar_insights_agregados(conta_id)
+    except Exception:
+        logger.exception("Falha nas consultas agregadas, usando o cálculo em pandas.")
+        return gerar_insights_para_persona(df)
+    if modo == "comparar":
+        _registrar_comparacao(conta_id, agregado, gerar_insights_para_persona(df))
+    return agregado
+
+
+async def obter_insights_async(conta_id: int, df, modo: str | None = None) -> dict:
+    modo = modo or INSIGHTS_MODO
+    if modo == "pandas":
+        return await asyncio.to_thread(gerar_insights_para_persona, df)
+    return await combinar_insights_async(conta_id, df, await tentar_insights_agregados_async(conta_id), modo)
+
+
+# As duas metades de obter_insights_async, para quem dispara as consultas agregadas junto
+# com a de pedidos (elas só dependem do conta_id) e combina os resultados depois.
+async def tentar_insights_agregados_async(conta_id: int) -> dict | None:
+    try:
+        return await gerar_insights_agregados_async(conta_id)
+    except Exception:
+        logger.exception("Falha nas consultas agregadas, usando o cálculo em pandas.")
+        return None
+
+
+async def combinar_insights_async(conta_id: int, df, agregado: dict | None, modo: str | None = None) -> dict:
+    # agregado None: modo "pandas" ou falha nas consultas agregadas
+    modo = modo or INSIGHTS_MODO
+    if agregado is None:
+        return await asyncio.to_thread(gerar_insights_para_persona, df)
+    if modo == "comparar":
+        _registrar_comparacao(conta_id, agregado, await asyncio.to_thread(gerar_insights_para_persona, df))
+    return agregado
@@ -0,0 +1,112 @@
+# benchmarks/bench_analytics.py
+#
+# Micro-benchmark de analytics.gerar_insights_para_persona com pedidos sintéticos.
+#
+#   python benchmarks/bench_analytics.py
+#   python benchmarks/bench_analytics.py --tamanhos 500 100000 --repeticoes 5 --legado
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import gerar_insights_para_persona  # noqa: E402
+
+DIAS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def gerar_pedidos(n: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    produtos = np.array([f"Produto {i} Tamanho {i % 5}" for i in range(2000)], dtype=object)
+    nomes = np.array([f"Cliente{i}" for i in range(max(50, n // 20))], dtype=object)
+    campanhas = np.array([None, None, "black_friday", "instagram", "google_ads", "email"], dtype=object)
+
+    itens_por_pedido = rng.integers(1, 4, size=n)
+    lista_produtos = [
+        " | ".join(produtos[rng.integers(0, len(produtos), size=k)]) for k in itens_por_pedido
+    ]
+    segundos = rng.integers(0, 86400, size=n)
+    return pd.DataFrame(
+        {
+            "pedido_venda_id": np.arange(n, 0, -1),
+            "hora_pedido": [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in segundos],
+            "dia_semana_pedido": np.array(DIAS, dtype=object)[rng.integers(0, 7, size=n)],
+            "cliente_nome": nomes[rng.integers(0, len(nomes), size=n)],
+            "cliente_sexo": np.array(["M", "F", None], dtype=object)[rng.integers(0, 3, size=n)],
+            "pedido_venda_valor_subtotal": rng.gamma(2.0, 80.0, size=n).round(2),
+            "pedido_venda_utm_campaign": campanhas[rng.integers(0, len(campanhas), size=n)],
+            "produtos": lista_produtos,
+        }
+    )
+
+
+def _contar_legado(serie: pd.Series) -> pd.Series:
+    # value_counts sozinho não define a ordem dos empates; aqui ficam na ordem de aparição,
+    # a mesma de analytics._contar, para que os resultados possam ser comparados
+    return serie.value_counts(sort=False).sort_values(ascending=False, kind="stable")
+
+
+def insights_legado(df):
+    # Implementação anterior (Counter + value_counts por estatística), mantida só para comparação
+    df = df.copy()
+    top_clientes = _contar_legado(df["cliente_nome"]).head(3)
+    ticket_medio_produtos = round(df["pedido_venda_valor_subtotal"].mean(), 2)
+    todos_produtos = []
+    df["produtos"].str.split(" | ", regex=False).apply(todos_produtos.extend)
+    mais_vendidos = Counter(todos_produtos).most_common(3)
+    df["hora"] = df["hora_pedido"].str.slice(0, 2).astype(int)
+    return {
+        "top_clientes": top_clientes.to_dict(),
+        "ticket_medio_produtos": ticket_medio_produtos,
+        "produtos_mais_vendidos": mais_vendidos,
+        "horas_com_mais_vendas": _contar_legado(df["hora"]).head(3).to_dict(),
+        "dias_com_mais_pedidos": _contar_legado(df["dia_semana_pedido"]).head(3).to_dict(),
+        "campanhas_mais_ativas": _contar_legado(df["pedido_venda_utm_campaign"].dropna()).head(3).to_dict(),
+        "pedidos_por_genero": _contar_legado(df["cliente_sexo"]).to_dict(),
+    }
+
+
+def _ordenado(insights: dict) -> dict:
+    # Compara também a ordem das entradas, que é a ordem em que aparecem no prompt
+    return {chave: list(dict(valor).items()) if isinstance(valor, (dict, list)) else valor for chave, valor in insights.items()}
+
+
+def medir(funcao, df: pd.DataFrame, repeticoes: int) -> float:
+    funcao(df)  # aquecimento
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(df)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[500, 5_000, 50_000, 500_000, 1_000_000])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--legado", action="store_true", help="mede também a implementação anterior")
+    args = parser.parse_args()
+
+    print(f"{'pedidos':>10} {'tempo (ms)':>12} {'pedidos/s':>14}" + (f" {'legado (ms)':>12} {'ganho':>7}" if args.legado else ""))
+    for n in args.tamanhos:
+        df = gerar_pedidos(n)
+        colunas_antes = list(df.columns)
+        tempo = medir(gerar_insights_para_persona, df, args.repeticoes)
+        assert list(df.columns) == colunas_antes, "gerar_insights_para_persona alterou o DataFrame"
+        linha = f"{n:>10} {1000 * tempo:>12.2f} {n / tempo:>14,.0f}"
+        if args.legado:
+            assert _ordenado(gerar_insights_para_persona(df)) == _ordenado(insights_legado(df)), "resultados diferentes"
+            tempo_legado = medir(insights_legado, df, args.repeticoes)
+            linha += f" {1000 * tempo_legado:>12.2f} {tempo_legado / tempo:>6.1f}x"
+        print(linha)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# benchmarks/carga.py
+#
+# Testes de carga dos endpoints com as dependências locais: o banco SQLite de
+# fixture_sqlite.py no lugar do StarRocks (troca de db.pool.fabrica) e o servidor
+# servidor_openai.py no lugar da OpenAI. O app roda no mesmo processo, via ASGI.
+#
+#   python benchmarks/carga.py --saida .cache/bench/antes.json
+#   python benchmarks/carga.py --cenarios insights --loja 10000 --requisicoes 500 --concorrencia 50
+#   python benchmarks/carga.py --comparar .cache/bench/antes.json .cache/bench/depois.json
+
+import argparse
+import asyncio
+import datetime as dt
+import io
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.fixture_sqlite import conectar, criar_fixture, dominio_loja  # noqa: E402
+
+
+def _wav(segundos: int, taxa: int = 16000) -> bytes:
+    saida = io.BytesIO()
+    with wave.open(saida, "wb") as arquivo:
+        arquivo.setnchannels(1)
+        arquivo.setsampwidth(2)
+        arquivo.setframerate(taxa)
+        arquivo.writeframes(b"\0\0" * taxa * segundos)
+    return saida.getvalue()
+
+
+def _cenarios(dominio: str, audio: bytes) -> dict:
+    # nome -> função que devolve os argumentos de client.request
+    return {
+        "generate_personas": lambda: (
+            "POST",
+            "/generate_personas",
+            {
+                "json": {
+                    "nome": "Maria",
+                    "idade": "32",
+                    "genero": "Feminino",
+                    "descricao": "Compra roupas para o trabalho todo mês.",
+                    "autoriza_dados": True,
+                    "dominio_loja": dominio,
+                }
+            },
+        ),
+        "insights": lambda: ("POST", "/insights", {"json": {"dominio_loja": dominio}}),
+        "improve_products": lambda: ("POST", "/improve_products", {"json": {"dominio_loja": dominio}}),
+        "transcribe_audio": lambda: ("POST", "/transcribe_audio", {"files": {"file": ("audio.wav", audio, "audio/wav")}}),
+    }
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as arquivo:
+        return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+def _pico_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor_openai(porta: int, latencia: float, tokens_por_segundo: float) -> subprocess.Popen:
+    processo = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(RAIZ, "benchmarks", "servidor_openai.py"),
+            "--porta", str(porta),
+            "--latencia", str(latencia),
+            "--tokens-por-segundo", str(tokens_por_segundo),
+        ]
+    )
+    import httpx
+
+    prazo = time.monotonic() + 15
+    while time.monotonic() < prazo:
+        try:
+            httpx.get(f"http://127.0.0.1:{porta}/v1/estatisticas", timeout=1)
+            return processo
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    processo.kill()
+    raise RuntimeError("Servidor OpenAI de teste não respondeu.")
+
+
+async def _rodar_cenario(client, nome: str, requisicao, total: int, concorrencia: int, aquecimento: int) -> dict:
+    for _ in range(aquecimento):
+        metodo, caminho, kwargs = requisicao()
+        await client.request(metodo, caminho, **kwargs)
+
+    latencias = []
+    erros = 0
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def uma():
+        nonlocal erros
+        metodo, caminho, kwargs = requisicao()
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                resposta = await client.request(metodo, caminho, **kwargs)
+                if resposta.status_code >= 400 or (resposta.headers.get("content-type", "").startswith("application/json") and "erro" in resposta.text[:50]):
+                    erros += 1
+            except Exception:
+                erros += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    rss_antes = _rss_mb()
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma() for _ in range(total)))
+    duracao = time.perf_counter() - inicio
+
+    ms = 1000 * np.array(latencias)
+    return {
+        "requisicoes": total,
+        "concorrencia": concorrencia,
+        "erros": erros,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "vazao_rps": round(total / duracao, 2),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_delta_mb": round(_rss_mb() - rss_antes, 1),
+        "rss_pico_mb": round(_pico_rss_mb(), 1),
+    }
+
+
+async def _rodar(args, dominio: str) -> dict:
+    import httpx
+
+    import db
+    import main
+
+    db.pool.fabrica = lambda: conectar(args.fixture)
+    cenarios = _cenarios(dominio, _wav(args.audio_segundos))
+    resultados = {}
+    async with main.lifespan(main.app):
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=300) as client:
+            for nome in args.cenarios:
+                resultados[nome] = await _rodar_cenario(
+                    client, nome, cenarios[nome], args.requisicoes, args.concorrencia, args.aquecimento
+                )
+                print(_linha(nome, resultados[nome]), flush=True)
+    return resultados
+
+
+_CABECALHO = f"{'cenário':<20} {'reqs':>6} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'RSS MB':>8} {'pico MB':>8}"
+
+
+def _linha(nome: str, r: dict) -> str:
+    return (
+        f"{nome:<20} {r['requisicoes']:>6} {r['erros']:>6} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+        f"{r['p99_ms']:>9.1f} {r['vazao_rps']:>8.1f} {r['rss_mb']:>8.1f} {r['rss_pico_mb']:>8.1f}"
+    )
+
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(caminho_base: str, caminho_novo: str):
+    with open(caminho_base) as arquivo:
+        base = json.load(arquivo)
+    with open(caminho_novo) as arquivo:
+        novo = json.load(arquivo)
+    print(f"base: {caminho_base} ({base.get('commit')})  novo: {caminho_novo} ({novo.get('commit')})")
+    metricas = ("p50_ms", "p95_ms", "p99_ms", "vazao_rps", "rss_pico_mb", "erros")
+    print(f"{'cenário':<20} " + " ".join(f"{m:>26}" for m in metricas))
+    for nome in sorted(set(base["resultados"]) & set(novo["resultados"])):
+        celulas = []
+        for metrica in metricas:
+            a, b = base["resultados"][nome][metrica], novo["resultados"][nome][metrica]
+            variacao = f"{100 * (b - a) / a:+.1f}%" if a else "-"
+            celulas.append(f"{a:>8g} → {b:<8g} {variacao:>6}")
+        print(f"{nome:<20} " + " ".join(f"{c:>26}" for c in celulas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testes de carga com SQLite e servidor OpenAI locais.")
+    parser.add_argument("--cenarios", nargs="+", default=["generate_personas", "insights", "improve_products", "transcribe_audio"])
+    parser.add_argument("--requisicoes", type=int, default=100)
+    parser.add_argument("--concorrencia", type=int, default=10)
+    parser.add_argument("--aquecimento", type=int, default=3)
+    parser.add_argument("--loja", type=int, default=1_000, help="número de pedidos da loja usada nos cenários")
+    parser.add_argument("--fixture", default=os.path.join(RAIZ, ".cache", "bench", "lojaintegrada.sqlite"))
+    parser.add_argument("--latencia", type=float, default=0.3, help="latência do servidor OpenAI de teste")
+    parser.add_argument("--tokens-por-segundo", type=float, default=500)
+    parser.add_argument("--audio-segundos", type=int, default=30)
+    parser.add_argument("--cache-llm", action="store_true", help="mantém o cache de respostas do LLM ligado")
+    parser.add_argument("--cache-contexto", action="store_true", help="mantém o cache de contexto ligado")
+    parser.add_argument("--saida", help="grava os resultados em JSON para comparar depois")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NOVO"))
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    criar_fixture(args.fixture, [args.loja])
+    porta = _porta_livre()
+    servidor = iniciar_servidor_openai(porta, args.latencia, args.tokens_por_segundo)
+    temporario = tempfile.mkdtemp(prefix="bench-")
+    # Configuração do serviço antes de importá-lo (os módulos leem o ambiente no import)
+    os.environ.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{porta}/v1",
+        OPENAI_API_KEY="bench",
+        LLM_CACHE="1" if args.cache_llm else "0",
+        LLM_CACHE_CAMINHO="",
+        PEDIDOS_LOCAIS_DIR=os.path.join(temporario, "pedidos"),
+        CATALOGO_DIR=os.path.join(temporario, "catalogo"),
+        PREAQUECIMENTO="0",
+        RESOLVEDOR_PRECARGA="0",
+        PREAQUECIMENTO_TRAVA="",
+    )
+    if not args.cache_contexto:
+        os.environ["CONTEXTO_CACHE_TTL"] = "0"
+
+    try:
+        print(_CABECALHO)
+        resultados = asyncio.run(_rodar(args, dominio_loja(args.loja)))
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    if args.saida:
+        pasta = os.path.dirname(args.saida)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with open(args.saida, "w") as arquivo:
+            json.dump(
+                {
+                    "commit": _commit_atual(),
+                    "data": dt.datetime.now().isoformat(timespec="seconds"),
+                    "parametros": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+                    "resultados": resultados,
+                },
+                arquivo,
+                indent=2,
+                ensure_ascii=False,
+            )
+        print(f"Resultados gravados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# benchmarks/fixture_sqlite.py
+#
+# Banco SQLite que imita as tabelas do schema lojaintegrada usadas em queries.py, para
+# rodar o serviço e os benchmarks sem o StarRocks. O arquivo é anexado como "lojaintegrada"
+# e as consultas passam por uma tradução mínima do dialeto MySQL/StarRocks para o SQLite.
+#
+#   python benchmarks/fixture_sqlite.py --caminho .cache/bench/lojaintegrada.sqlite --lojas 100 1000 10000
+#
+# Uso no serviço (ver benchmarks/carga.py):
+#
+#   db.pool.fabrica = lambda: conectar("caminho/lojaintegrada.sqlite")
+
+import argparse
+import datetime as dt
+import functools
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+TABELAS = """
+CREATE TABLE IF NOT EXISTS lojaintegrada.plataforma_tb_conta (
+	conta_id INTEGER PRIMARY KEY,
+	conta_loja_dominio TEXT,
+	conta_loja_nome TEXT,
+	conta_loja_descricao TEXT
+);
+CREATE INDEX IF NOT EXISTS lojaintegrada.idx_conta_dominio ON plataforma_tb_conta (conta_loja_dominio);
+CREATE TABLE IF NOT EXISTS lojaintegrada.plataforma_tb_atividade (
+	atividade_id INTEGER PRIMARY KEY,
+	atividade_nome TEXT
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.plataforma_tb_conta_atividade (
+	conta_id INTEGER,
+	atividade_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.cliente_tb_cliente (
+	cliente_id INTEGER PRIMARY KEY,
+	cliente_nome TEXT,
+	cliente_data_nascimento DATE,
+	cliente_sexo TEXT
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.configuracao_tb_pagamento (
+	pagamento_id INTEGER PRIMARY KEY,
+	pagamento_nome TEXT
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.pedido_tb_pedido_venda (
+	pedido_venda_id INTEGER PRIMARY KEY,
+	conta_id INTEGER,
+	cliente_id INTEGER,
+	pedido_venda_data_criacao TEXT,
+	pedido_venda_valor_desconto REAL,
+	pedido_venda_valor_subtotal REAL,
+	pedido_venda_utm_campaign TEXT,
+	pedido_venda_endereco_entrega_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS lojaintegrada.idx_pedido_conta_data ON pedido_tb_pedido_venda (conta_id, pedido_venda_data_criacao);
+CREATE TABLE IF NOT EXISTS lojaintegrada.pedido_tb_pedido_venda_item (
+	pedido_venda_item_id INTEGER PRIMARY KEY,
+	pedido_venda_id INTEGER,
+	pedido_venda_item_nome TEXT
+);
+CREATE INDEX IF NOT EXISTS lojaintegrada.idx_item_pedido ON pedido_tb_pedido_venda_item (pedido_venda_id);
+CREATE TABLE IF NOT EXISTS lojaintegrada.pedido_tb_pedido_venda_endereco (
+	pedido_venda_endereco_id INTEGER PRIMARY KEY,
+	pedido_venda_endereco_cidade TEXT,
+	pedido_venda_endereco_estado TEXT
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.pedido_tb_pedido_venda_pagamento (
+	pedido_venda_id INTEGER PRIMARY KEY,
+	pagamento_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.catalogo_tb_produto (
+	produto_id INTEGER PRIMARY KEY,
+	conta_id INTEGER,
+	produto_nome TEXT,
+	produto_tipo TEXT,
+	produto_ativo BOOLEAN
+);
+CREATE INDEX IF NOT EXISTS lojaintegrada.idx_produto_conta ON catalogo_tb_produto (conta_id);
+CREATE TABLE IF NOT EXISTS lojaintegrada.catalogo_tb_produto_preco (
+	produto_id INTEGER PRIMARY KEY,
+	produto_preco_cheio REAL,
+	produto_preco_promocional REAL
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.marketing_tb_seo (
+	seo_linha_id INTEGER PRIMARY KEY,
+	seo_title TEXT,
+	seo_description TEXT
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.catalogo_tb_categoria (
+	categoria_id INTEGER PRIMARY KEY,
+	categoria_nome TEXT
+);
+CREATE TABLE IF NOT EXISTS lojaintegrada.catalogo_tb_produto_categoria (
+	produto_id INTEGER,
+	categoria_id INTEGER
+);
+"""
+
+ATIVIDADES = ["Moda e acessórios", "Casa e decoração", "Eletrônicos", "Beleza", "Esporte e lazer"]
+PAGAMENTOS = ["Pix", "Cartão de crédito", "Boleto", "PayPal", "Mercado Pago"]
+CATEGORIAS = ["Camisetas", "Calças", "Acessórios", "Calçados", "Promoções", "Lançamentos"]
+CAMPANHAS = [None, None, None, "black_friday", "instagram", "google_ads", "email", "tiktok"]
+CIDADES = [("São Paulo", "SP"), ("Rio de Janeiro", "RJ"), ("Belo Horizonte", "MG"), ("Curitiba", "PR"), ("Recife", "PE"), ("Porto Alegre", "RS")]
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Felipe", "Gabriela", "Henrique", "Isabela", "João", "Larissa", "Marcos"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira"]
+TIPOS_PRODUTO = ["Camiseta", "Calça", "Tênis", "Boné", "Mochila", "Jaqueta", "Vestido", "Relógio"]
+CORES = ["Preta", "Branca", "Azul", "Vermelha", "Verde"]
+
+
+# Tradução do dialeto: só o que as consultas de queries.py usam
+_DATE_SUB = re.compile(r"DATE_SUB\(\s*CURDATE\(\)\s*,\s*INTERVAL\s+(\d+)\s+DAY\s*\)", re.IGNORECASE)
+_SEPARATOR = re.compile(r"GROUP_CONCAT\((.+?)\s+SEPARATOR\s+('[^']*')\s*\)", re.IGNORECASE | re.DOTALL)
+
+
+@functools.lru_cache(maxsize=256)
+def traduzir_sql(sql: str) -> str:
+    sql = _DATE_SUB.sub(r"date('now', 'localtime', '-\1 days')", sql)
+    return _SEPARATOR.sub(r"GROUP_CONCAT(\1, \2)", sql)
+
+
+_FORMATOS_MYSQL = {"%Y": "%Y", "%m": "%m", "%d": "%d", "%H": "%H", "%i": "%M", "%s": "%S", "%W": "%A"}
+
+
+@functools.lru_cache(maxsize=16)
+def _formato_python(formato: str) -> str:
+    return re.sub(r"%[a-zA-Z]", lambda m: _FORMATOS_MYSQL.get(m.group(0), m.group(0)), formato)
+
+
+@functools.lru_cache(maxsize=65536)
+def _data_hora(valor: str) -> dt.datetime:
+    return dt.datetime.fromisoformat(valor)
+
+
+def _date_format(valor, formato):
+    if valor is None:
+        return None
+    return _data_hora(valor).strftime(_formato_python(formato))
+
+
+def _substring_index(texto, delimitador, contagem):
+    if texto is None:
+        return None
+    partes = texto.split(delimitador)
+    if contagem >= 0:
+        return delimitador.join(partes[:contagem])
+    return delimitador.join(partes[contagem:])
+
+
+def _hour(valor):
+    return None if valor is None else _data_hora(valor).hour
+
+
+sqlite3.register_converter("DATE", lambda valor: dt.date.fromisoformat(valor.decode()))
+
+
+class CursorSQLite:
+    """
+    Cursor com a interface usada pelo db.py (execute/fetchone/fetchall/fetchmany/description).
+
+    O resultado é lido por completo no execute para que o description traga o tipo Python
+    de cada coluna, como o pyodbc faz (o sqlite3 não informa tipos).
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._cursor = conn.cursor()
+        self._linhas = []
+        self._pos = 0
+        self.description = None
+
+    def execute(self, sql: str, params=()):
+        self._cursor.execute(traduzir_sql(sql), tuple(params))
+        self._linhas = self._cursor.fetchall()
+        self._pos = 0
+        self.description = None
+        if self._cursor.description:
+            tipos = []
+            for i, coluna in enumerate(self._cursor.description):
+                tipo = next((type(linha[i]) for linha in self._linhas if linha[i] is not None), str)
+                tipos.append((coluna[0], tipo, None, None, None, None, True))
+            self.description = tipos
+        return self
+
+    def fetchone(self):
+        if self._pos >= len(self._linhas):
+            return None
+        self._pos += 1
+        return self._linhas[self._pos - 1]
+
+    def fetchmany(self, tamanho: int = 1):
+        linhas = self._linhas[self._pos:self._pos + tamanho]
+        self._pos += len(linhas)
+        return linhas
+
+    def fetchall(self):
+        linhas = self._linhas[self._pos:]
+        self._pos = len(self._linhas)
+        return linhas
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoSQLite:
+    """Conexão com a mesma interface mínima de uma conexão pyodbc usada pelo pool do db.py."""
+
+    def __init__(self, caminho: str):
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("ATTACH DATABASE ? AS lojaintegrada", (caminho,))
+        self._conn.create_function("DATE_FORMAT", 2, _date_format, deterministic=True)
+        self._conn.create_function("SUBSTRING_INDEX", 3, _substring_index, deterministic=True)
+        self._conn.create_function("HOUR", 1, _hour, deterministic=True)
+        self.timeout = 0
+
+    def cursor(self) -> CursorSQLite:
+        return CursorSQLite(self._conn)
+
+    def close(self):
+        self._conn.close()
+
+
+def conectar(caminho: str) -> ConexaoSQLite:
+    return ConexaoSQLite(caminho)
+
+
+def dominio_loja(pedidos: int) -> str:
+    return f"loja-{pedidos}.com.br"
+
+
+def _proximo_id(conn, tabela: str, coluna: str) -> int:
+    return (conn.execute(f"SELECT MAX({coluna}) FROM lojaintegrada.{tabela}").fetchone()[0] or 0) + 1
+
+
+def gerar_loja(conn: sqlite3.Connection, pedidos: int, seed: int | None = None, lote: int = 100_000) -> int:
+    """Cria uma conta com `pedidos` pedidos (90% dentro da janela de 30 dias) e retorna o conta_id."""
+    rng = np.random.default_rng(seed if seed is not None else pedidos)
+    conta_id = _proximo_id(conn, "plataforma_tb_conta", "conta_id")
+    conn.execute(
+        "INSERT INTO lojaintegrada.plataforma_tb_conta VALUES (?, ?, ?, ?)",
+        (conta_id, dominio_loja(pedidos), f"Loja {pedidos}", f"Loja de teste com {pedidos} pedidos."),
+    )
+    atividade_id = int(rng.integers(1, len(ATIVIDADES) + 1))
+    conn.execute("INSERT INTO lojaintegrada.plataforma_tb_conta_atividade VALUES (?, ?)", (conta_id, atividade_id))
+
+    # Catálogo da loja
+    n_produtos = int(min(2000, max(20, pedidos // 50)))
+    produto_inicial = _proximo_id(conn, "catalogo_tb_produto", "produto_id")
+    nomes_produtos = [
+        f"{TIPOS_PRODUTO[i % len(TIPOS_PRODUTO)]} {CORES[i % len(CORES)]} Modelo {i}" for i in range(n_produtos)
+    ]
+    produtos = [
+        (produto_inicial + i, conta_id, nome, "normal", True) for i, nome in enumerate(nomes_produtos)
+    ]
+    conn.executemany("INSERT INTO lojaintegrada.catalogo_tb_produto VALUES (?, ?, ?, ?, ?)", produtos)
+    precos = rng.gamma(2.0, 60.0, size=n_produtos).round(2)
+    conn.executemany(
+        "INSERT INTO lojaintegrada.catalogo_tb_produto_preco VALUES (?, ?, ?)",
+        [(produto_inicial + i, float(p), float(round(p * 0.9, 2))) for i, p in enumerate(precos)],
+    )
+    conn.executemany(
+        "INSERT INTO lojaintegrada.marketing_tb_seo VALUES (?, ?, ?)",
+        [(produto_inicial + i, f"{nome} | Loja {pedidos}", f"Compre {nome} com frete grátis.") for i, nome in enumerate(nomes_produtos)],
+    )
+    conn.executemany(
+        "INSERT INTO lojaintegrada.catalogo_tb_produto_categoria VALUES (?, ?)",
+        [(produto_inicial + i, i % len(CATEGORIAS) + 1) for i in range(n_produtos)],
+    )
+
+    # Clientes
+    n_clientes = int(max(10, pedidos // 5))
+    cliente_inicial = _proximo_id(conn, "cliente_tb_cliente", "cliente_id")
+    nascimentos = dt.date(1960, 1, 1).toordinal() + rng.integers(0, 45 * 365, size=n_clientes)
+    sexos = np.array(["M", "F", None], dtype=object)[rng.integers(0, 3, size=n_clientes)]
+    conn.executemany(
+        "INSERT INTO lojaintegrada.cliente_tb_cliente VALUES (?, ?, ?, ?)",
+        (
+            (
+                cliente_inicial + i,
+                f"{NOMES[i % len(NOMES)]} {SOBRENOMES[(i // len(NOMES)) % len(SOBRENOMES)]}",
+                dt.date.fromordinal(int(nascimentos[i])).isoformat(),
+                sexos[i],
+            )
+            for i in range(n_clientes)
+        ),
+    )
+
+    # Pedidos, itens, endereços e pagamentos, em lotes
+    pedido_inicial = _proximo_id(conn, "pedido_tb_pedido_venda", "pedido_venda_id")
+    item_inicial = _proximo_id(conn, "pedido_tb_pedido_venda_item", "pedido_venda_item_id")
+    agora = dt.datetime.now().replace(microsecond=0)
+    for inicio in range(0, pedidos, lote):
+        n = min(lote, pedidos - inicio)
+        ids = pedido_inicial + inicio + np.arange(n)
+        # Ids crescentes com o tempo; ~10% dos pedidos ficam fora da janela de 30 dias
+        segundos_atras = np.sort(rng.integers(0, 33 * 86400, size=n))[::-1]
+        datas = [(agora - dt.timedelta(seconds=int(s))).isoformat(sep=" ") for s in segundos_atras]
+        clientes = cliente_inicial + rng.integers(0, n_clientes, size=n)
+        subtotais = rng.gamma(2.0, 80.0, size=n).round(2)
+        descontos = np.where(rng.random(n) < 0.2, (subtotais * 0.1).round(2), 0.0)
+        campanhas = np.array(CAMPANHAS, dtype=object)[rng.integers(0, len(CAMPANHAS), size=n)]
+        conn.executemany(
+            "INSERT INTO lojaintegrada.pedido_tb_pedido_venda VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                ids.tolist(), [conta_id] * n, clientes.tolist(), datas,
+                descontos.tolist(), subtotais.tolist(), campanhas.tolist(), ids.tolist(),
+            ),
+        )
+        cidades = rng.integers(0, len(CIDADES), size=n)
+        conn.executemany(
+            "INSERT INTO lojaintegrada.pedido_tb_pedido_venda_endereco VALUES (?, ?, ?)",
+            ((int(i), *CIDADES[c]) for i, c in zip(ids, cidades)),
+        )
+        conn.executemany(
+            "INSERT INTO lojaintegrada.pedido_tb_pedido_venda_pagamento VALUES (?, ?)",
+            zip(ids.tolist(), (rng.integers(1, len(PAGAMENTOS) + 1, size=n)).tolist()),
+        )
+        itens_por_pedido = rng.integers(1, 4, size=n)
+        pedidos_itens = np.repeat(ids, itens_por_pedido)
+        # Distribuição enviesada: poucos produtos concentram as vendas
+        produtos_itens = np.minimum(rng.zipf(1.3, size=len(pedidos_itens)) - 1, n_produtos - 1)
+        conn.executemany(
+            "INSERT INTO lojaintegrada.pedido_tb_pedido_venda_item VALUES (?, ?, ?)",
+            zip(
+                (item_inicial + np.arange(len(pedidos_itens))).tolist(),
+                pedidos_itens.tolist(),
+                [nomes_produtos[p] for p in produtos_itens],
+            ),
+        )
+        item_inicial += len(pedidos_itens)
+    conn.commit()
+    return conta_id
+
+
+def criar_fixture(caminho: str, tamanhos: list[int], seed: int | None = None) -> dict[str, int]:
+    """Cria (ou completa) o arquivo com uma loja por tamanho; retorna {dominio: conta_id}."""
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ? AS lojaintegrada", (caminho,))
+    conn.execute("PRAGMA lojaintegrada.journal_mode=WAL")
+    conn.executescript(TABELAS)
+    if not conn.execute("SELECT COUNT(*) FROM lojaintegrada.configuracao_tb_pagamento").fetchone()[0]:
+        conn.executemany("INSERT INTO lojaintegrada.configuracao_tb_pagamento VALUES (?, ?)", enumerate(PAGAMENTOS, 1))
+        conn.executemany("INSERT INTO lojaintegrada.plataforma_tb_atividade VALUES (?, ?)", enumerate(ATIVIDADES, 1))
+        conn.executemany("INSERT INTO lojaintegrada.catalogo_tb_categoria VALUES (?, ?)", enumerate(CATEGORIAS, 1))
+
+    lojas = {}
+    for pedidos in tamanhos:
+        dominio = dominio_loja(pedidos)
+        existente = conn.execute(
+            "SELECT conta_id FROM lojaintegrada.plataforma_tb_conta WHERE conta_loja_dominio = ?", (dominio,)
+        ).fetchone()
+        lojas[dominio] = existente[0] if existente else gerar_loja(conn, pedidos, seed)
+    conn.execute("ANALYZE lojaintegrada")
+    conn.close()
+    return lojas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o banco SQLite de teste com lojas de vários tamanhos.")
+    parser.add_argument("--caminho", default=".cache/bench/lojaintegrada.sqlite")
+    parser.add_argument("--lojas", type=int, nargs="+", default=[100, 1_000, 10_000], help="pedidos de cada loja (100 a 1.000.000)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    lojas = criar_fixture(args.caminho, args.lojas, args.seed)
+    for dominio, conta_id in lojas.items():
+        print(f"{dominio:>28}  conta_id={conta_id}")
+    print(f"Fixture em {args.caminho} ({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
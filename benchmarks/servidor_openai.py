@@ -0,0 +1,181 @@
+# benchmarks/servidor_openai.py
+#
+# Servidor HTTP compatível com a API da OpenAI, com latência configurável, para rodar o
+# serviço e os testes de carga sem chamar a OpenAI. Atende:
+#
+#   POST /v1/chat/completions       (com e sem stream, inclusive response_format json_schema)
+#   POST /v1/audio/transcriptions
+#
+#   python benchmarks/servidor_openai.py --porta 8100 --latencia 0.5 --tokens-por-segundo 150
+#   OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=teste uvicorn main:app
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
+
+# Ajustáveis por linha de comando (ou variáveis de ambiente, quando importado)
+LATENCIA = float(os.getenv("STUB_LATENCIA", "0.5"))  # segundos até o primeiro token
+TOKENS_POR_SEGUNDO = float(os.getenv("STUB_TOKENS_POR_SEGUNDO", "150"))
+TRANSCRICAO_SEGUNDOS_POR_MB = float(os.getenv("STUB_TRANSCRICAO_SEGUNDOS_POR_MB", "1.0"))
+
+app = FastAPI()
+chamadas = {"chat": 0, "stream": 0, "transcricoes": 0}
+
+
+def _tokens(texto: str) -> int:
+    return max(1, len(texto) // 4)
+
+
+def _exemplo_schema(schema: dict, defs: dict):
+    # Gera um valor que satisfaz o JSON schema (o suficiente para os modelos pydantic do serviço)
+    if "$ref" in schema:
+        return _exemplo_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    if "anyOf" in schema:
+        return _exemplo_schema(schema["anyOf"][0], defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    tipo = schema.get("type")
+    if tipo == "object":
+        return {nome: _exemplo_schema(campo, defs) for nome, campo in schema.get("properties", {}).items()}
+    if tipo == "array":
+        return [_exemplo_schema(schema.get("items", {}), defs) for _ in range(3)]
+    if tipo == "integer":
+        return 30
+    if tipo == "number":
+        return 1.5
+    if tipo == "boolean":
+        return True
+    if tipo == "null":
+        return None
+    return "Texto de exemplo gerado pelo servidor de teste para medir o serviço."
+
+
+def _persona(i: int) -> dict:
+    return {
+        "nome": f"Persona {i}",
+        "foto": "https://exemplo.com/foto.png",
+        "idade": str(25 + 5 * i),
+        "estilo_de_vida": "Profissional urbana que compra pelo celular nos fins de semana.",
+        "comportamento_de_compra": "Compra em promoções e valoriza frete grátis.",
+        "produtos_mais_comprados": "Camisetas e acessórios.",
+        "canais_de_comunicacao": "Instagram e e-mail.",
+        "sugestoes": "Campanhas de remarketing com cupom no primeiro pedido.",
+    }
+
+
+def _conteudo(corpo: dict) -> str:
+    formato = corpo.get("response_format") or {}
+    if formato.get("type") == "json_schema":
+        schema = formato["json_schema"]["schema"]
+        return json.dumps(_exemplo_schema(schema, schema.get("$defs", {})), ensure_ascii=False)
+
+    prompt = corpo["messages"][-1]["content"]
+    if '"personas"' in prompt:
+        resposta = {"personas": [_persona(i) for i in range(1, 4)]}
+    elif '"insights"' in prompt:
+        resposta = {"insights": [f"Você sabia que {i * 10}% dos pedidos saem à noite?" for i in range(1, 7)]}
+    elif '"melhorias"' in prompt:
+        resposta = {"melhorias": [{"produto_nome": f"Produto {i}", "sugestao": "Inclua medidas no título."} for i in range(1, 6)]}
+    else:
+        resposta = {"resposta": "ok"}
+    return json.dumps(resposta, ensure_ascii=False)
+
+
+def _usage(corpo: dict, conteudo: str) -> dict:
+    prompt = sum(_tokens(m.get("content") or "") for m in corpo["messages"])
+    completion = _tokens(conteudo)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    corpo = await request.json()
+    conteudo = _conteudo(corpo)
+    usage = _usage(corpo, conteudo)
+    ident = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    criado = int(time.time())
+    modelo = corpo.get("model", "stub")
+
+    if not corpo.get("stream"):
+        chamadas["chat"] += 1
+        await asyncio.sleep(LATENCIA + usage["completion_tokens"] / TOKENS_POR_SEGUNDO)
+        return {
+            "id": ident,
+            "object": "chat.completion",
+            "created": criado,
+            "model": modelo,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": conteudo}}],
+            "usage": usage,
+        }
+
+    chamadas["stream"] += 1
+
+    def chunk(delta: dict, motivo=None, usage_chunk=None) -> str:
+        dados = {
+            "id": ident,
+            "object": "chat.completion.chunk",
+            "created": criado,
+            "model": modelo,
+            "choices": [] if usage_chunk else [{"index": 0, "delta": delta, "finish_reason": motivo}],
+        }
+        if usage_chunk:
+            dados["usage"] = usage_chunk
+        return f"data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+    async def eventos():
+        await asyncio.sleep(LATENCIA)
+        yield chunk({"role": "assistant", "content": ""})
+        passo = 16  # ~4 tokens por pedaço
+        for i in range(0, len(conteudo), passo):
+            pedaco = conteudo[i:i + passo]
+            await asyncio.sleep(_tokens(pedaco) / TOKENS_POR_SEGUNDO)
+            yield chunk({"content": pedaco})
+        yield chunk({}, "stop")
+        if (corpo.get("stream_options") or {}).get("include_usage"):
+            yield chunk({}, usage_chunk=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcricoes(file: UploadFile = File(...)):
+    chamadas["transcricoes"] += 1
+    tamanho = 0
+    while bloco := await file.read(1 << 20):
+        tamanho += len(bloco)
+    await asyncio.sleep(LATENCIA + TRANSCRICAO_SEGUNDOS_POR_MB * tamanho / (1 << 20))
+    return {"text": f"Transcrição de {file.filename} com {tamanho} bytes."}
+
+
+@app.get("/v1/estatisticas")
+def estatisticas():
+    return chamadas
+
+
+def main():
+    global LATENCIA, TOKENS_POR_SEGUNDO, TRANSCRICAO_SEGUNDOS_POR_MB
+    parser = argparse.ArgumentParser(description="Servidor compatível com a API da OpenAI para testes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8100)
+    parser.add_argument("--latencia", type=float, default=LATENCIA, help="segundos até o primeiro token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=TOKENS_POR_SEGUNDO)
+    parser.add_argument("--transcricao-segundos-por-mb", type=float, default=TRANSCRICAO_SEGUNDOS_POR_MB)
+    args = parser.parse_args()
+    LATENCIA = args.latencia
+    TOKENS_POR_SEGUNDO = args.tokens_por_segundo
+    TRANSCRICAO_SEGUNDOS_POR_MB = args.transcricao_segundos_por_mb
+    uvicorn.run(app, host=args.host, port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
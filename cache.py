@@ -0,0 +1,182 @@
+# cache.py
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metricas
+
+
+class CacheTTL:
+    """
+    Cache LRU com tempo de expiração por entrada, seguro para uso entre threads.
+
+    Quando `caminho` é informado, as entradas também são gravadas em um arquivo
+    SQLite, o que permite reaproveitá-las após um restart e entre workers do uvicorn.
+    """
+
+    def __init__(self, max_itens: int = 256, ttl: float = 300.0, caminho: str | None = None, namespace: str = "default"):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.caminho = caminho
+        self.namespace = namespace
+
+        self._itens = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.hits = 0
+        self.misses = 0
+        self.hits_disco = 0
+        self.expirados = 0
+        self.removidos_lru = 0
+        self._gravacoes = 0
+        # Remoções que falharam no disco: refeitas no próximo acesso a ele, antes de qualquer leitura
+        self._remocoes_pendentes: set[str] = set()
+        self._limpeza_pendente = False
+
+        if self.caminho:
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            with self._conexao() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    " namespace TEXT NOT NULL,"
+                    " chave TEXT NOT NULL,"
+                    " valor BLOB NOT NULL,"
+                    " expira_em REAL NOT NULL,"
+                    " PRIMARY KEY (namespace, chave))"
+                )
+
+    def _conexao(self) -> sqlite3.Connection:
+        # Uma conexão SQLite por thread; WAL permite leituras concorrentes entre processos
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remover_pendentes(self, conn: sqlite3.Connection):
+        with self._lock:
+            limpar, chaves = self._limpeza_pendente, list(self._remocoes_pendentes)
+        if limpar:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+        elif chaves:
+            conn.executemany("DELETE FROM cache WHERE namespace = ? AND chave = ?", [(self.namespace, c) for c in chaves])
+        with self._lock:
+            self._limpeza_pendente = self._limpeza_pendente and not limpar
+            self._remocoes_pendentes.difference_update(chaves)
+
+    def _guardar_memoria(self, chave: str, valor, expira_em: float):
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.removidos_lru += 1
+
+    def obter(self, chave: str, padrao=None):
+        agora = time.time()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                if item[0] > agora:
+                    self._itens.move_to_end(chave)
+                    self.hits += 1
+                    metricas.registrar_cache(self.namespace, True)
+                    return item[1]
+                del self._itens[chave]
+                self.expirados += 1
+
+        if self.caminho:
+            try:
+                with self._conexao() as conn:
+                    self._remover_pendentes(conn)
+                    linha = conn.execute(
+                        "SELECT valor, expira_em FROM cache WHERE namespace = ? AND chave = ?",
+                        (self.namespace, chave),
+                    ).fetchone()
+            except sqlite3.Error:
+                linha = None
+            if linha and linha[1] > agora:
+                try:
+                    valor = pickle.loads(linha[0])
+                except Exception:
+                    # Entrada corrompida ou de uma versão incompatível: conta como miss e sai do disco
+                    self.invalidar(chave)
+                else:
+                    self._guardar_memoria(chave, valor, linha[1])
+                    with self._lock:
+                        self.hits += 1
+                        self.hits_disco += 1
+                    metricas.registrar_cache(self.namespace, True)
+                    return valor
+
+        with self._lock:
+            self.misses += 1
+        metricas.registrar_cache(self.namespace, False)
+        return padrao
+
+    def guardar(self, chave: str, valor, ttl: float | None = None):
+        expira_em = time.time() + (self.ttl if ttl is None else ttl)
+        self._guardar_memoria(chave, valor, expira_em)
+        if self.caminho:
+            try:
+                with self._conexao() as conn:
+                    self._remover_pendentes(conn)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (namespace, chave, valor, expira_em) VALUES (?, ?, ?, ?)",
+                        (self.namespace, chave, pickle.dumps(valor), expira_em),
+                    )
+                    # De tempos em tempos remove do disco o que já expirou
+                    self._gravacoes += 1
+                    if self._gravacoes % 100 == 0:
+                        conn.execute("DELETE FROM cache WHERE expira_em < ?", (time.time(),))
+            except sqlite3.Error:
+                pass
+
+    def invalidar(self, chave: str):
+        with self._lock:
+            self._itens.pop(chave, None)
+        if self.caminho:
+            # Como em obter/guardar, um SQLite travado ou corrompido não derruba quem invalida;
+            # a remoção fica pendente para a entrada antiga não voltar do disco
+            try:
+                with self._conexao() as conn:
+                    conn.execute("DELETE FROM cache WHERE namespace = ? AND chave = ?", (self.namespace, chave))
+            except sqlite3.Error:
+                with self._lock:
+                    self._remocoes_pendentes.add(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+        if self.caminho:
+            try:
+                with self._conexao() as conn:
+                    conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            except sqlite3.Error:
+                with self._lock:
+                    self._limpeza_pendente = True
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "taxa_hit": round(self.hits / consultas, 4) if consultas else 0.0,
+                "expirados": self.expirados,
+                "removidos_lru": self.removidos_lru,
+                "persistente": bool(self.caminho),
+            }
@@ -0,0 +1,165 @@
+# catalogo.py
+
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+
+from db import fetch_table_async
+from queries import GET_CATALOGO_LOJA
+
+CATALOGO_DIR = os.getenv("CATALOGO_DIR", ".cache/catalogo")
+CATALOGO_SYNC_INTERVALO = float(os.getenv("CATALOGO_SYNC_INTERVALO", "300"))  # segundos entre buscas de produtos novos
+CATALOGO_ATUALIZACAO_COMPLETA = float(os.getenv("CATALOGO_ATUALIZACAO_COMPLETA", "21600"))  # preços, SEO, inativos
+CATALOGO_TOP_N = int(os.getenv("CATALOGO_TOP_N", "10"))
+
+# Mesmas colunas retornadas por GET_CATALOGO_LOJA
+SCHEMA_CATALOGO = pa.schema(
+    [
+        ("produto_id", pa.int64()),
+        ("produto_nome", pa.string()),
+        ("produto_preco_cheio", pa.float64()),
+        ("produto_preco_promocional", pa.float64()),
+        ("categorias", pa.string()),
+        ("seo_title", pa.string()),
+        ("seo_description", pa.string()),
+    ]
+)
+
+
+def normalizar_nome(nome) -> str:
+    return " ".join(str(nome).lower().split())
+
+
+class _Snapshot:
+    """Catálogo de uma conta em memória, com o índice nome do produto -> linha."""
+
+    def __init__(self, tabela: pa.Table):
+        metadata = tabela.schema.metadata or {}
+        self.completo_em = float(metadata.get(b"completo_em", b"0"))
+        self.tabela = tabela.replace_schema_metadata(None)
+        self.produtos = self.tabela.to_pandas()
+        self.indice = {normalizar_nome(nome): i for i, nome in enumerate(self.produtos["produto_nome"])}
+        self.marca_id = int(self.produtos["produto_id"].max()) if len(self.produtos) else 0
+
+
+class CatalogoProdutos:
+    """
+    Snapshot local do catálogo de cada conta, em Arrow IPC, mantido também em memória.
+
+    A cada CATALOGO_SYNC_INTERVALO busca só os produtos com produto_id maior que o último
+    sincronizado; a cada CATALOGO_ATUALIZACAO_COMPLETA recarrega tudo, o que traz alterações
+    de preço e SEO e remove os produtos desativados.
+    """
+
+    def __init__(self, diretorio: str = CATALOGO_DIR):
+        self.diretorio = diretorio
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        self._snapshots: dict[int, _Snapshot] = {}
+        self._ultima_sync: dict[int, float] = {}
+        self._locks_async: dict[int, asyncio.Lock] = {}
+
+        self.sincronizacoes_incrementais = 0
+        self.atualizacoes_completas = 0
+
+    def _caminho(self, conta_id: int) -> str:
+        return os.path.join(self.diretorio, f"{conta_id}.arrow")
+
+    def _ler(self, conta_id: int) -> _Snapshot | None:
+        caminho = self._caminho(conta_id)
+        if not os.path.exists(caminho):
+            return None
+        return _Snapshot(pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all())
+
+    def _gravar(self, conta_id: int, anterior: _Snapshot | None, delta: pa.Table, completo: bool) -> _Snapshot:
+        novos = delta.select(SCHEMA_CATALOGO.names).cast(SCHEMA_CATALOGO)
+        if anterior is not None and not completo:
+            tabela = anterior.tabela
+            if novos.num_rows:
+                repetidos = pc.is_in(tabela["produto_id"], value_set=novos["produto_id"])
+                tabela = tabela.filter(pc.invert(repetidos))
+            novos = pa.concat_tables([tabela, novos])
+        completo_em = time.time() if completo else anterior.completo_em
+        novos = novos.replace_schema_metadata({"completo_em": repr(completo_em)})
+
+        # Grava em um arquivo temporário e troca de forma atômica, como o armazém de pedidos
+        caminho = self._caminho(conta_id)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(temporario, "wb") as arquivo:
+            with pa.ipc.new_file(arquivo, novos.schema) as writer:
+                writer.write_table(novos)
+        os.replace(temporario, caminho)
+        return _Snapshot(novos)
+
+    async def sincronizar_async(self, conta_id: int, forcar: bool = False) -> _Snapshot:
+        async with self._locks_async.setdefault(conta_id, asyncio.Lock()):
+            snapshot = self._snapshots.get(conta_id)
+            if snapshot is None:
+                snapshot = await asyncio.to_thread(self._ler, conta_id)
+            recente = time.monotonic() - self._ultima_sync.get(conta_id, float("-inf")) <= CATALOGO_SYNC_INTERVALO
+            if snapshot is not None and recente and not forcar:
+                self._snapshots[conta_id] = snapshot
+                return snapshot
+
+            completo = forcar or snapshot is None or time.time() - snapshot.completo_em > CATALOGO_ATUALIZACAO_COMPLETA
+            marca = 0 if completo else snapshot.marca_id
+            delta = await fetch_table_async(GET_CATALOGO_LOJA, (conta_id, marca))
+            if completo or delta.num_rows:
+                snapshot = await asyncio.to_thread(self._gravar, conta_id, snapshot, delta, completo)
+            if completo:
+                self.atualizacoes_completas += 1
+            else:
+                self.sincronizacoes_incrementais += 1
+            self._snapshots[conta_id] = snapshot
+            self._ultima_sync[conta_id] = time.monotonic()
+            return snapshot
+
+    async def relevantes_async(self, conta_id: int, vendas: pd.Series | None = None, n: int = CATALOGO_TOP_N) -> list[dict]:
+        """
+        Os `n` produtos mais vendidos (vendas: nome -> quantidade, de analytics.contar_produtos_vendidos);
+        se não houver vendidos suficientes, completa com os cadastrados mais recentemente.
+        """
+        snapshot = await self.sincronizar_async(conta_id)
+        return selecionar_relevantes(snapshot, vendas, n)
+
+    def remover(self, conta_id: int):
+        self._snapshots.pop(conta_id, None)
+        self._ultima_sync.pop(conta_id, None)
+        try:
+            os.remove(self._caminho(conta_id))
+        except FileNotFoundError:
+            pass
+
+    def estatisticas(self) -> dict:
+        return {
+            "contas": len(self._snapshots),
+            "produtos": sum(len(s.produtos) for s in list(self._snapshots.values())),
+            "sincronizacoes_incrementais": self.sincronizacoes_incrementais,
+            "atualizacoes_completas": self.atualizacoes_completas,
+        }
+
+
+def selecionar_relevantes(snapshot: _Snapshot, vendas: pd.Series | None, n: int) -> list[dict]:
+    produtos = snapshot.produtos
+    if produtos.empty:
+        return []
+    contagens = np.zeros(len(produtos), dtype=np.int64)
+    if vendas is not None:
+        for nome, total in vendas.items():
+            linha = snapshot.indice.get(normalizar_nome(nome))
+            if linha is not None:
+                contagens[linha] += total
+    # Mais vendidos primeiro; entre os empatados, os mais recentes
+    ordem = np.lexsort((-produtos["produto_id"].to_numpy(), -contagens))[:n]
+    selecionados = produtos.iloc[ordem].assign(vendas=contagens[ordem])
+    return selecionados.to_dict(orient="records")
+
+
+catalogo = CatalogoProdutos() if os.getenv("CATALOGO_LOCAL", "1") == "1" else None
@@ -0,0 +1,100 @@
+# coalescencia.py
+
+import asyncio
+import threading
+import weakref
+
+import metricas
+
+
+class _Voo:
+    __slots__ = ("tarefa", "esperando")
+
+    def __init__(self, tarefa: asyncio.Task):
+        self.tarefa = tarefa
+        self.esperando = 0
+
+
+class Coalescedor:
+    """
+    Single-flight: chamadas concorrentes com a mesma chave compartilham uma única execução.
+
+    A primeira chamada (líder) cria a tarefa; as que chegam enquanto ela está em andamento
+    apenas aguardam o mesmo resultado (ou a mesma exceção). Cancelar quem espera não cancela
+    a tarefa dos outros; ela só é cancelada quando ninguém mais espera por ela. A chave sai
+    do registro assim que a tarefa termina, então erros não ficam memorizados.
+    """
+
+    def __init__(self, grupo: str):
+        self.grupo = grupo
+        # As tarefas pertencem a um event loop: um registro por loop
+        self._voos: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+        self.lideres = 0
+        self.coalescidas = 0
+        self.erros = 0
+        self.abandonadas = 0
+
+    def _contar(self, campo: str, resultado: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+        metricas.registro.incrementar("coalescencia_total", grupo=self.grupo, resultado=resultado)
+
+    def _concluir(self, voos: dict, chave, voo: _Voo, tarefa: asyncio.Task):
+        if voos.get(chave) is voo:
+            del voos[chave]
+        if tarefa.cancelled():
+            return
+        if tarefa.exception() is not None:
+            self._contar("erros", "erro")
+
+    async def executar(self, chave, fabrica):
+        """Executa `fabrica()` (uma função que devolve uma corrotina), ou se junta à execução em andamento."""
+        loop = asyncio.get_running_loop()
+        voos = self._voos.get(loop)
+        if voos is None:
+            voos = self._voos[loop] = {}
+
+        voo = voos.get(chave)
+        if voo is None:
+            # A tarefa herda o contexto do líder (métricas da requisição dele)
+            voo = voos[chave] = _Voo(loop.create_task(fabrica()))
+            voo.tarefa.add_done_callback(lambda tarefa: self._concluir(voos, chave, voo, tarefa))
+            self._contar("lideres", "lider")
+        else:
+            self._contar("coalescidas", "coalescida")
+
+        voo.esperando += 1
+        try:
+            return await asyncio.shield(voo.tarefa)
+        finally:
+            voo.esperando -= 1
+            if voo.esperando == 0 and not voo.tarefa.done():
+                # Todos que esperavam foram cancelados: a execução não tem mais para quem responder.
+                # A chave sai já, senão quem chegar antes do done-callback recebe o cancelamento.
+                if voos.get(chave) is voo:
+                    del voos[chave]
+                voo.tarefa.cancel()
+                self._contar("abandonadas", "abandonada")
+
+    def em_andamento(self) -> int:
+        return sum(len(voos) for voos in list(self._voos.values()))
+
+    def estatisticas(self) -> dict:
+        return {
+            "grupo": self.grupo,
+            "em_andamento": self.em_andamento(),
+            "lideres": self.lideres,
+            "coalescidas": self.coalescidas,
+            "erros": self.erros,
+            "abandonadas": self.abandonadas,
+        }
+
+
+contextos = Coalescedor("contexto")
+respostas_llm = Coalescedor("llm")
+
+
+def estatisticas() -> dict:
+    return {c.grupo: c.estatisticas() for c in (contextos, respostas_llm)}
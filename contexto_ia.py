@@ -1,84 +1,438 @@
 # contexto_ia.py
 
-from db import fetch_one, fetch_row, fetch_all
-from queries import (
-    GET_PEDIDOS_ULTIMOS_30_DIAS,
-    GET_CONTA_ID_POR_DOMINIO,
-    GET_DETALHES_CONTA_POR_DOMINIO,
+import asyncio
+import os
+import re
+
+import metricas
+from coalescencia import contextos as coalescedor_contextos
+from cache import CacheTTL
+from db import fetch_frame, fetch_frame_async
+from queries import GET_PEDIDOS_ULTIMOS_30_DIAS, GET_PEDIDOS_ULTIMOS_30_DIAS_POR_CONTAS, LOTE_CONTAS
+from resolvedor import Conta, normalizar_dominio, resolvedor
+from analytics import (
+    INSIGHTS_MODO,
+    combinar_insights_async,
+    contar_produtos_vendidos,
+    gerar_insights_para_persona,
+    obter_insights,
+    tentar_insights_agregados_async,
 )
-from analytics import gerar_insights_para_persona
+from pedidos_locais import ArmazemPedidos
+from plano import Plano
 import pandas as pd
 
+MSG_LOJA_NAO_ENCONTRADA = "Não foi possível encontrar a loja com esse domínio."
+MSG_SEM_PEDIDOS = "A loja não possui pedidos nos últimos 30 dias."
+
+# Cache dos contextos já montados, compartilhado pelos dois coletores
+CONTEXTO_CACHE_TTL = float(os.getenv("CONTEXTO_CACHE_TTL", "900"))
+CONTEXTO_CACHE_MAX = int(os.getenv("CONTEXTO_CACHE_MAX", "512"))
+CONTEXTO_CACHE_CAMINHO = os.getenv("CONTEXTO_CACHE_CAMINHO") or None
+
+contexto_cache = CacheTTL(
+    max_itens=CONTEXTO_CACHE_MAX,
+    ttl=CONTEXTO_CACHE_TTL,
+    caminho=CONTEXTO_CACHE_CAMINHO,
+    namespace="contexto",
+)
+
+# "vendas": vendas por produto calculadas junto com o contexto básico (usadas pelo /improve_products)
+_TIPOS_CONTEXTO = ("basico", "detalhado", "vendas")
+
+# Armazém local de pedidos: com ele, uma loja já sincronizada custa só a consulta de delta
+armazem_pedidos = ArmazemPedidos() if os.getenv("PEDIDOS_LOCAIS", "1") == "1" else None
+
+
+def _chave_contexto(tipo: str, dominio_loja: str) -> str:
+    return f"{tipo}:{normalizar_dominio(dominio_loja)}"
+
+
+def invalidar_contexto(dominio_loja: str):
+    for tipo in _TIPOS_CONTEXTO:
+        contexto_cache.invalidar(_chave_contexto(tipo, dominio_loja))
+
+
+def carregar_pedidos(conta_id: int) -> pd.DataFrame:
+    if armazem_pedidos is not None:
+        return armazem_pedidos.pedidos(conta_id)
+    return fetch_frame(GET_PEDIDOS_ULTIMOS_30_DIAS, (conta_id,))
+
+
+async def carregar_pedidos_async(conta_id: int) -> pd.DataFrame:
+    if armazem_pedidos is not None:
+        return await armazem_pedidos.pedidos_async(conta_id)
+    return await fetch_frame_async(GET_PEDIDOS_ULTIMOS_30_DIAS, (conta_id,))
+
+
+# Orçamento de tokens do contexto da loja: o prompt não cresce com o tamanho da loja
+CONTEXTO_ORCAMENTO_TOKENS = int(os.getenv("CONTEXTO_ORCAMENTO_TOKENS", "800"))
+CONTEXTO_AMOSTRA = int(os.getenv("CONTEXTO_AMOSTRA", "5"))
+
+# Colunas da amostra que vão para o prompt, com nomes curtos, da mais para a menos útil.
+# Ids, nome do cliente e data completa ficam de fora; ao estourar o orçamento, as últimas saem primeiro.
+_COLUNAS_AMOSTRA = [
+    ("produtos", "produtos"),
+    ("pedido_venda_valor_subtotal", "valor"),
+    ("cliente_sexo", "sexo"),
+    ("cliente_data_nascimento", "idade"),
+    ("dia_semana_pedido", "dia"),
+    ("hora_pedido", "hora"),
+    ("pedido_venda_endereco_estado", "uf"),
+    ("pedido_venda_utm_campaign", "campanha"),
+    ("pagamento_nome", "pagamento"),
+    ("pedido_venda_endereco_cidade", "cidade"),
+    ("pedido_venda_valor_desconto", "desconto"),
+]
+_COLUNAS_MINIMAS = 3
+_MAX_PRODUTOS_POR_PEDIDO = 3
+_MAX_CARACTERES_PRODUTO = 40
+_MAX_CARACTERES_DESTAQUE = 80
+_MAX_CARACTERES_DESCRICAO = 300
+
+_PALAVRAS = re.compile(r"\w+")
+_PONTUACAO = re.compile(r"[^\w\s]")
+
+
+def estimar_tokens(texto: str) -> int:
+    # Estimativa local, sem tokenizador: ~4 caracteres por token em cada palavra e
+    # um token por sinal de pontuação; erra para cima em português, o que é seguro aqui
+    return sum((len(p) + 3) // 4 for p in _PALAVRAS.findall(texto)) + len(_PONTUACAO.findall(texto))
+
+
+def estimar_tokens_mensagens(mensagens: list[dict]) -> int:
+    return sum(estimar_tokens(m["content"]) + 4 for m in mensagens)
+
 
-def formatar_amostra_para_prompt(amostra):
-    linhas = []
+def _abreviar(texto, limite: int) -> str:
+    texto = " ".join(str(texto).split())
+    return texto if len(texto) <= limite else texto[:limite - 1].rstrip() + "…"
+
+
+def _idade(nascimento) -> str:
+    # Datas vazias, inválidas ou fora do intervalo do pandas (ex.: "0000-00-00") viram NaT e ficam sem idade
+    nascimento = pd.to_datetime(nascimento, errors="coerce")
+    if pd.isna(nascimento):
+        return "-"
+    hoje = pd.Timestamp.today()
+    idade = hoje.year - nascimento.year - ((hoje.month, hoje.day) < (nascimento.month, nascimento.day))
+    return str(idade) if idade >= 0 else "-"
+
+
+def _resumir_produtos(produtos, destaques: dict[str, str]) -> str:
+    # Remove itens repetidos no pedido e troca os mais vendidos pela referência (#1, #2...)
+    if produtos is None or pd.isna(produtos):
+        return "-"
+    itens = list(dict.fromkeys(p.strip() for p in str(produtos).split(" | ") if p.strip()))
+    partes = [destaques.get(p) or _abreviar(p, _MAX_CARACTERES_PRODUTO) for p in itens[:_MAX_PRODUTOS_POR_PEDIDO]]
+    if len(itens) > _MAX_PRODUTOS_POR_PEDIDO:
+        partes.append(f"+{len(itens) - _MAX_PRODUTOS_POR_PEDIDO}")
+    return "; ".join(partes)
+
+
+def _celula(coluna: str, valor, destaques: dict[str, str]) -> str:
+    if coluna == "produtos":
+        return _resumir_produtos(valor, destaques)
+    if coluna == "cliente_data_nascimento":
+        return _idade(valor)
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return "-"
+    if coluna == "hora_pedido":
+        return f"{str(valor)[:2]}h"
+    if coluna == "dia_semana_pedido":
+        return str(valor)[:3]
+    if isinstance(valor, float):
+        return f"{valor:.2f}"
+    return _abreviar(valor, _MAX_CARACTERES_PRODUTO)
+
+
+def formatar_amostra_para_prompt(amostra, colunas=None, destaques: dict[str, str] | None = None):
+    """Tabela compacta: cabeçalho com os nomes curtos uma única vez e uma linha por pedido."""
+    if not amostra:
+        return ""
+    colunas = [(c, nome) for c, nome in (colunas or _COLUNAS_AMOSTRA) if c in amostra[0]]
+    destaques = destaques or {}
+    linhas = ["|".join(nome for _, nome in colunas)]
     for pedido in amostra:
-        campos = [f"{chave}: {valor}" for chave, valor in pedido.items()]
-        linha = "- " + ", ".join(campos)
-        linhas.append(linha)
+        linhas.append("|".join(_celula(c, pedido[c], destaques) for c, _ in colunas))
     return "\n".join(linhas)
 
 
-def coletar_contexto_para_ia(dominio_loja: str) -> str:
-    query_conta = GET_CONTA_ID_POR_DOMINIO.format(dominio=dominio_loja)
-    conta_id = fetch_one(query_conta)
-    if not conta_id:
-        return "Não foi possível encontrar a loja com esse domínio."
+# Colunas dos produtos enviados ao /improve_products (catálogo ou GET_PRODUTOS_LOJA), com nomes curtos e limite de caracteres
+_COLUNAS_PRODUTOS = [
+    ("produto_nome", "produto", 80),
+    ("produto_preco_cheio", "preco", None),
+    ("produto_preco_promocional", "promocional", None),
+    ("categorias", "categorias", 60),
+    ("categoria_nome", "categoria", 60),
+    ("vendas", "vendas_30d", None),
+    ("seo_title", "seo_title", 70),
+    ("seo_description", "seo_description", 160),
+]
 
-    query = GET_PEDIDOS_ULTIMOS_30_DIAS.format(conta_id=conta_id)
-    resultados = fetch_all(query)
-    if not resultados:
-        return "A loja não possui pedidos nos últimos 30 dias."
 
-    df = pd.DataFrame(resultados)
-    insights = gerar_insights_para_persona(df)
-    amostra = df.sample(n=min(5, len(df)), random_state=42).to_dict(orient="records")
+def formatar_produtos_para_prompt(produtos: list[dict]) -> str:
+    """Tabela compacta dos produtos, no mesmo formato da amostra de pedidos."""
+    if not produtos:
+        return ""
+    colunas = [(c, nome, limite) for c, nome, limite in _COLUNAS_PRODUTOS if c in produtos[0]]
+    linhas = ["|".join(nome for _, nome, _ in colunas)]
+    for produto in produtos:
+        celulas = []
+        for coluna, _, limite in colunas:
+            valor = produto[coluna]
+            if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+                celulas.append("-")
+            elif isinstance(valor, float):
+                celulas.append(f"{valor:.2f}")
+            else:
+                # "|" separa as colunas: não pode aparecer dentro de um valor
+                texto = _abreviar(valor, limite) if limite else str(valor)
+                celulas.append(texto.replace("|", "/"))
+        linhas.append("|".join(celulas))
+    return "\n".join(linhas)
+
 
-    # Enviar os dados brutos e sumarizados para a IA inferir o resto
+def _estatisticas_para_prompt(insights: dict) -> str:
+    produtos = [f"#{i} {_abreviar(p[0], _MAX_CARACTERES_DESTAQUE)}" for i, p in enumerate(insights["produtos_mais_vendidos"], 1)]
     return (
         f"Estatísticas da loja:\n"
         f"- Ticket médio: R$ {insights['ticket_medio_produtos']}\n"
-        f"- Produtos mais vendidos: {[p[0] for p in insights['produtos_mais_vendidos']]}\n"
+        f"- Produtos mais vendidos: {', '.join(produtos)}\n"
         f"- Top 3 clientes: {list(insights['top_clientes'].items())}\n"
         f"- Distribuição por gênero: {insights['pedidos_por_genero']}\n"
         f"- Campanhas mais ativas: {list(insights['campanhas_mais_ativas'].keys())}\n"
         f"- Dias com mais pedidos: {list(insights['dias_com_mais_pedidos'].keys())}\n"
         f"- Horas com mais pedidos: {list(insights['horas_com_mais_vendas'].keys())}\n"
-        f"\nExemplos reais de pedidos:\n{formatar_amostra_para_prompt(amostra)}"
     )
 
 
+@metricas.medir("prompt", "contexto")
+def montar_contexto_com_tokens(
+    df: pd.DataFrame,
+    cabecalho: str = "",
+    insights: dict | None = None,
+    orcamento: int = CONTEXTO_ORCAMENTO_TOKENS,
+) -> tuple[str, int]:
+    """
+    Monta o contexto da loja dentro de `orcamento` tokens (estimados) e retorna (texto, tokens).
+
+    Cabeçalho e estatísticas sempre entram; a amostra de pedidos perde primeiro as colunas
+    menos úteis e depois linhas até caber.
+    """
+    if insights is None:
+        insights = gerar_insights_para_persona(df)
+    destaques = {p[0]: f"#{i}" for i, p in enumerate(insights["produtos_mais_vendidos"], 1)}
+    amostra = df.sample(n=min(CONTEXTO_AMOSTRA, len(df)), random_state=42).to_dict(orient="records")
+
+    # Enviar os dados sumarizados e uma amostra dos brutos para a IA inferir o resto
+    base = f"{cabecalho}{_estatisticas_para_prompt(insights)}"
+    tokens_base = estimar_tokens(base)
+
+    colunas = [(c, nome) for c, nome in _COLUNAS_AMOSTRA if c in df.columns]
+    while True:
+        tabela = formatar_amostra_para_prompt(amostra, colunas, destaques)
+        contexto = f"{base}\nExemplos reais de pedidos:\n{tabela}" if tabela else base
+        tokens = tokens_base + estimar_tokens(contexto[len(base):])
+        if tokens <= orcamento or not amostra:
+            return contexto, tokens
+        if len(colunas) > _COLUNAS_MINIMAS:
+            colunas = colunas[:-1]
+        else:
+            amostra = amostra[:-1]
+
+
+def montar_contexto(df: pd.DataFrame, cabecalho: str = "", insights: dict | None = None) -> str:
+    return montar_contexto_com_tokens(df, cabecalho, insights)[0]
+
+
+def _cabecalho_conta(conta: Conta) -> str:
+    descricao = _abreviar(conta.descricao, _MAX_CARACTERES_DESCRICAO) if conta.descricao else conta.descricao
+    return (
+        f"Loja: {conta.loja_nome}\n"
+        f"Descrição: {descricao}\n"
+        f"Atividade: {conta.atividade}\n"
+    )
+
+
+def coletar_contexto_para_ia(dominio_loja: str) -> str:
+    chave = _chave_contexto("basico", dominio_loja)
+    contexto = contexto_cache.obter(chave)
+    if contexto is not None:
+        return contexto
+
+    conta = resolvedor.resolver(dominio_loja)
+    if not conta:
+        return MSG_LOJA_NAO_ENCONTRADA
+
+    df = carregar_pedidos(conta.conta_id)
+    if df.empty:
+        return MSG_SEM_PEDIDOS
+
+    contexto = montar_contexto(df, insights=obter_insights(conta.conta_id, df))
+    contexto_cache.guardar(chave, contexto)
+    return contexto
+
+
 def novo_coletar_contexto_para_ia(dominio_loja: str) -> str:
-    query_conta = GET_DETALHES_CONTA_POR_DOMINIO.format(dominio=dominio_loja)
-    conta = fetch_row(query_conta)
+    chave = _chave_contexto("detalhado", dominio_loja)
+    contexto = contexto_cache.obter(chave)
+    if contexto is not None:
+        return contexto
+
+    conta = resolvedor.resolver(dominio_loja)
     if not conta:
-        return "Não foi possível encontrar a loja com esse domínio."
-    conta_id = conta[0]
-    conta_nome = conta[1]
-    conta_descricao = conta[2]
-    conta_atividade = conta[3]
-
-    query = GET_PEDIDOS_ULTIMOS_30_DIAS.format(conta_id=conta_id)
-    resultados = fetch_all(query)
-    if not resultados:
-        return "A loja não possui pedidos nos últimos 30 dias."
-
-    df = pd.DataFrame(resultados)
-    insights = gerar_insights_para_persona(df)
-    amostra = df.sample(n=min(5, len(df)), random_state=42).to_dict(orient="records")
-
-    # Enviar os dados brutos e sumarizados para a IA inferir o resto
-    return (
-        f"Loja: {conta_nome}\n"
-        f"Descrição: {conta_descricao}\n"
-        f"Atividade: {conta_atividade}\n"
-        f"Estatísticas da loja:\n"
-        f"- Ticket médio: R$ {insights['ticket_medio_produtos']}\n"
-        f"- Produtos mais vendidos: {[p[0] for p in insights['produtos_mais_vendidos']]}\n"
-        f"- Top 3 clientes: {list(insights['top_clientes'].items())}\n"
-        f"- Distribuição por gênero: {insights['pedidos_por_genero']}\n"
-        f"- Campanhas mais ativas: {list(insights['campanhas_mais_ativas'].keys())}\n"
-        f"- Dias com mais pedidos: {list(insights['dias_com_mais_pedidos'].keys())}\n"
-        f"- Horas com mais pedidos: {list(insights['horas_com_mais_vendas'].keys())}\n"
-        f"\nExemplos reais de pedidos:\n{formatar_amostra_para_prompt(amostra)}"
+        return MSG_LOJA_NAO_ENCONTRADA
+
+    df = carregar_pedidos(conta.conta_id)
+    if df.empty:
+        return MSG_SEM_PEDIDOS
+
+    contexto = montar_contexto(df, _cabecalho_conta(conta), obter_insights(conta.conta_id, df))
+    contexto_cache.guardar(chave, contexto)
+    return contexto
+
+
+# Variantes assíncronas: as consultas passam pela API async do db.py e o processamento
+# com pandas roda em uma thread, para que os endpoints nunca bloqueiem o event loop.
+# Com forcar=True o contexto é recalculado e substitui o do cache (pré-aquecimento).
+# Requisições simultâneas da mesma loja compartilham uma única coleta (coalescencia.py).
+async def coletar_contexto_para_ia_async(dominio_loja: str, forcar: bool = False) -> str:
+    chave = _chave_contexto("basico", dominio_loja)
+    contexto = None if forcar else contexto_cache.obter(chave)
+    if contexto is not None:
+        return contexto
+    return await coalescedor_contextos.executar((chave, forcar), lambda: _coletar_contexto_async(chave, dominio_loja))
+
+
+async def novo_coletar_contexto_para_ia_async(dominio_loja: str, forcar: bool = False) -> str:
+    chave = _chave_contexto("detalhado", dominio_loja)
+    contexto = None if forcar else contexto_cache.obter(chave)
+    if contexto is not None:
+        return contexto
+    return await coalescedor_contextos.executar((chave, forcar), lambda: _novo_coletar_contexto_async(chave, dominio_loja))
+
+
+async def coletar_contexto_e_vendas_async(dominio_loja: str) -> tuple[str, pd.Series | None]:
+    """
+    Contexto básico e as vendas por produto calculadas na mesma coleta, sem reler os pedidos.
+    As vendas são None quando a loja não existe ou está sem pedidos; se o contexto estiver no
+    cache sem as vendas (ex.: entrada gravada antes delas), a coleta é refeita.
+    """
+    contexto = await coletar_contexto_para_ia_async(dominio_loja)
+    if contexto in (MSG_LOJA_NAO_ENCONTRADA, MSG_SEM_PEDIDOS):
+        return contexto, None
+    chave_vendas = _chave_contexto("vendas", dominio_loja)
+    vendas = contexto_cache.obter(chave_vendas)
+    if vendas is None:
+        contexto = await coletar_contexto_para_ia_async(dominio_loja, forcar=True)
+        vendas = contexto_cache.obter(chave_vendas)
+    return contexto, vendas
+
+
+def plano_contexto(dominio_loja: str, detalhado: bool) -> Plano:
+    """
+    conta -> (pedidos | estatísticas agregadas) -> insights -> contexto.
+    No contexto básico, as vendas por produto também são contadas a partir dos mesmos pedidos.
+
+    As consultas de pedidos e as agregadas só dependem do conta_id e rodam juntas.
+    As etapas "conta" e "pedidos" resultam em None quando a loja não existe ou está sem pedidos.
+    """
+
+    async def pedidos(conta):
+        df = await carregar_pedidos_async(conta.conta_id)
+        return None if df.empty else df
+
+    async def insights(conta, pedidos, agregados=None):
+        return await combinar_insights_async(conta.conta_id, pedidos, agregados)
+
+    async def contexto(conta, pedidos, insights):
+        cabecalho = _cabecalho_conta(conta) if detalhado else ""
+        return await asyncio.to_thread(montar_contexto, pedidos, cabecalho, insights)
+
+    plano = Plano("contexto_detalhado" if detalhado else "contexto")
+    plano.etapa("conta", lambda: resolvedor.resolver_async(dominio_loja))
+    plano.etapa("pedidos", pedidos, depende=("conta",))
+    if INSIGHTS_MODO != "pandas":
+        plano.etapa("agregados", lambda conta: tentar_insights_agregados_async(conta.conta_id), depende=("conta",))
+        plano.etapa("insights", insights, depende=("conta", "pedidos"), opcionais=("agregados",))
+    else:
+        plano.etapa("insights", insights, depende=("conta", "pedidos"))
+    plano.etapa("contexto", contexto, depende=("conta", "pedidos", "insights"))
+    if not detalhado:
+        plano.etapa("vendas", lambda pedidos: asyncio.to_thread(contar_produtos_vendidos, pedidos), depende=("pedidos",))
+    return plano
+
+
+async def _executar_plano_contexto(chave: str, dominio_loja: str, detalhado: bool) -> str:
+    resultados = await plano_contexto(dominio_loja, detalhado).executar()
+    if resultados["conta"] is None:
+        return MSG_LOJA_NAO_ENCONTRADA
+    if resultados["pedidos"] is None:
+        return MSG_SEM_PEDIDOS
+    if "vendas" in resultados:
+        contexto_cache.guardar(_chave_contexto("vendas", dominio_loja), resultados["vendas"])
+    contexto_cache.guardar(chave, resultados["contexto"])
+    return resultados["contexto"]
+
+
+async def _coletar_contexto_async(chave: str, dominio_loja: str) -> str:
+    return await _executar_plano_contexto(chave, dominio_loja, detalhado=False)
+
+
+async def _novo_coletar_contexto_async(chave: str, dominio_loja: str) -> str:
+    return await _executar_plano_contexto(chave, dominio_loja, detalhado=True)
+
+
+# Coleta em lote (/insights/batch): uma consulta de contas e uma de pedidos por lote de
+# LOTE_CONTAS contas, com as estatísticas calculadas sobre os pedidos já lidos.
+async def carregar_pedidos_varias_contas_async(contas_ids: list[int]) -> dict[int, pd.DataFrame]:
+    lotes = [contas_ids[i:i + LOTE_CONTAS] for i in range(0, len(contas_ids), LOTE_CONTAS)]
+    frames = await asyncio.gather(
+        *(
+            fetch_frame_async(GET_PEDIDOS_ULTIMOS_30_DIAS_POR_CONTAS, tuple(lote + [lote[-1]] * (LOTE_CONTAS - len(lote))))
+            for lote in lotes
+        )
     )
+    pedidos = {}
+    for frame in frames:
+        for conta_id, df in frame.groupby("conta_id", sort=False):
+            pedidos[int(conta_id)] = df.drop(columns="conta_id").reset_index(drop=True)
+    return pedidos
+
+
+def _montar_contextos(pedidos: dict[int, pd.DataFrame]) -> dict[int, str]:
+    return {conta_id: montar_contexto(df) for conta_id, df in pedidos.items()}
+
+
+async def coletar_contextos_para_ia_async(dominios_loja: list[str]) -> dict[str, str]:
+    """Contexto básico (o mesmo de coletar_contexto_para_ia) de várias lojas de uma vez."""
+    contextos = {}
+    pendentes = []
+    for dominio_loja in dict.fromkeys(dominios_loja):
+        contexto = contexto_cache.obter(_chave_contexto("basico", dominio_loja))
+        if contexto is not None:
+            contextos[dominio_loja] = contexto
+        else:
+            pendentes.append(dominio_loja)
+    if not pendentes:
+        return contextos
+
+    contas = await resolvedor.resolver_varios_async(pendentes)
+    contas_ids = list(dict.fromkeys(conta.conta_id for conta in contas.values() if conta))
+    pedidos = await carregar_pedidos_varias_contas_async(contas_ids) if contas_ids else {}
+    montados = await asyncio.to_thread(_montar_contextos, pedidos)
+
+    for dominio_loja in pendentes:
+        conta = contas.get(dominio_loja)
+        if not conta:
+            contextos[dominio_loja] = MSG_LOJA_NAO_ENCONTRADA
+        elif conta.conta_id not in montados:
+            contextos[dominio_loja] = MSG_SEM_PEDIDOS
+        else:
+            contextos[dominio_loja] = montados[conta.conta_id]
+            # No modo "agregado" o contexto individual usa estatísticas da janela inteira;
+            # só compartilha o cache quando as duas formas produzem o mesmo texto
+            if INSIGHTS_MODO == "pandas":
+                contexto_cache.guardar(_chave_contexto("basico", dominio_loja), contextos[dominio_loja])
+    return contextos
@@ -1,39 +1,464 @@
 # db.py
 
+import asyncio
+import contextvars
+import datetime as dt
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
 import pyodbc
 
+import metricas
+from queries import CONSULTAS
+
+DSN = os.getenv("DB_DSN", "DSN=LI-STARROCKS")
+
+# Configuração do pool de conexões (pode ser ajustada por variáveis de ambiente)
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_MAX_IDADE = float(os.getenv("DB_POOL_MAX_IDADE", "1800"))  # segundos
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # espera máxima por uma conexão livre
+POOL_VALIDAR_APOS = float(os.getenv("DB_POOL_VALIDAR_APOS", "30"))  # conexões ociosas há mais tempo são testadas
+
+# Configuração da API assíncrona
+ASYNC_MAX_CONCORRENCIA = int(os.getenv("DB_ASYNC_MAX_CONCORRENCIA", str(POOL_MAX)))
+QUERY_TIMEOUT = int(os.getenv("DB_QUERY_TIMEOUT", "30"))  # segundos, 0 desativa
+
+# Linhas lidas por fetchmany nas APIs colunares (fetch_table/fetch_frame/iter_batches)
+FETCH_LOTE = int(os.getenv("DB_FETCH_LOTE", "5000"))
+
+# Máximo de cursores preparados mantidos por conexão do pool
+CURSORES_POR_CONEXAO = int(os.getenv("DB_CURSORES_POR_CONEXAO", "32"))
+
 
 def get_connection():
-    return pyodbc.connect("DSN=LI-STARROCKS", autocommit=True)
+    return pyodbc.connect(DSN, autocommit=True)
+
+
+class PoolEsgotadoError(Exception):
+    pass
+
+
+class _ConexaoPool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.criada_em = time.monotonic()
+        self.usada_em = self.criada_em
+        # Cursores por consulta nomeada: o pyodbc só prepara de novo se o texto mudar
+        self.cursores = OrderedDict()
+
+    def cursor_preparado(self, nome: str):
+        cursor = self.cursores.get(nome)
+        if cursor is None:
+            cursor = self.cursores[nome] = self.conn.cursor()
+            while len(self.cursores) > CURSORES_POR_CONEXAO:
+                _, antigo = self.cursores.popitem(last=False)
+                antigo.close()
+        else:
+            self.cursores.move_to_end(nome)
+        return cursor
+
+    def expirada(self, max_idade: float) -> bool:
+        return max_idade > 0 and time.monotonic() - self.criada_em > max_idade
+
+    def valida(self) -> bool:
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def fechar(self):
+        try:
+            self.conn.close()
+        except pyodbc.Error:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe para o StarRocks.
+
+    Mantém entre `min_size` e `max_size` conexões abertas, valida conexões
+    ociosas antes de entregá-las e recicla as que passaram de `max_idade`.
+    """
+
+    def __init__(
+        self,
+        fabrica=get_connection,
+        min_size: int = POOL_MIN,
+        max_size: int = POOL_MAX,
+        max_idade: float = POOL_MAX_IDADE,
+        timeout: float = POOL_TIMEOUT,
+        validar_apos: float = POOL_VALIDAR_APOS,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Tamanhos de pool inválidos: min=%s, max=%s" % (min_size, max_size))
+        self.fabrica = fabrica
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idade = max_idade
+        self.timeout = timeout
+        self.validar_apos = validar_apos
+
+        self._livres = deque()
+        self._abertas = 0
+        self._cond = threading.Condition()
+
+        self._criadas = 0
+        self._recicladas = 0
+        self._checkouts = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+    def _criar(self) -> _ConexaoPool:
+        item = _ConexaoPool(self.fabrica())
+        with self._cond:
+            self._criadas += 1
+        return item
+
+    def _descartar(self, item: _ConexaoPool):
+        item.fechar()
+        with self._cond:
+            self._abertas -= 1
+            self._recicladas += 1
+            self._cond.notify()
+
+    def preencher(self):
+        # Abre conexões até atingir o tamanho mínimo configurado
+        while True:
+            with self._cond:
+                if self._abertas >= self.min_size:
+                    return
+                self._abertas += 1
+            try:
+                item = self._criar()
+            except Exception:
+                with self._cond:
+                    self._abertas -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._livres.append(item)
+                self._cond.notify()
+
+    def adquirir(self) -> _ConexaoPool:
+        inicio = time.monotonic()
+        prazo = inicio + self.timeout
+        while True:
+            item = None
+            criar = False
+            with self._cond:
+                while not self._livres and self._abertas >= self.max_size:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        raise PoolEsgotadoError(
+                            f"Nenhuma conexão livre após {self.timeout}s (max={self.max_size})"
+                        )
+                    self._cond.wait(restante)
+                if self._livres:
+                    item = self._livres.pop()
+                else:
+                    self._abertas += 1
+                    criar = True
+
+            if criar:
+                try:
+                    item = self._criar()
+                except Exception:
+                    with self._cond:
+                        self._abertas -= 1
+                        self._cond.notify()
+                    raise
+            elif item.expirada(self.max_idade) or (
+                time.monotonic() - item.usada_em > self.validar_apos and not item.valida()
+            ):
+                self._descartar(item)
+                continue
+
+            espera = time.monotonic() - inicio
+            with self._cond:
+                self._checkouts += 1
+                self._espera_total += espera
+                self._espera_max = max(self._espera_max, espera)
+            return item
+
+    def devolver(self, item: _ConexaoPool, quebrada: bool = False):
+        if quebrada or item.expirada(self.max_idade):
+            self._descartar(item)
+            return
+        item.usada_em = time.monotonic()
+        with self._cond:
+            self._livres.append(item)
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        with self.checkout() as item:
+            yield item.conn
+
+    @contextmanager
+    def checkout(self):
+        item = self.adquirir()
+        try:
+            yield item
+        except pyodbc.Error:
+            # Erros de driver podem deixar a conexão em estado inválido
+            self.devolver(item, quebrada=True)
+            raise
+        except BaseException:
+            self.devolver(item)
+            raise
+        else:
+            self.devolver(item)
+
+    def fechar(self):
+        with self._cond:
+            livres = list(self._livres)
+            self._livres.clear()
+            self._abertas -= len(livres)
+            self._cond.notify_all()
+        for item in livres:
+            item.fechar()
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {
+                "min": self.min_size,
+                "max": self.max_size,
+                "abertas": self._abertas,
+                "livres": len(self._livres),
+                "em_uso": self._abertas - len(self._livres),
+                "criadas": self._criadas,
+                "recicladas": self._recicladas,
+                "checkouts": self._checkouts,
+                "espera_media_ms": round(1000 * self._espera_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "espera_max_ms": round(1000 * self._espera_max, 3),
+            }
+
+
+pool = ConnectionPool()
+
+
+def pool_stats() -> dict:
+    return pool.estatisticas()
+
+
+class _EstatisticaConsulta:
+    __slots__ = ("execucoes", "erros", "tempo_total", "tempo_max")
+
+    def __init__(self):
+        self.execucoes = 0
+        self.erros = 0
+        self.tempo_total = 0.0
+        self.tempo_max = 0.0
+
+
+_estatisticas_consultas: dict[str, _EstatisticaConsulta] = {}
+_estatisticas_lock = threading.Lock()
+_NOMES_CONSULTAS = {sql: nome for nome, sql in CONSULTAS.items()}
+
+
+def _registrar_execucao(nome: str, duracao: float, erro: bool):
+    with _estatisticas_lock:
+        estatistica = _estatisticas_consultas.get(nome)
+        if estatistica is None:
+            estatistica = _estatisticas_consultas[nome] = _EstatisticaConsulta()
+        estatistica.execucoes += 1
+        estatistica.erros += int(erro)
+        estatistica.tempo_total += duracao
+        estatistica.tempo_max = max(estatistica.tempo_max, duracao)
+
+
+def estatisticas_consultas() -> dict:
+    with _estatisticas_lock:
+        return {
+            nome: {
+                "execucoes": e.execucoes,
+                "erros": e.erros,
+                "latencia_media_ms": round(1000 * e.tempo_total / e.execucoes, 3) if e.execucoes else 0.0,
+                "latencia_max_ms": round(1000 * e.tempo_max, 3),
+            }
+            for nome, e in _estatisticas_consultas.items()
+        }
+
+
+def _resolver_consulta(query: str):
+    # Aceita tanto o nome registrado em queries.CONSULTAS quanto o texto SQL
+    if query in CONSULTAS:
+        return query, CONSULTAS[query]
+    return _NOMES_CONSULTAS.get(query), query
+
+
+@contextmanager
+def _executar(query: str, params, timeout: int | None):
+    nome, sql = _resolver_consulta(query)
+    inicio = time.perf_counter()
+    erro = True
+    try:
+        with pool.checkout() as item:
+            metricas.registrar_etapa("db_espera_conexao", time.perf_counter() - inicio, nome or "adhoc")
+            item.conn.timeout = QUERY_TIMEOUT if timeout is None else timeout
+            # Consultas registradas reaproveitam o cursor (e o statement preparado) da conexão
+            cursor = item.cursor_preparado(nome) if nome else item.conn.cursor()
+            cursor.execute(sql, params)
+            yield cursor
+            if not nome:
+                cursor.close()
+        erro = False
+    finally:
+        duracao = time.perf_counter() - inicio
+        _registrar_execucao(nome or "adhoc", duracao, erro)
+        metricas.registrar_etapa("db", duracao, nome or "adhoc")
 
 
 # Adiciona SET lc_time_names = 'pt_BR' para garantir que os dias da semana sejam retornados em português no fetch_one e no fetch_all
-def fetch_one(query: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
+def fetch_one(query: str, params=(), timeout: int | None = None):
+    with _executar(query, params, timeout) as cursor:
+        row = cursor.fetchone()
     return row[0] if row else None
 
 
-def fetch_row(query: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
+def fetch_row(query: str, params=(), timeout: int | None = None):
+    with _executar(query, params, timeout) as cursor:
+        row = cursor.fetchone()
     return row if row else None
 
 
-def fetch_all(query: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    columns = [column[0] for column in cursor.description]
-    results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    cursor.close()
-    conn.close()
+def fetch_all(query: str, params=(), timeout: int | None = None):
+    with _executar(query, params, timeout) as cursor:
+        columns = [column[0] for column in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
     return results
+
+
+# API colunar: lê em lotes com fetchmany direto para arrays Arrow, sem montar um dict por linha.
+# O tipo de cada coluna vem do cursor.description; Decimal vira float64.
+_TIPOS_ARROW = {
+    int: pa.int64(),
+    float: pa.float64(),
+    Decimal: pa.float64(),
+    str: pa.string(),
+    bool: pa.bool_(),
+    bytes: pa.binary(),
+    bytearray: pa.binary(),
+    dt.date: pa.date32(),
+    dt.datetime: pa.timestamp("us"),
+    dt.time: pa.time64("us"),
+}
+
+
+def _schema_cursor(cursor) -> pa.Schema:
+    return pa.schema([(coluna[0], _TIPOS_ARROW.get(coluna[1], pa.null())) for coluna in cursor.description])
+
+
+def _array(valores, tipo: pa.DataType) -> pa.Array:
+    if pa.types.is_null(tipo):
+        return pa.array(valores)
+    if pa.types.is_floating(tipo):
+        # Decimal não converte direto para float64; o Arrow infere decimal128 e depois converte
+        return pa.array(valores).cast(tipo)
+    return pa.array(valores, type=tipo)
+
+
+def _ler_lotes(cursor, schema: pa.Schema, tamanho_lote: int):
+    while True:
+        linhas = cursor.fetchmany(tamanho_lote)
+        if not linhas:
+            return
+        colunas = zip(*linhas)
+        yield pa.RecordBatch.from_arrays(
+            [_array(valores, campo.type) for valores, campo in zip(colunas, schema)],
+            names=schema.names,
+        )
+
+
+def iter_batches(query: str, params=(), timeout: int | None = None, tamanho_lote: int = FETCH_LOTE):
+    """Gera pa.RecordBatch de até `tamanho_lote` linhas, mantendo a conexão só enquanto é consumido."""
+    with _executar(query, params, timeout) as cursor:
+        yield from _ler_lotes(cursor, _schema_cursor(cursor), tamanho_lote)
+
+
+def iter_frames(query: str, params=(), timeout: int | None = None, tamanho_lote: int = FETCH_LOTE):
+    for lote in iter_batches(query, params, timeout, tamanho_lote):
+        yield lote.to_pandas()
+
+
+def fetch_table(query: str, params=(), timeout: int | None = None, tamanho_lote: int = FETCH_LOTE) -> pa.Table:
+    with _executar(query, params, timeout) as cursor:
+        schema = _schema_cursor(cursor)
+        tabelas = [pa.Table.from_batches([lote]) for lote in _ler_lotes(cursor, schema, tamanho_lote)]
+    if not tabelas:
+        return schema.empty_table()
+    # Colunas de tipo desconhecido podem ser inferidas de forma diferente em cada lote
+    return pa.concat_tables(tabelas, promote_options="permissive")
+
+
+def fetch_frame(query: str, params=(), timeout: int | None = None, tamanho_lote: int = FETCH_LOTE) -> pd.DataFrame:
+    return fetch_table(query, params, timeout, tamanho_lote).to_pandas()
+
+
+def fetch_columns(query: str, params=(), timeout: int | None = None, tamanho_lote: int = FETCH_LOTE) -> dict:
+    tabela = fetch_table(query, params, timeout, tamanho_lote)
+    return {nome: coluna.to_numpy() for nome, coluna in zip(tabela.column_names, tabela.columns)}
+
+
+# API assíncrona: as consultas rodam em um executor limitado para não bloquear o event loop.
+# O semáforo limita quantas consultas ficam em andamento ao mesmo tempo; o timeout vale
+# tanto no driver (conn.timeout) quanto na espera do lado asyncio.
+_executor = ThreadPoolExecutor(max_workers=ASYNC_MAX_CONCORRENCIA, thread_name_prefix="db")
+_semaforos = weakref.WeakKeyDictionary()
+
+
+def _semaforo() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaforo = _semaforos.get(loop)
+    if semaforo is None:
+        semaforo = _semaforos[loop] = asyncio.Semaphore(ASYNC_MAX_CONCORRENCIA)
+    return semaforo
+
+
+async def _executar_async(funcao, query: str, params, timeout: int | None):
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    inicio = time.perf_counter()
+    async with _semaforo():
+        metricas.registrar_etapa("db_fila", time.perf_counter() - inicio, _resolver_consulta(query)[0] or "adhoc")
+        # Copia o contexto para que as métricas da thread fiquem na requisição atual
+        contexto = contextvars.copy_context()
+        futuro = loop.run_in_executor(_executor, contexto.run, funcao, query, params, timeout)
+        if not timeout:
+            return await futuro
+        # Pequena folga para o timeout do driver disparar primeiro e liberar a conexão
+        return await asyncio.wait_for(futuro, timeout + 1)
+
+
+async def fetch_one_async(query: str, params=(), timeout: int | None = None):
+    return await _executar_async(fetch_one, query, params, timeout)
+
+
+async def fetch_row_async(query: str, params=(), timeout: int | None = None):
+    return await _executar_async(fetch_row, query, params, timeout)
+
+
+async def fetch_all_async(query: str, params=(), timeout: int | None = None):
+    return await _executar_async(fetch_all, query, params, timeout)
+
+
+async def fetch_table_async(query: str, params=(), timeout: int | None = None) -> pa.Table:
+    return await _executar_async(fetch_table, query, params, timeout)
+
+
+async def fetch_frame_async(query: str, params=(), timeout: int | None = None) -> pd.DataFrame:
+    return await _executar_async(fetch_frame, query, params, timeout)
@@ -1,12 +1,23 @@
 from pydantic import BaseModel, Field
 from typing import Literal, Optional, List
-from openai import OpenAI
-import os
 from dotenv import load_dotenv
-from contexto_ia import novo_coletar_contexto_para_ia
+from openai.types import CompletionUsage
+from openai.types.chat import ParsedChatCompletionMessage
+from contexto_ia import estimar_tokens_mensagens, novo_coletar_contexto_para_ia_async
+import llm
+import metricas
+from sse import ExtratorElementosJson
 
+import asyncio
+import json
+import os
+import sys
 import time
 
+# "unico": uma chamada gera todas as personas; "paralelo": uma chamada curta de
+# planejamento e depois uma chamada por persona, todas ao mesmo tempo
+PERSONAS_MODO = os.getenv("PERSONAS_MODO", "unico")
+
 
 class PersonaRequest(BaseModel):
     """
@@ -35,6 +46,9 @@ class PersonaRequest(BaseModel):
     )
     autoriza_dados: bool
     dominio_loja: str
+    modo: Optional[Literal["unico", "paralelo"]] = Field(
+        None, description="Como as personas são geradas; padrão em PERSONAS_MODO."
+    )
 
 
 class PersonaResponse(BaseModel):
@@ -133,6 +147,33 @@ class ModelOutput(BaseModel):
     )
 
 
+class PersonaBrief(BaseModel):
+    genero: Literal["Masculino", "Feminino", "Não binário", "Não informado"]
+    faixa_de_idade: Literal["18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+    faixa_renda: Literal[
+        "Até R$ 2000,00",
+        "De R$ 2000,00 a R$ 5000,00",
+        "De R$ 5000,00 a R$ 10000,00",
+        "Acima de R$ 10000,00",
+    ]
+    foco: str = Field(
+        ...,
+        description=(
+            "Uma frase com o que diferencia esta persona das outras. "
+            "Ex: 'compra presentes em datas comemorativas'."
+        ),
+    )
+
+
+class PlanoPersonas(BaseModel):
+    scratchpad: str = Field(
+        ..., description="Raciocínio curto sobre por que estas personas são úteis ao lojista."
+    )
+    briefs: List[PersonaBrief] = Field(
+        ..., description="Lista de até 3 briefs, um por persona. Gere no máximo 3 itens."
+    )
+
+
 class ModelInput(BaseModel):
     nome: str
     faixa_de_idade: Literal["18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
@@ -148,9 +189,9 @@ class ModelInput(BaseModel):
     contexto_loja: Optional[str] = None
 
 
-def generate_personas(req: PersonaRequest):
-    contexto_loja = novo_coletar_contexto_para_ia(req.dominio_loja)
-    model_input = ModelInput(
+async def _model_input(req: PersonaRequest) -> ModelInput:
+    contexto_loja = await novo_coletar_contexto_para_ia_async(req.dominio_loja)
+    return ModelInput(
         nome=req.nome,
         faixa_de_idade=req.faixa_de_idade,
         genero=req.genero,
@@ -160,7 +201,19 @@ def generate_personas(req: PersonaRequest):
         contexto_loja=contexto_loja,
     )
 
-    return infer_personas(model_input)
+
+async def generate_personas(req: PersonaRequest, usar_cache: bool = True):
+    return await infer_personas(await _model_input(req), usar_cache=usar_cache, modo=req.modo)
+
+
+async def generate_personas_com_usage(req: PersonaRequest, usar_cache: bool = True):
+    """Como generate_personas, mas retorna (mensagem, usage) com os tokens de todas as chamadas."""
+    return await _inferir_personas(await _model_input(req), SYSTEM_PROMPT, usar_cache, req.modo)
+
+
+async def generate_personas_stream(req: PersonaRequest, usar_cache: bool = True):
+    async for persona in infer_personas_stream(await _model_input(req), usar_cache=usar_cache):
+        yield persona
 
 
 SYSTEM_PROMPT = """
@@ -208,8 +261,7 @@ Seja coerente e consistente. Mencione no "scratchpad" qualquer insight que te le
 """
 
 
-def infer_personas(model_input: ModelInput, system_prompt: str = SYSTEM_PROMPT):
-
+def _mensagens(model_input: ModelInput, system_prompt: str) -> list[dict]:
     user_prompt = f"""
     Contexto da loja:
     {model_input.contexto_loja}
@@ -226,16 +278,22 @@ def infer_personas(model_input: ModelInput, system_prompt: str = SYSTEM_PROMPT):
     Lembre-se de retornar **exclusivamente** o JSON no formato descrito no system prompt,
     e procure diversificar gênero, idade ou outros aspectos que sejam relevantes para o mix de clientes.
     """
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+async def _inferir_personas_unico(model_input: ModelInput, system_prompt: str, usar_cache: bool):
+    messages = _mensagens(model_input, system_prompt)
+    print(f"Tokens estimados do prompt: {estimar_tokens_mensagens(messages)}")
 
     start_time = time.time()
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-mini",  # Ajuste para o modelo que você tiver disponível
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        max_tokens=4000,
+    response = await llm.parse(
+        rotulo="PERSONAS_ESTRUTURADAS",
+        usar_cache=usar_cache,
+        rota="PERSONAS_ESTRUTURADAS",  # modelos e SLO em roteamento.py
+        messages=messages,
         temperature=0.3,
         response_format=ModelOutput,
     )
@@ -249,7 +307,161 @@ def infer_personas(model_input: ModelInput, system_prompt: str = SYSTEM_PROMPT):
     print(f"Tempo de resposta: {round(end_time - start_time, 2)} segundos")
     print("------------------------------")
 
-    return response.choices[0].message
+    return response.choices[0].message, usage
+
+
+async def infer_personas(
+    model_input: ModelInput,
+    system_prompt: str = SYSTEM_PROMPT,
+    usar_cache: bool = True,
+    modo: str | None = None,
+):
+    mensagem, _ = await _inferir_personas(model_input, system_prompt, usar_cache, modo)
+    return mensagem
+
+
+async def _inferir_personas(model_input: ModelInput, system_prompt: str, usar_cache: bool, modo: str | None):
+    modo = modo or PERSONAS_MODO
+    with metricas.medir("personas", modo):
+        if modo == "paralelo":
+            return await infer_personas_paralelo(model_input, usar_cache=usar_cache)
+        return await _inferir_personas_unico(model_input, system_prompt, usar_cache)
+
+
+SYSTEM_PROMPT_PLANO = """
+Você é um especialista em marketing e comportamento do consumidor.
+Com base no contexto de uma loja virtual e nas informações de um cliente real, planeje até 3 personas
+úteis ao lojista, com **variedade** de gênero, faixa etária e renda quando fizer sentido.
+Não descreva as personas: retorne só um brief de cada uma (gênero, faixa de idade, faixa de renda e
+uma frase com o foco que a diferencia das outras) e um raciocínio curto em "scratchpad".
+Gere no máximo 3 briefs e não retorne texto fora do JSON.
+"""
+
+SYSTEM_PROMPT_PERSONA = """
+Você é um especialista em marketing e comportamento do consumidor.
+Com base no contexto de uma loja virtual, nas informações de um cliente real e no brief recebido,
+descreva **uma única** persona completa e coerente que siga o brief (gênero, faixa de idade, faixa de renda e foco).
+A idade deve ser um número inteiro dentro da faixa do brief e a faixa_renda exatamente a do brief.
+Não retorne texto fora do JSON.
+"""
+
+
+def _mensagens_persona(model_input: ModelInput, plano: PlanoPersonas, indice: int) -> list[dict]:
+    brief = plano.briefs[indice]
+    outras = [f"- {b.genero}, {b.faixa_de_idade}, {b.foco}" for i, b in enumerate(plano.briefs) if i != indice]
+    user_prompt = f"""
+    Contexto da loja:
+    {model_input.contexto_loja}
+
+    Informações do cliente real (inspiração para a persona):
+    - Nome: {model_input.nome}
+    - Faixa de idade: {model_input.faixa_de_idade}
+    - Gênero: {model_input.genero}
+    - Localidade: {model_input.localidade}
+    - Faixa de renda: {model_input.faixa_de_renda}
+    - Observações adicionais: {model_input.mais_informacoes}
+
+    Brief da persona:
+    - Gênero: {brief.genero}
+    - Faixa de idade: {brief.faixa_de_idade}
+    - Faixa de renda: {brief.faixa_renda}
+    - Foco: {brief.foco}
+
+    Outras personas que já estão sendo criadas (não repita o perfil delas):
+    {chr(10).join(outras) or "- nenhuma"}
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_PERSONA},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _somar_usage(usos: list) -> CompletionUsage:
+    usos = [u for u in usos if u is not None]
+    return CompletionUsage(
+        prompt_tokens=sum(u.prompt_tokens for u in usos),
+        completion_tokens=sum(u.completion_tokens for u in usos),
+        total_tokens=sum(u.total_tokens for u in usos),
+    )
+
+
+async def infer_personas_paralelo(model_input: ModelInput, usar_cache: bool = True):
+    """
+    Planejamento curto com os briefs das personas e depois uma chamada por persona, em paralelo.
+
+    Retorna (mensagem, usage) no mesmo formato do modo de chamada única: `mensagem.parsed`
+    é um ModelOutput, com o raciocínio do planejamento em scratchpad; `usage` soma todas as chamadas.
+    """
+    plano_resposta = await llm.parse(
+        rotulo="PERSONAS_PLANO",
+        usar_cache=usar_cache,
+        rota="PERSONAS_PLANO",
+        messages=_mensagens(model_input, SYSTEM_PROMPT_PLANO),
+        temperature=0.3,
+        response_format=PlanoPersonas,
+    )
+    plano = plano_resposta.choices[0].message.parsed
+    if plano is None or not plano.briefs:
+        # Recusa ou plano vazio: segue pelo caminho de chamada única
+        mensagem, usage = await _inferir_personas_unico(model_input, SYSTEM_PROMPT, usar_cache)
+        return mensagem, _somar_usage([plano_resposta.usage, usage])
+    plano.briefs = plano.briefs[:3]
+
+    respostas = await asyncio.gather(
+        *(
+            llm.parse(
+                rotulo="PERSONA",
+                usar_cache=usar_cache,
+                rota="PERSONA",
+                messages=_mensagens_persona(model_input, plano, indice),
+                temperature=0.3,
+                response_format=PersonaResponse,
+            )
+            for indice in range(len(plano.briefs))
+        )
+    )
+    saida = ModelOutput(
+        scratchpad=plano.scratchpad,
+        personas=[r.choices[0].message.parsed for r in respostas if r.choices[0].message.parsed is not None],
+    )
+    mensagem = ParsedChatCompletionMessage[ModelOutput](role="assistant", content=saida.model_dump_json(), parsed=saida)
+    return mensagem, _somar_usage([plano_resposta.usage, *(r.usage for r in respostas)])
+
+
+async def comparar_modos(req: PersonaRequest) -> dict:
+    """Gera as personas pelos dois modos, sem cache, e compara tempo de parede e tokens."""
+    model_input = await _model_input(req)
+    resultados = {}
+    for modo in ("unico", "paralelo"):
+        inicio = time.perf_counter()
+        if modo == "paralelo":
+            mensagem, usage = await infer_personas_paralelo(model_input, usar_cache=False)
+        else:
+            mensagem, usage = await _inferir_personas_unico(model_input, SYSTEM_PROMPT, usar_cache=False)
+        resultados[modo] = {
+            "segundos": round(time.perf_counter() - inicio, 3),
+            "personas": len(mensagem.parsed.personas) if mensagem.parsed else 0,
+            "tokens_prompt": usage.prompt_tokens,
+            "tokens_completion": usage.completion_tokens,
+            "tokens_total": usage.total_tokens,
+        }
+    return resultados
+
+
+async def infer_personas_stream(model_input: ModelInput, system_prompt: str = SYSTEM_PROMPT, usar_cache: bool = True):
+    """Gera cada PersonaResponse assim que o objeto dela fecha no JSON em streaming."""
+    resposta = llm.parse_stream(
+        rotulo="PERSONAS_ESTRUTURADAS",
+        usar_cache=usar_cache,
+        rota="PERSONAS_ESTRUTURADAS",
+        messages=_mensagens(model_input, system_prompt),
+        temperature=0.3,
+        response_format=ModelOutput,
+    )
+    extrator = ExtratorElementosJson("personas")
+    async for pedaco in resposta:
+        for elemento in extrator.alimentar(pedaco):
+            yield PersonaResponse.model_validate_json(elemento)
 
 
 if __name__ == "__main__":
@@ -268,5 +480,8 @@ if __name__ == "__main__":
         autoriza_dados=True,
         dominio_loja="www.anmyperfumes.com.br",
     )
-    response_data = generate_personas(req)
-    print(response_data.parsed.model_dump_json(indent=4))
+    if "--comparar" in sys.argv:
+        print(json.dumps(asyncio.run(comparar_modos(req)), indent=4))
+    else:
+        response_data = asyncio.run(generate_personas(req))
+        print(response_data.parsed.model_dump_json(indent=4))
@@ -0,0 +1,345 @@
+# llm.py
+
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import AsyncExitStack
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types.chat import ChatCompletion, ParsedChatCompletion
+from pydantic import BaseModel
+
+import metricas
+from admissao import controlador as admissao
+from cache import CacheTTL
+from coalescencia import respostas_llm as coalescedor_respostas
+from roteamento import roteador
+
+# Limites do pool HTTP compartilhado por todas as chamadas à OpenAI
+LLM_MAX_CONEXOES = int(os.getenv("LLM_MAX_CONEXOES", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+# Cache de respostas: a chave é o hash do modelo, mensagens, temperatura, schema de resposta etc.
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_MAX = int(os.getenv("LLM_CACHE_MAX", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_CAMINHO = os.getenv("LLM_CACHE_CAMINHO", ".cache/llm.sqlite") or None
+
+# TTL padrão por endpoint (rótulo); cada um pode ser trocado por LLM_CACHE_TTL_<ROTULO>, 0 desliga
+_TTL_POR_ROTULO = {
+    "INSIGHTS": 6 * 3600,
+    "MELHORIAS": 6 * 3600,
+    "PERSONAS": 3600,
+    "PERSONAS_ESTRUTURADAS": 3600,
+    "PERSONAS_PLANO": 3600,
+    "PERSONA": 3600,
+}
+
+logger = logging.getLogger("uvicorn")
+
+respostas_cache = CacheTTL(
+    max_itens=LLM_CACHE_MAX,
+    ttl=LLM_CACHE_TTL,
+    caminho=LLM_CACHE_CAMINHO,
+    namespace="llm",
+)
+
+_client: AsyncOpenAI | None = None
+
+
+def get_client() -> AsyncOpenAI:
+    # Um único cliente por processo, criado sob demanda para que o .env já tenha sido carregado
+    global _client
+    if _client is None:
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONEXOES,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        # As novas tentativas ficam com o controle de admissão (admissao.py)
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+    return _client
+
+
+async def fechar():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _ttl_cache(rotulo: str) -> float:
+    valor = os.getenv(f"LLM_CACHE_TTL_{rotulo.upper()}")
+    if valor is not None:
+        return float(valor)
+    return _TTL_POR_ROTULO.get(rotulo.upper(), LLM_CACHE_TTL)
+
+
+def _serializar(valor):
+    # response_format pode ser uma classe pydantic: entra na chave pelo schema dela
+    if isinstance(valor, type) and issubclass(valor, BaseModel):
+        return valor.model_json_schema()
+    raise TypeError(f"Parâmetro não serializável na chave do cache: {type(valor).__name__}")
+
+
+def chave_cache(operacao: str, kwargs: dict) -> str:
+    texto = json.dumps({"operacao": operacao, **kwargs}, sort_keys=True, ensure_ascii=False, default=_serializar)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+def _tipo_resposta(operacao: str, kwargs: dict):
+    if operacao == "parse":
+        return ParsedChatCompletion[kwargs["response_format"]]
+    return ChatCompletion
+
+
+def _preparar_cache(operacao: str, rotulo: str, usar_cache: bool, kwargs: dict) -> tuple[str | None, float]:
+    # Retorna (chave, ttl); chave None quando a chamada não deve passar pelo cache
+    ttl = _ttl_cache(rotulo)
+    if not (LLM_CACHE and usar_cache and ttl > 0):
+        return None, ttl
+    return chave_cache(operacao, kwargs), ttl
+
+
+def _do_cache(operacao: str, rotulo: str, chave: str | None, kwargs: dict):
+    if chave is None:
+        return None
+    texto = respostas_cache.obter(chave)
+    if texto is None:
+        return None
+    logger.info(f"Resposta da IA ({rotulo}) servida do cache.")
+    metricas.registro.incrementar("llm_chamadas_total", rotulo=rotulo, origem="cache")
+    return _tipo_resposta(operacao, kwargs).model_validate_json(texto)
+
+
+def _guardar_cache(chave: str | None, ttl: float, resposta):
+    # Respostas cortadas (ex.: por max_tokens) não são reaproveitadas
+    if chave is None or resposta is None or not resposta.choices or resposta.choices[0].finish_reason != "stop":
+        return
+    respostas_cache.guardar(chave, resposta.model_dump_json(), ttl=ttl)
+
+
+async def _chamar_api(rotulo: str, chamada, chave: str | None, ttl: float, kwargs: dict, prazo: float | None = None):
+    with metricas.medir("llm", rotulo):
+        resposta, reserva = await admissao.executar(rotulo, kwargs, lambda: chamada(**kwargs), prazo=prazo)
+    reserva.ajustar(resposta.usage)
+    metricas.registro.incrementar("llm_chamadas_total", rotulo=rotulo, origem="api")
+    metricas.registrar_tokens(rotulo, resposta.usage)
+    _guardar_cache(chave, ttl, resposta)
+    return resposta
+
+
+async def _com_cache(operacao: str, rotulo: str, usar_cache: bool, chamada, kwargs: dict, prazo: float | None = None):
+    chave, ttl = _preparar_cache(operacao, rotulo, usar_cache, kwargs)
+    resposta = _do_cache(operacao, rotulo, chave, kwargs)
+    if resposta is not None:
+        return resposta
+    if not usar_cache:
+        # Quem pediu uma resposta nova não aproveita a de outra requisição
+        return await _chamar_api(rotulo, chamada, chave, ttl, kwargs, prazo)
+    # Chamadas idênticas simultâneas (mesmo com o cache desligado) viram uma só
+    chave_voo = chave or chave_cache(operacao, kwargs)
+    return await coalescedor_respostas.executar(chave_voo, lambda: _chamar_api(rotulo, chamada, chave, ttl, kwargs, prazo))
+
+
+# Com `rota`, modelo e max_tokens são escolhidos pelo roteamento.py (com alternativas se a
+# camada escolhida passar do SLO ou falhar); sem ela, valem os kwargs recebidos. O SLO
+# (`prazo`) vale só para a chamada à API, depois da admissão: a espera na fila não conta.
+# `contexto`: a parte variável do prompt, que decide se ele é pequeno (ver Roteador.planejar).
+async def _roteada(operacao: str, rotulo: str, usar_cache: bool, rota: str | None, contexto: str | None, chamada, kwargs: dict):
+    if rota is None:
+        return await _com_cache(operacao, rotulo, usar_cache, chamada, kwargs)
+    return await roteador.executar(
+        rota, kwargs, lambda roteados, prazo: _com_cache(operacao, rotulo, usar_cache, chamada, roteados, prazo), contexto
+    )
+
+
+async def chat(rotulo: str = "CHAT", usar_cache: bool = True, rota: str | None = None, contexto: str | None = None, **kwargs):
+    return await _roteada("chat", rotulo, usar_cache, rota, contexto, get_client().chat.completions.create, kwargs)
+
+
+async def parse(rotulo: str = "PARSE", usar_cache: bool = True, rota: str | None = None, contexto: str | None = None, **kwargs):
+    return await _roteada("parse", rotulo, usar_cache, rota, contexto, get_client().beta.chat.completions.parse, kwargs)
+
+
+def _rotear_stream(rota: str | None, kwargs: dict, contexto: str | None = None) -> tuple:
+    # Em streaming só a escolha da camada: depois do primeiro token não há como trocar de modelo
+    if rota is None:
+        return None, kwargs
+    camada = roteador.planejar(rota, kwargs.get("messages"), contexto)[0]
+    return (rota, camada), roteador.aplicar(camada, kwargs)
+
+
+def estatisticas_rotas() -> dict:
+    return roteador.estatisticas()
+
+
+def estatisticas_admissao() -> dict:
+    return admissao.estatisticas()
+
+
+def estatisticas_cache() -> dict:
+    return {"ativo": LLM_CACHE, **respostas_cache.estatisticas()}
+
+
+async def transcrever(**kwargs):
+    # Sem custo em tokens de chat: só passa pela fila e pelos limites de requisições
+    with metricas.medir("llm", "TRANSCRICAO"):
+        resposta, _ = await admissao.executar(
+            "TRANSCRICAO", {"max_tokens": 0}, lambda: get_client().audio.transcriptions.create(**kwargs)
+        )
+        return resposta
+
+
+class StreamLLM:
+    """
+    Iterador assíncrono sobre os pedaços de texto de uma resposta em streaming.
+
+    Depois de consumido, expõe `usage`, `ttfb` (tempo até o primeiro token),
+    `duracao` (tempo total), `conclusao` (resposta final) e `do_cache`.
+    """
+
+    def __init__(self, gerador, rotulo: str, rota: tuple | None = None):
+        self._gerador = gerador
+        self.rotulo = rotulo
+        self.rota = rota
+        self.usage = None
+        self.conclusao = None
+        self.ttfb = None
+        self.duracao = None
+        self.do_cache = False
+
+    async def __aiter__(self):
+        inicio = time.perf_counter()
+        try:
+            async for texto in self._gerador(self):
+                if self.ttfb is None:
+                    self.ttfb = time.perf_counter() - inicio
+                yield texto
+        finally:
+            self.duracao = time.perf_counter() - inicio
+            self._registrar()
+
+    def _registrar(self):
+        if not self.do_cache:
+            metricas.registro.incrementar("llm_chamadas_total", rotulo=self.rotulo, origem="api")
+            metricas.registrar_etapa("llm", self.duracao, self.rotulo)
+            if self.ttfb is not None:
+                metricas.registrar_etapa("llm_primeiro_token", self.ttfb, self.rotulo)
+            metricas.registrar_tokens(self.rotulo, self.usage)
+        if self.rota is not None:
+            rota, camada = self.rota
+            resultado = "ok" if self.conclusao is not None else "erros"
+            roteador.registrar(rota, camada, resultado, None if self.do_cache else self.duracao, self.usage)
+        logger.info(f"--- OPENAI API MÉTRICAS (STREAM {self.rotulo}) ---")
+        if self.do_cache:
+            logger.info("Resposta servida do cache.")
+        if self.usage is not None:
+            logger.info(
+                f"Tokens usados: prompt={self.usage.prompt_tokens}, completion={self.usage.completion_tokens}, total={self.usage.total_tokens}"
+            )
+        if self.ttfb is not None:
+            logger.info(f"Tempo até o primeiro token: {round(self.ttfb, 2)} segundos")
+        logger.info(f"Tempo total: {round(self.duracao, 2)} segundos")
+        logger.info("------------------------------")
+
+
+def _repetir_do_cache(stream_llm: StreamLLM, resposta) -> str:
+    stream_llm.do_cache = True
+    stream_llm.conclusao = resposta
+    stream_llm.usage = resposta.usage
+    return resposta.choices[0].message.content or ""
+
+
+def chat_stream(
+    rotulo: str = "CHAT", usar_cache: bool = True, rota: str | None = None, contexto: str | None = None, **kwargs
+) -> StreamLLM:
+    # Usa a mesma chave de chat(): uma resposta gerada sem streaming também atende o streaming
+    rota_escolhida, kwargs = _rotear_stream(rota, kwargs, contexto)
+    chave, ttl = _preparar_cache("chat", rotulo, usar_cache, kwargs)
+
+    async def gerador(stream_llm: StreamLLM):
+        resposta = _do_cache("chat", rotulo, chave, kwargs)
+        if resposta is not None:
+            yield _repetir_do_cache(stream_llm, resposta)
+            return
+
+        stream, reserva = await admissao.executar(
+            rotulo,
+            kwargs,
+            lambda: get_client().chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs),
+        )
+        partes = []
+        ultimo = None
+        motivo_fim = "stop"
+        try:
+            async for chunk in stream:
+                ultimo = chunk
+                if chunk.usage is not None:
+                    stream_llm.usage = chunk.usage
+                if chunk.choices:
+                    if chunk.choices[0].finish_reason:
+                        motivo_fim = chunk.choices[0].finish_reason
+                    if chunk.choices[0].delta.content:
+                        partes.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+        finally:
+            # Também quando o cliente desconecta no meio: a reserva não fica debitada
+            reserva.ajustar(stream_llm.usage)
+
+        if ultimo is not None:
+            stream_llm.conclusao = ChatCompletion(
+                id=ultimo.id,
+                object="chat.completion",
+                created=ultimo.created,
+                model=ultimo.model,
+                choices=[
+                    {
+                        "index": 0,
+                        "finish_reason": motivo_fim,
+                        "message": {"role": "assistant", "content": "".join(partes)},
+                    }
+                ],
+                usage=stream_llm.usage,
+            )
+            _guardar_cache(chave, ttl, stream_llm.conclusao)
+
+    return StreamLLM(gerador, rotulo, rota_escolhida)
+
+
+def parse_stream(
+    rotulo: str = "PARSE", usar_cache: bool = True, rota: str | None = None, contexto: str | None = None, **kwargs
+) -> StreamLLM:
+    rota_escolhida, kwargs = _rotear_stream(rota, kwargs, contexto)
+    chave, ttl = _preparar_cache("parse", rotulo, usar_cache, kwargs)
+
+    async def gerador(stream_llm: StreamLLM):
+        resposta = _do_cache("parse", rotulo, chave, kwargs)
+        if resposta is not None:
+            yield _repetir_do_cache(stream_llm, resposta)
+            return
+
+        async with AsyncExitStack() as pilha:
+            stream, reserva = await admissao.executar(
+                rotulo, kwargs, lambda: pilha.enter_async_context(get_client().beta.chat.completions.stream(**kwargs))
+            )
+            try:
+                async for evento in stream:
+                    if evento.type == "content.delta":
+                        yield evento.delta
+                stream_llm.conclusao = await stream.get_final_completion()
+                stream_llm.usage = stream_llm.conclusao.usage
+            finally:
+                reserva.ajustar(stream_llm.usage)
+        _guardar_cache(chave, ttl, stream_llm.conclusao)
+
+    return StreamLLM(gerador, rotulo, rota_escolhida)
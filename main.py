@@ -1,15 +1,37 @@
-from fastapi import FastAPI, UploadFile, File
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, UploadFile, File
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
-from contexto_ia import coletar_contexto_para_ia
-from db import fetch_all, fetch_one
-from queries import GET_PRODUTOS_LOJA, GET_CONTA_ID_POR_DOMINIO
+from contexto_ia import (
+    MSG_LOJA_NAO_ENCONTRADA,
+    MSG_SEM_PEDIDOS,
+    coletar_contexto_e_vendas_async,
+    coletar_contexto_para_ia_async,
+    coletar_contextos_para_ia_async,
+    contexto_cache,
+    estimar_tokens_mensagens,
+    formatar_produtos_para_prompt,
+    invalidar_contexto,
+)
+from catalogo import catalogo
+from db import estatisticas_consultas, fetch_all_async, pool, pool_stats
+from plano import Plano
+from preaquecimento import preaquecedor
+from queries import GET_PRODUTOS_LOJA
+from resolvedor import resolvedor
 import os
 from dotenv import load_dotenv
 import time
 import logging
 import json
+import asyncio
+import admissao
+import coalescencia
+import llm
+import metricas
+from sse import ExtratorElementosJson, evento_sse
+from transcricao import transcrever_arquivo
 
 
 load_dotenv()
@@ -18,7 +40,64 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn")
 
-app = FastAPI()
+# /insights/batch: máximo de lojas por requisição e de chamadas simultâneas à IA
+INSIGHTS_LOTE_MAX = int(os.getenv("INSIGHTS_LOTE_MAX", "500"))
+INSIGHTS_LOTE_CONCORRENCIA = int(os.getenv("INSIGHTS_LOTE_CONCORRENCIA", "8"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abre as conexões mínimas do pool antes de receber requisições
+    try:
+        await asyncio.to_thread(pool.preencher)
+    except Exception:
+        logger.exception("Não foi possível pré-abrir as conexões do pool.")
+    if os.getenv("RESOLVEDOR_PRECARGA", "1") == "1":
+        resolvedor.iniciar()
+    if os.getenv("PREAQUECIMENTO", "1") == "1":
+        insights = _preaquecer_insights if os.getenv("PREAQUECIMENTO_INSIGHTS", "0") == "1" else None
+        preaquecedor.iniciar(insights=insights)
+    yield
+    await preaquecedor.parar()
+    resolvedor.parar()
+    await llm.fechar()
+    pool.fechar()
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def medir_requisicao(request: Request, call_next):
+    # Tudo o que for medido durante a requisição (banco, pandas, IA...) fica associado a ela.
+    # call_next volta quando os cabeçalhos saem: o registro só fecha depois do último pedaço
+    # do corpo, para que a duração dos streams inclua a geração inteira.
+    with metricas.requisicao(request.url.path, request.method, fechar=False) as requisicao:
+        try:
+            response = await call_next(request)
+        except BaseException:
+            requisicao.fechar()
+            raise
+        rota = request.scope.get("route")
+        requisicao.rota = getattr(rota, "path", "desconhecida")
+        requisicao.status = response.status_code
+
+    corpo = response.body_iterator
+
+    async def corpo_medido():
+        try:
+            async for parte in corpo:
+                yield parte
+        finally:
+            requisicao.fechar()
+
+    response.body_iterator = corpo_medido()
+    # Nos streams as etapas e os tokens ainda não aconteceram quando os cabeçalhos saem
+    stream = response.headers.get("content-type", "").startswith("text/event-stream")
+    if metricas.METRICAS_CABECALHOS and not stream:
+        response.headers["Server-Timing"] = requisicao.server_timing()
+        response.headers["X-LLM-Tokens"] = str(requisicao.tokens)
+        response.headers["X-Cache-Hits"] = str(requisicao.hits_cache)
+    return response
+
 
 # Middleware de CORS para permitir o acesso do front
 app.add_middleware(
@@ -29,8 +108,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 class PersonaRequest(BaseModel):
     nome: str
     idade: str
@@ -42,13 +119,61 @@ class PersonaRequest(BaseModel):
 class InsightRequest(BaseModel):
     dominio_loja: str
 
-@app.post("/generate_personas")
-async def generate_personas(data: PersonaRequest):
-    contexto_loja = ""
+class InsightBatchRequest(BaseModel):
+    dominios_loja: list[str]
+
+
+def _resposta_sse(resposta: llm.StreamLLM, chave: str, evento: str) -> StreamingResponse:
+    # Envia cada elemento da lista `chave` como um evento SSE assim que o JSON dele fecha
+    async def eventos():
+        extrator = ExtratorElementosJson(chave)
+        try:
+            async for pedaco in resposta:
+                for elemento in extrator.alimentar(pedaco):
+                    try:
+                        yield evento_sse(_carregar_json(elemento), evento)
+                    except json.JSONDecodeError:
+                        logger.error(f"Elemento de '{chave}' não é um JSON válido.")
+            try:
+                yield evento_sse(_carregar_json(_sem_cercas_markdown(extrator.texto)), "fim")
+            except json.JSONDecodeError:
+                logger.error("Resposta da IA não é um JSON válido.")
+                yield evento_sse({"erro": "Resposta da IA inválida"}, "erro")
+        except Exception:
+            logger.exception("Falha durante o streaming da resposta da IA.")
+            yield evento_sse({"erro": "Falha ao gerar a resposta"}, "erro")
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if data.autoriza_dados:
-        contexto_loja = coletar_contexto_para_ia(data.dominio_loja)
 
+def _registrar_tokens_prompt(rotulo: str, messages: list[dict]):
+    # Estimativa local feita antes do envio; o valor real aparece depois nas métricas da OpenAI
+    tokens = estimar_tokens_mensagens(messages)
+    metricas.registro.observar("prompt_tokens_estimados", tokens, rotulo=rotulo)
+    logger.info(f"Tokens estimados do prompt ({rotulo}): {tokens}")
+
+
+def _carregar_json(texto: str):
+    with metricas.medir("json_parse"):
+        return json.loads(texto)
+
+
+def _sem_cercas_markdown(texto: str) -> str:
+    texto = texto.strip()
+    if texto.startswith("```"):
+        texto = texto.split("\n", 1)[1] if "\n" in texto else ""
+        texto = texto.rsplit("```", 1)[0]
+    return texto
+
+
+SYSTEM_PROMPT_PERSONAS = "Você é um especialista em marketing e comportamento do consumidor, especializado na criação de personas detalhadas, realistas e úteis para estratégias comerciais. Com base nas informações fornecidas sobre uma loja e um cliente, você poderá criar personas fictícias completas e coerentes. Você é atento a todos os detalhes sejam consistentes e plausíveis."
+
+
+def _mensagens_personas(data: PersonaRequest, contexto_loja: str) -> list[dict]:
     prompt = f"""
 Você é um assistente inteligente e simpático que ajuda lojistas a criar até 3 personas. 
 Com base nas informações fornecidas, gere até 3 personas e retorne as seguintes informações:
@@ -90,14 +215,44 @@ Deve retornar no json uma lista de personas e a estrutura deve exatamente esta:
 {contexto_loja}
 """
 
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_PERSONAS},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _contexto_personas(data: PersonaRequest, contexto_loja: str) -> str:
+    # Parte variável do prompt, que o roteamento usa para decidir se ele é pequeno
+    return f"{data.nome}\n{data.idade}\n{data.genero}\n{data.descricao}\n{contexto_loja}"
+
+
+@app.post("/generate_personas")
+async def generate_personas(data: PersonaRequest, stream: bool = False, cache: bool = True):
+    contexto_loja = ""
+
+    if data.autoriza_dados:
+        contexto_loja = await coletar_contexto_para_ia_async(data.dominio_loja)
+
+    messages = _mensagens_personas(data, contexto_loja)
+    _registrar_tokens_prompt("PERSONAS", messages)
+    if stream:
+        resposta = llm.chat_stream(
+            rotulo="PERSONAS",
+            usar_cache=cache,
+            rota="PERSONAS",
+            contexto=_contexto_personas(data, contexto_loja),
+            messages=messages,
+            temperature=0.8,
+        )
+        return _resposta_sse(resposta, "personas", "persona")
+
     start_time = time.time()
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Você é um especialista em marketing e comportamento do consumidor, especializado na criação de personas detalhadas, realistas e úteis para estratégias comerciais. Com base nas informações fornecidas sobre uma loja e um cliente, você poderá criar personas fictícias completas e coerentes. Você é atento a todos os detalhes sejam consistentes e plausíveis."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=1000,
+    response = await llm.chat(
+        rotulo="PERSONAS",
+        usar_cache=cache,
+        rota="PERSONAS",
+        contexto=_contexto_personas(data, contexto_loja),
+        messages=messages,
         temperature=0.8,
     )
     end_time = time.time()
@@ -109,15 +264,13 @@ Deve retornar no json uma lista de personas e a estrutura deve exatamente esta:
     logger.info("------------------------------")
 
     try:
-        return json.loads(response.choices[0].message.content)
+        return _carregar_json(response.choices[0].message.content)
     except json.JSONDecodeError:
         logger.error("Resposta da IA não é um JSON válido.")
         return {"erro": "Resposta da IA inválida"}
 
-@app.post("/insights")
-def gerar_insights(data: InsightRequest):
-    contexto = coletar_contexto_para_ia(data.dominio_loja)
 
+def _mensagens_insights(contexto: str) -> list[dict]:
     prompt = f"""
 Com base nos dados de uma loja virtual brasileira apresentados abaixo, gere insights do tipo "Você sabia que...". As frases devem ser curtas, informativas e criadas a partir dos dados. Use percentual ao falar de proporção, valores em reais para preços, e dias da semana em português.
 Use informações de gênero, idade, produtos mais vendidos, ticket médio, dias da semana com mais vendas, campanhas, horário de pico, e outros dados relevantes.
@@ -137,14 +290,35 @@ Retorne a resposta diretamente no formato JSON, sem usar blocos de código markd
 {contexto}
 """
 
+    return [
+        {"role": "system", "content": "Você é um assistente de dados de e-commerce, especializado em insights para lojistas."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+@app.post("/insights")
+async def gerar_insights(data: InsightRequest, stream: bool = False, cache: bool = True):
+    contexto = await coletar_contexto_para_ia_async(data.dominio_loja)
+
+    messages = _mensagens_insights(contexto)
+    _registrar_tokens_prompt("INSIGHTS", messages)
+    if stream:
+        resposta = llm.chat_stream(
+            rotulo="INSIGHTS", usar_cache=cache, rota="INSIGHTS", contexto=contexto, messages=messages, temperature=0.7
+        )
+        return _resposta_sse(resposta, "insights", "insight")
+
+    return await _insights_llm(contexto, cache)
+
+
+async def _insights_llm(contexto: str, cache: bool = True) -> dict:
     start_time = time.time()
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Você é um assistente de dados de e-commerce, especializado em insights para lojistas."},
-            {"role": "user", "content": prompt},
-        ],
-                max_tokens=1000,
+    response = await llm.chat(
+        rotulo="INSIGHTS",
+        usar_cache=cache,
+        rota="INSIGHTS",
+        contexto=contexto,
+        messages=_mensagens_insights(contexto),
         temperature=0.7,
     )
     end_time = time.time()
@@ -156,22 +330,93 @@ Retorne a resposta diretamente no formato JSON, sem usar blocos de código markd
     logger.info("------------------------------")
 
     try:
-        return json.loads(response.choices[0].message.content)
+        return _carregar_json(response.choices[0].message.content)
     except json.JSONDecodeError:
         logger.error("Resposta da IA não é um JSON válido.")
         return {"erro": "Resposta da IA inválida"}
-    
-    
+
+
+async def _preaquecer_insights(dominio_loja: str):
+    # Mesmo prompt do /insights: a resposta fica no cache do llm.py para a próxima requisição
+    contexto = await coletar_contexto_para_ia_async(dominio_loja, forcar=True)
+    await _insights_llm(contexto)
+
+
+@app.post("/insights/batch")
+async def gerar_insights_em_lote(data: InsightBatchRequest, cache: bool = True):
+    dominios = list(dict.fromkeys(data.dominios_loja))[:INSIGHTS_LOTE_MAX]
+
+    async def eventos():
+        inicio = time.time()
+        try:
+            contextos = await coletar_contextos_para_ia_async(dominios)
+        except Exception:
+            logger.exception("Falha ao coletar os contextos do lote.")
+            yield evento_sse({"erro": "Falha ao consultar as lojas"}, "erro")
+            return
+
+        semaforo = asyncio.Semaphore(INSIGHTS_LOTE_CONCORRENCIA)
+
+        async def gerar(dominio_loja: str) -> dict:
+            contexto = contextos[dominio_loja]
+            if contexto in (MSG_LOJA_NAO_ENCONTRADA, MSG_SEM_PEDIDOS):
+                return {"dominio_loja": dominio_loja, "erro": contexto}
+            try:
+                # Lotes não passam na frente das requisições interativas
+                async with semaforo, admissao.segundo_plano():
+                    resultado = await _insights_llm(contexto, cache)
+            except Exception:
+                logger.exception(f"Falha ao gerar os insights de {dominio_loja}.")
+                resultado = {"erro": "Falha ao gerar a resposta"}
+            return {"dominio_loja": dominio_loja, **resultado}
+
+        # Cada loja é enviada assim que termina, na ordem de conclusão
+        tarefas = [asyncio.create_task(gerar(dominio_loja)) for dominio_loja in dominios]
+        erros = 0
+        try:
+            for proxima in asyncio.as_completed(tarefas):
+                resultado = await proxima
+                erros += "erro" in resultado
+                yield evento_sse(resultado, "loja")
+        finally:
+            # Cliente desconectou: não gasta tokens com as lojas que faltam
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+        logger.info(f"Insights em lote: {len(dominios)} lojas em {round(time.time() - inicio, 2)} segundos ({erros} com erro).")
+        yield evento_sse({"lojas": len(dominios), "erros": erros}, "fim")
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _produtos_relevantes(conta, contexto) -> list[dict]:
+    # Do catálogo local: os mais vendidos nos pedidos da janela (contados na coleta do contexto),
+    # sem consultar o banco a cada chamada
+    if catalogo is None:
+        return await fetch_all_async(GET_PRODUTOS_LOJA, (conta.conta_id,))
+    return await catalogo.relevantes_async(conta.conta_id, contexto[1])
+
+
 @app.post("/improve_products")
-async def melhorar_produtos(data: InsightRequest):
-    conta_id = fetch_one(GET_CONTA_ID_POR_DOMINIO.format(dominio=data.dominio_loja))
-    if not conta_id:
+async def melhorar_produtos(data: InsightRequest, cache: bool = True):
+    # Os pedidos são lidos uma única vez, na coleta do contexto, que também devolve as vendas por produto
+    plano = Plano("melhorias")
+    plano.etapa("conta", lambda: resolvedor.resolver_async(data.dominio_loja))
+    plano.etapa("contexto", lambda conta: coletar_contexto_e_vendas_async(data.dominio_loja), depende=("conta",))
+    plano.etapa("produtos", _produtos_relevantes, depende=("conta", "contexto"))
+    resultados = await plano.executar()
+    if not resultados["conta"]:
         return {"erro": "Domínio não encontrado."}
 
-    produtos = fetch_all(GET_PRODUTOS_LOJA.format(conta_id=conta_id))
+    produtos = resultados["produtos"]
     print(produtos)
-    contexto = coletar_contexto_para_ia(data.dominio_loja)
+    contexto = resultados["contexto"][0]
     print(contexto)
+    tabela_produtos = formatar_produtos_para_prompt(produtos)
 
     prompt = f"""
 Com base nas personas e nos dados abaixo, analise os produtos e sugira melhorias que podem aumentar o interesse dos consumidores. Avalie nomes, preços, categorias, títulos e descrições SEO.
@@ -189,22 +434,27 @@ Retorne em formato JSON com a estrutura:
 Personas e contexto:
 {contexto}
 
-Produtos da loja:
-{json.dumps(produtos, indent=2, ensure_ascii=False)}
+Produtos da loja (vendas_30d: unidades vendidas nos últimos 30 dias):
+{tabela_produtos}
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Você é um assistente de e-commerce que sugere melhorias com base em perfis de clientes."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=1500,
+    messages = [
+        {"role": "system", "content": "Você é um assistente de e-commerce que sugere melhorias com base em perfis de clientes."},
+        {"role": "user", "content": prompt},
+    ]
+    _registrar_tokens_prompt("MELHORIAS", messages)
+
+    response = await llm.chat(
+        rotulo="MELHORIAS",
+        usar_cache=cache,
+        rota="MELHORIAS",
+        contexto=f"{contexto}\n{tabela_produtos}",
+        messages=messages,
         temperature=0.7,
     )
 
     try:
-        return json.loads(response.choices[0].message.content)
+        return _carregar_json(response.choices[0].message.content)
     except json.JSONDecodeError:
         logger.error("Resposta da IA não é um JSON válido.")
         #return {"erro": "Resposta da IA inválida"}
@@ -212,14 +462,64 @@ Produtos da loja:
 
 @app.post("/transcribe_audio")
 async def transcribe_audio(file: UploadFile = File(...)):
-    contents = await file.read()
-    with open("temp_audio.wav", "wb") as audio_file:
-        audio_file.write(contents)
-
-    with open("temp_audio.wav", "rb") as f:
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=f
-        )
+    # O upload é lido direto do buffer da requisição, sem arquivo temporário compartilhado
+    transcricao = await transcrever_arquivo(file.file, file.content_type)
+    return {"transcription": transcricao}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas():
+    return PlainTextResponse(metricas.exportar_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/db/pool")
+def estatisticas_pool():
+    return pool_stats()
+
+
+@app.get("/db/consultas")
+def estatisticas_db_consultas():
+    return estatisticas_consultas()
+
+
+@app.get("/dominios/resolvedor")
+def estatisticas_resolvedor():
+    return resolvedor.estatisticas()
+
+
+@app.get("/preaquecimento")
+def estatisticas_preaquecimento():
+    return preaquecedor.estatisticas()
+
+
+@app.get("/coalescencia")
+def estatisticas_coalescencia():
+    return coalescencia.estatisticas()
+
+@app.get("/llm/rotas")
+def estatisticas_rotas_llm():
+    return llm.estatisticas_rotas()
+
+@app.get("/llm/admissao")
+def estatisticas_admissao_llm():
+    return llm.estatisticas_admissao()
+
+@app.get("/llm/cache")
+def estatisticas_cache_llm():
+    return llm.estatisticas_cache()
+
+
+@app.get("/catalogo")
+def estatisticas_catalogo():
+    return catalogo.estatisticas() if catalogo is not None else {"ativo": False}
+
+@app.get("/contexto/cache")
+def estatisticas_cache_contexto():
+    return contexto_cache.estatisticas()
+
 
-    return {"transcription": transcript.text}
+@app.delete("/contexto/cache/{dominio_loja}")
+def limpar_cache_contexto(dominio_loja: str):
+    invalidar_contexto(dominio_loja)
+    resolvedor.invalidar(dominio_loja)
+    return {"invalidado": dominio_loja}
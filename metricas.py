@@ -0,0 +1,209 @@
+# metricas.py
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Inclui o cabeçalho Server-Timing (e X-LLM-Tokens) nas respostas que não são streams
+METRICAS_CABECALHOS = os.getenv("METRICAS_CABECALHOS", "0") == "1"
+
+_BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+_BUCKETS_TOKENS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_METRICAS = {
+    # nome: (tipo, ajuda, rótulos, buckets)
+    "requisicao_segundos": ("histogram", "Duração das requisições HTTP.", ("rota", "metodo", "status"), _BUCKETS_SEGUNDOS),
+    "etapa_segundos": ("histogram", "Duração de cada etapa de uma requisição.", ("etapa", "detalhe"), _BUCKETS_SEGUNDOS),
+    "prompt_tokens_estimados": ("histogram", "Tokens do prompt estimados antes do envio.", ("rotulo",), _BUCKETS_TOKENS),
+    "llm_tokens_total": ("counter", "Tokens consumidos nas chamadas à OpenAI.", ("rotulo", "tipo"), None),
+    "llm_chamadas_total": ("counter", "Chamadas à OpenAI, inclusive as servidas do cache.", ("rotulo", "origem"), None),
+    "cache_total": ("counter", "Consultas aos caches em memória/disco.", ("cache", "resultado"), None),
+    "llm_fila_espera_segundos": ("histogram", "Espera na fila de admissão das chamadas à OpenAI.", ("prioridade",), _BUCKETS_SEGUNDOS),
+    "llm_fila_profundidade": ("gauge", "Chamadas à OpenAI aguardando admissão.", ("prioridade",), None),
+    "llm_tentativas_total": ("counter", "Resultado de cada tentativa de chamada à OpenAI.", ("rotulo", "resultado"), None),
+    "llm_rotas_total": ("counter", "Chamadas por rota (endpoint), modelo e resultado.", ("rota", "modelo", "resultado"), None),
+    "llm_rota_segundos": ("histogram", "Latência das chamadas à OpenAI por rota e modelo.", ("rota", "modelo"), _BUCKETS_SEGUNDOS),
+    "coalescencia_total": ("counter", "Chamadas que lideraram ou aproveitaram uma execução em andamento.", ("grupo", "resultado"), None),
+}
+
+
+class _Serie:
+    __slots__ = ("buckets", "contagens", "soma", "total")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets) if buckets else None
+        self.soma = 0.0
+        self.total = 0
+
+
+class RegistroMetricas:
+    """Contadores e histogramas em memória, exportados no formato texto do Prometheus."""
+
+    def __init__(self, prefixo: str = "persona_"):
+        self.prefixo = prefixo
+        self._series: dict[tuple, _Serie] = {}
+        self._lock = threading.Lock()
+
+    def _serie(self, nome: str, rotulos: dict) -> _Serie:
+        _, _, nomes_rotulos, buckets = _METRICAS[nome]
+        chave = (nome, *(str(rotulos.get(r, "")) for r in nomes_rotulos))
+        serie = self._series.get(chave)
+        if serie is None:
+            serie = self._series[chave] = _Serie(buckets)
+        return serie
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        with self._lock:
+            serie = self._serie(nome, rotulos)
+            serie.soma += valor
+            serie.total += 1
+            for i, limite in enumerate(serie.buckets):
+                if valor <= limite:
+                    serie.contagens[i] += 1
+                    break
+
+    def incrementar(self, nome: str, valor: float = 1, **rotulos):
+        with self._lock:
+            serie = self._serie(nome, rotulos)
+            serie.soma += valor
+            serie.total += 1
+
+    def definir(self, nome: str, valor: float, **rotulos):
+        with self._lock:
+            serie = self._serie(nome, rotulos)
+            serie.soma = valor
+            serie.total += 1
+
+    def exportar(self) -> str:
+        with self._lock:
+            series = sorted(self._series.items())
+            copias = [(chave, list(s.contagens or ()), s.soma, s.total) for chave, s in series]
+
+        linhas = []
+        atual = None
+        for chave, contagens, soma, total in copias:
+            nome, valores = chave[0], chave[1:]
+            tipo, ajuda, nomes_rotulos, buckets = _METRICAS[nome]
+            completo = self.prefixo + nome
+            if nome != atual:
+                linhas.append(f"# HELP {completo} {ajuda}")
+                linhas.append(f"# TYPE {completo} {tipo}")
+                atual = nome
+            rotulos = [f'{r}="{_escapar(v)}"' for r, v in zip(nomes_rotulos, valores)]
+            if tipo in ("counter", "gauge"):
+                linhas.append(f"{completo}{_rotulos(rotulos)} {_numero(soma)}")
+                continue
+            acumulado = 0
+            for limite, contagem in zip(buckets, contagens):
+                acumulado += contagem
+                le = 'le="%s"' % _numero(limite)
+                linhas.append(f"{completo}_bucket{_rotulos(rotulos + [le])} {acumulado}")
+            le = 'le="+Inf"'
+            linhas.append(f"{completo}_bucket{_rotulos(rotulos + [le])} {total}")
+            linhas.append(f"{completo}_sum{_rotulos(rotulos)} {_numero(soma)}")
+            linhas.append(f"{completo}_count{_rotulos(rotulos)} {total}")
+        return "\n".join(linhas) + "\n"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(rotulos: list[str]) -> str:
+    return "{" + ",".join(rotulos) + "}" if rotulos else ""
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+registro = RegistroMetricas()
+
+
+class Requisicao:
+    """Etapas, tokens e hits de cache de uma única requisição HTTP."""
+
+    def __init__(self, rota: str, metodo: str = ""):
+        self.rota = rota
+        self.metodo = metodo
+        self.status = 500
+        self.etapas: list[tuple[str, str, float]] = []
+        self.tokens = 0
+        self.hits_cache = 0
+        self._inicio = time.perf_counter()
+        self._fechada = False
+
+    def fechar(self):
+        # Registra a duração total uma única vez, quando o último byte da resposta sai
+        if self._fechada:
+            return
+        self._fechada = True
+        registro.observar(
+            "requisicao_segundos", time.perf_counter() - self._inicio, rota=self.rota, metodo=self.metodo, status=self.status
+        )
+
+    def server_timing(self) -> str:
+        # Soma as etapas repetidas (ex.: várias consultas ao banco) em uma só entrada
+        totais: dict[str, float] = {}
+        for etapa, _, segundos in self.etapas:
+            totais[etapa] = totais.get(etapa, 0.0) + segundos
+        return ", ".join(f"{etapa.replace('.', '_')};dur={round(1000 * segundos, 1)}" for etapa, segundos in totais.items())
+
+
+_requisicao_atual: contextvars.ContextVar[Requisicao | None] = contextvars.ContextVar("requisicao_atual", default=None)
+
+
+@contextmanager
+def requisicao(rota: str, metodo: str, fechar: bool = True):
+    """
+    Abre o registro de uma requisição; as etapas medidas dentro dela ficam associadas a ela.
+    Com fechar=False a duração só é registrada em `Requisicao.fechar()` (ex.: ao fim de um stream).
+    """
+    atual = Requisicao(rota, metodo)
+    token = _requisicao_atual.set(atual)
+    try:
+        yield atual
+    finally:
+        _requisicao_atual.reset(token)
+        if fechar:
+            atual.fechar()
+
+
+@contextmanager
+def medir(etapa: str, detalhe: str = ""):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio, detalhe)
+
+
+def registrar_etapa(etapa: str, segundos: float, detalhe: str = ""):
+    registro.observar("etapa_segundos", segundos, etapa=etapa, detalhe=detalhe)
+    atual = _requisicao_atual.get()
+    if atual is not None:
+        atual.etapas.append((etapa, detalhe, segundos))
+
+
+def registrar_tokens(rotulo: str, usage):
+    if usage is None:
+        return
+    registro.incrementar("llm_tokens_total", usage.prompt_tokens, rotulo=rotulo, tipo="prompt")
+    registro.incrementar("llm_tokens_total", usage.completion_tokens, rotulo=rotulo, tipo="completion")
+    atual = _requisicao_atual.get()
+    if atual is not None:
+        atual.tokens += usage.total_tokens
+
+
+def registrar_cache(cache: str, hit: bool):
+    registro.incrementar("cache_total", cache=cache, resultado="hit" if hit else "miss")
+    atual = _requisicao_atual.get()
+    if atual is not None and hit:
+        atual.hits_cache += 1
+
+
+def exportar_prometheus() -> str:
+    return registro.exportar()
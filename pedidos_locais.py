@@ -0,0 +1,237 @@
+# pedidos_locais.py
+
+import asyncio
+import datetime as dt
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+
+from db import fetch_table, fetch_table_async
+from queries import GET_PEDIDOS_NOVOS
+
+PEDIDOS_LOCAIS_DIR = os.getenv("PEDIDOS_LOCAIS_DIR", ".cache/pedidos")
+PEDIDOS_JANELA_DIAS = int(os.getenv("PEDIDOS_JANELA_DIAS", "30"))
+PEDIDOS_LIMITE = int(os.getenv("PEDIDOS_LIMITE", "500"))  # mesmo limite da GET_PEDIDOS_ULTIMOS_30_DIAS
+PEDIDOS_SYNC_INTERVALO = float(os.getenv("PEDIDOS_SYNC_INTERVALO", "60"))  # segundos entre consultas de delta
+PEDIDOS_MARGEM_SEGUNDOS = int(os.getenv("PEDIDOS_MARGEM_SEGUNDOS", "600"))  # pedidos gravados com atraso
+PEDIDOS_PAGINA = int(os.getenv("PEDIDOS_PAGINA", "2000"))  # pedidos por consulta ao sincronizar
+
+# Mesmas colunas retornadas por GET_PEDIDOS_ULTIMOS_30_DIAS / GET_PEDIDOS_NOVOS
+SCHEMA_PEDIDOS = pa.schema(
+    [
+        ("pedido_venda_id", pa.int64()),
+        ("data_pedido", pa.string()),
+        ("hora_pedido", pa.string()),
+        ("dia_semana_pedido", pa.string()),
+        ("cliente_id", pa.int64()),
+        ("cliente_nome", pa.string()),
+        ("cliente_data_nascimento", pa.date32()),
+        ("cliente_sexo", pa.string()),
+        ("pedido_venda_valor_desconto", pa.float64()),
+        ("pedido_venda_valor_subtotal", pa.float64()),
+        ("pedido_venda_utm_campaign", pa.string()),
+        ("produtos", pa.string()),
+        ("pedido_venda_endereco_cidade", pa.string()),
+        ("pedido_venda_endereco_estado", pa.string()),
+        ("pagamento_nome", pa.string()),
+    ]
+)
+
+_MARCA_INICIAL = (0, "1970-01-01 00:00:00")
+_CURSOR_INICIAL = (_MARCA_INICIAL[1], 0)
+
+
+def _normalizar(tabela: pa.Table) -> pa.Table:
+    # Garante o mesmo schema do arquivo local, seja qual for o tipo que o driver retornou
+    return tabela.select(SCHEMA_PEDIDOS.names).cast(SCHEMA_PEDIDOS)
+
+
+def _proximo_cursor(pagina: pa.Table, cursor: tuple) -> tuple | None:
+    """(data de criação, id) do último pedido da página, ou None se ela foi a última."""
+    if pagina.num_rows < PEDIDOS_PAGINA:
+        return None
+    ultimo = pagina.num_rows - 1
+    proximo = (
+        f"{pagina['data_pedido'][ultimo].as_py()} {pagina['hora_pedido'][ultimo].as_py()}",
+        int(pagina["pedido_venda_id"][ultimo].as_py()),
+    )
+    # Sem avanço (ex.: data com frações de segundo) a próxima página seria a mesma
+    return proximo if proximo != cursor else None
+
+
+def _sem_novidade(tabela: pa.Table, delta: pa.Table) -> bool:
+    # A margem de PEDIDOS_MARGEM_SEGUNDOS traz de volta os pedidos mais recentes a cada sincronização
+    if not delta.num_rows:
+        return True
+    if not tabela.num_rows:
+        return False
+    existentes = tabela.filter(pc.is_in(tabela["pedido_venda_id"], value_set=delta["pedido_venda_id"]))
+    if existentes.num_rows != delta.num_rows:
+        return False
+    ordem = [("pedido_venda_id", "ascending")]
+    return existentes.replace_schema_metadata(None).sort_by(ordem).equals(delta.sort_by(ordem))
+
+
+def _juntar_paginas(paginas: list[pa.Table]) -> pa.Table:
+    return pa.concat_tables([_normalizar(pagina) for pagina in paginas])
+
+
+class ArmazemPedidos:
+    """
+    Cópia local, em Arrow IPC mapeado em memória, dos pedidos da janela de 30 dias de cada conta.
+
+    Cada sincronização busca apenas os pedidos posteriores à marca d'água
+    (pedido_venda_id e data de criação) e descarta as linhas que saíram da janela.
+    """
+
+    def __init__(self, diretorio: str = PEDIDOS_LOCAIS_DIR, janela_dias: int = PEDIDOS_JANELA_DIAS):
+        self.diretorio = diretorio
+        self.janela_dias = janela_dias
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        # Um threading.Lock por conta serializa os caminhos síncrono e assíncrono; o asyncio.Lock
+        # só evita ocupar uma thread por corrotina enquanto elas esperam a vez
+        self._locks: dict[int, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._locks_async: dict[int, asyncio.Lock] = {}
+        self._ultima_sync: dict[int, float] = {}
+
+    def _caminho(self, conta_id: int) -> str:
+        return os.path.join(self.diretorio, f"{conta_id}.arrow")
+
+    def _lock(self, conta_id: int) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(conta_id, threading.Lock())
+
+    def ler(self, conta_id: int) -> pa.Table | None:
+        caminho = self._caminho(conta_id)
+        if not os.path.exists(caminho):
+            return None
+        return pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+
+    def _marca(self, tabela: pa.Table | None) -> tuple:
+        metadata = (tabela.schema.metadata or {}) if tabela is not None else {}
+        if b"marca_id" not in metadata:
+            return _MARCA_INICIAL
+        marca_data = dt.datetime.fromisoformat(metadata[b"marca_data"].decode())
+        marca_data -= dt.timedelta(seconds=PEDIDOS_MARGEM_SEGUNDOS)
+        return int(metadata[b"marca_id"]), marca_data.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _aplicar_delta(self, conta_id: int, tabela: pa.Table | None, delta: pa.Table) -> pa.Table:
+        novos = _normalizar(delta)
+        limite = (dt.date.today() - dt.timedelta(days=self.janela_dias)).isoformat()
+        mais_antigo = pc.min(tabela["data_pedido"]).as_py() if tabela is not None else None
+        if tabela is not None and _sem_novidade(tabela, novos) and (mais_antigo is None or mais_antigo >= limite):
+            # Nada novo e nada saiu da janela: o arquivo atual continua valendo
+            self._ultima_sync[conta_id] = time.monotonic()
+            return tabela
+        if tabela is not None:
+            tabela = tabela.replace_schema_metadata(None)
+            if novos.num_rows:
+                # Pedidos que voltaram no delta substituem a versão anterior
+                repetidos = pc.is_in(tabela["pedido_venda_id"], value_set=novos["pedido_venda_id"])
+                tabela = tabela.filter(pc.invert(repetidos))
+            novos = pa.concat_tables([novos, tabela])
+
+        novos = novos.filter(pc.greater_equal(novos["data_pedido"], limite))
+        novos = novos.sort_by([("pedido_venda_id", "descending")])
+
+        if novos.num_rows:
+            momentos = pc.binary_join_element_wise(novos["data_pedido"], novos["hora_pedido"], " ")
+            marca_id = pc.max(novos["pedido_venda_id"]).as_py()
+            marca_data = pc.max(momentos).as_py()
+        else:
+            marca_id, marca_data = _MARCA_INICIAL
+        novos = novos.replace_schema_metadata({"marca_id": str(marca_id), "marca_data": marca_data})
+
+        # Grava em um arquivo temporário e troca de forma atômica para não afetar leitores
+        caminho = self._caminho(conta_id)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(temporario, "wb") as arquivo:
+            with pa.ipc.new_file(arquivo, novos.schema) as writer:
+                writer.write_table(novos)
+        os.replace(temporario, caminho)
+        self._ultima_sync[conta_id] = time.monotonic()
+        return novos
+
+    def _precisa_sincronizar(self, conta_id: int, tabela: pa.Table | None) -> bool:
+        if tabela is None:
+            return True
+        return time.monotonic() - self._ultima_sync.get(conta_id, 0.0) > PEDIDOS_SYNC_INTERVALO
+
+    def _buscar_delta(self, conta_id: int, tabela: pa.Table | None) -> pa.Table:
+        # Paginado: a primeira sincronização traz a janela inteira, em páginas de PEDIDOS_PAGINA
+        marca = self._marca(tabela)
+        paginas, cursor = [], _CURSOR_INICIAL
+        while cursor is not None:
+            pagina = fetch_table(GET_PEDIDOS_NOVOS, (conta_id, *marca, cursor[0], *cursor, PEDIDOS_PAGINA))
+            paginas.append(pagina)
+            cursor = _proximo_cursor(pagina, cursor)
+        return _juntar_paginas(paginas)
+
+    async def _buscar_delta_async(self, conta_id: int, tabela: pa.Table | None) -> pa.Table:
+        marca = self._marca(tabela)
+        paginas, cursor = [], _CURSOR_INICIAL
+        while cursor is not None:
+            pagina = await fetch_table_async(GET_PEDIDOS_NOVOS, (conta_id, *marca, cursor[0], *cursor, PEDIDOS_PAGINA))
+            paginas.append(pagina)
+            cursor = _proximo_cursor(pagina, cursor)
+        return _juntar_paginas(paginas)
+
+    def sincronizar(self, conta_id: int, forcar: bool = False) -> pa.Table:
+        with self._lock(conta_id):
+            tabela = self.ler(conta_id)
+            if not forcar and not self._precisa_sincronizar(conta_id, tabela):
+                return tabela
+            return self._aplicar_delta(conta_id, tabela, self._buscar_delta(conta_id, tabela))
+
+    async def sincronizar_async(self, conta_id: int, forcar: bool = False) -> pa.Table:
+        async with self._locks_async.setdefault(conta_id, asyncio.Lock()):
+            lock = self._lock(conta_id)
+            await _adquirir(lock)
+            try:
+                tabela = await asyncio.to_thread(self.ler, conta_id)
+                if not forcar and not self._precisa_sincronizar(conta_id, tabela):
+                    return tabela
+                delta = await self._buscar_delta_async(conta_id, tabela)
+                return await asyncio.to_thread(self._aplicar_delta, conta_id, tabela, delta)
+            finally:
+                lock.release()
+
+    @staticmethod
+    def _para_dataframe(tabela: pa.Table, limite: int | None) -> pd.DataFrame:
+        if limite is not None:
+            tabela = tabela.slice(0, limite)
+        return tabela.replace_schema_metadata(None).to_pandas()
+
+    def pedidos(self, conta_id: int, limite: int | None = PEDIDOS_LIMITE) -> pd.DataFrame:
+        return self._para_dataframe(self.sincronizar(conta_id), limite)
+
+    async def pedidos_async(self, conta_id: int, limite: int | None = PEDIDOS_LIMITE) -> pd.DataFrame:
+        tabela = await self.sincronizar_async(conta_id)
+        return await asyncio.to_thread(self._para_dataframe, tabela, limite)
+
+    def remover(self, conta_id: int):
+        self._ultima_sync.pop(conta_id, None)
+        try:
+            os.remove(self._caminho(conta_id))
+        except FileNotFoundError:
+            pass
+
+
+async def _adquirir(lock: threading.Lock):
+    """Adquire um threading.Lock sem bloquear o event loop."""
+    if lock.acquire(blocking=False):
+        return
+    tentativa = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+    try:
+        await asyncio.shield(tentativa)
+    except asyncio.CancelledError:
+        # A thread ainda vai conseguir a trava: devolve assim que conseguir
+        tentativa.add_done_callback(lambda t: t.cancelled() or not t.result() or lock.release())
+        raise
@@ -0,0 +1,319 @@
+# personas_lote.py
+#
+# Geração de personas em lote, para muitas lojas de uma vez (ex.: de madrugada):
+#
+#   python personas_lote.py lojas.jsonl .cache/personas/saida.jsonl --concorrencia 8
+#   python personas_lote.py lojas.csv .cache/personas/saida.jsonl --modo paralelo --relatorio relatorio.json
+#
+# Cada item da entrada é um PersonaRequest: uma linha JSON (.jsonl) ou uma linha de CSV com
+# as mesmas colunas. A saída recebe uma linha JSON por item assim que ele termina e é também
+# o checkpoint: rodando de novo com a mesma saída, os itens já concluídos são pulados e os que
+# falharam são refeitos (a não ser com --sem-refazer-falhas).
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from admissao import segundo_plano
+from generate_persona import PersonaRequest, generate_personas_com_usage
+
+logger = logging.getLogger("uvicorn")
+
+PERSONAS_LOTE_CONCORRENCIA = int(os.getenv("PERSONAS_LOTE_CONCORRENCIA", "8"))
+PERSONAS_LOTE_TIMEOUT = float(os.getenv("PERSONAS_LOTE_TIMEOUT", "300"))  # segundos por item; 0 desliga
+PERSONAS_LOTE_PROGRESSO = float(os.getenv("PERSONAS_LOTE_PROGRESSO", "30"))  # segundos entre linhas de progresso
+
+
+def chave_item(dados) -> str:
+    """Identifica o item no checkpoint pelo conteúdo, então reordenar a entrada não repete nada."""
+    texto = json.dumps(dados, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def _formato(caminho: str, formato: str | None) -> str:
+    if formato:
+        return formato
+    return "csv" if caminho.lower().endswith(".csv") else "jsonl"
+
+
+def ler_entrada(caminho: str, formato: str | None = None):
+    """Gera (número da linha, dados) de cada item; linhas que não são JSON válido viram texto."""
+    with open(caminho, newline="", encoding="utf-8") as arquivo:
+        if _formato(caminho, formato) == "csv":
+            leitor = csv.DictReader(arquivo)
+            for linha in leitor:
+                # Células vazias ficam de fora para valerem os padrões do PersonaRequest (ex.: modo)
+                yield leitor.line_num, {k: v for k, v in linha.items() if k and v not in ("", None)}
+            return
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                yield numero, json.loads(linha)
+            except json.JSONDecodeError:
+                yield numero, linha.strip()
+
+
+def ler_checkpoint(caminho: str) -> tuple[set[str], set[str]]:
+    """
+    Chaves dos itens concluídos e dos que falharam em execuções anteriores.
+
+    Uma última linha sem "\\n" é de uma gravação interrompida: é descartada do arquivo.
+    """
+    concluidos: set[str] = set()
+    falhas: set[str] = set()
+    if not os.path.exists(caminho):
+        return concluidos, falhas
+    with open(caminho, "rb+") as arquivo:
+        conteudo = arquivo.read()
+        fim = conteudo.rfind(b"\n") + 1
+        if fim < len(conteudo):
+            logger.warning(f"Checkpoint {caminho}: descartando a última linha, gravada pela metade.")
+            arquivo.truncate(fim)
+    for linha in conteudo[:fim].splitlines():
+        try:
+            registro = json.loads(linha)
+        except json.JSONDecodeError:
+            continue
+        if "erro" in registro:
+            falhas.add(registro["chave"])
+        else:
+            concluidos.add(registro["chave"])
+    return concluidos, falhas - concluidos
+
+
+class LotePersonas:
+    """
+    Gera as personas de cada item da entrada com no máximo `concorrencia` itens ao mesmo tempo,
+    gravando cada resultado (ModelOutput) ou erro na saída assim que o item termina.
+
+    As chamadas à IA entram como segundo plano no controle de admissão (admissao.py), que
+    também segura o ritmo quando a OpenAI responde 429.
+    """
+
+    def __init__(
+        self,
+        entrada: str,
+        saida: str,
+        formato: str | None = None,
+        concorrencia: int = PERSONAS_LOTE_CONCORRENCIA,
+        timeout: float = PERSONAS_LOTE_TIMEOUT,
+        modo: str | None = None,
+        usar_cache: bool = True,
+        refazer_falhas: bool = True,
+        limite: int | None = None,
+    ):
+        self.entrada = entrada
+        self.saida = saida
+        self.formato = formato
+        self.concorrencia = max(1, concorrencia)
+        self.timeout = timeout
+        self.modo = modo
+        self.usar_cache = usar_cache
+        self.refazer_falhas = refazer_falhas
+        self.limite = limite
+
+        self._arquivo = None
+        self._inicio = 0.0
+        self._latencias: list[float] = []
+
+        self.lidos = 0
+        self.pulados = 0
+        self.repetidos = 0  # mesmo item mais de uma vez na entrada
+        self.ok = 0
+        self.falhas: dict[str, int] = {}
+        self.tokens = {"prompt": 0, "completion": 0, "total": 0}
+
+    @property
+    def processados(self) -> int:
+        return self.ok + sum(self.falhas.values())
+
+    def _gravar(self, registro: dict):
+        self._arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+
+    async def _processar(self, numero: int, dados, chave: str):
+        dominio = dados.get("dominio_loja") if isinstance(dados, dict) else None
+        registro = {"linha": numero, "chave": chave, "dominio_loja": dominio}
+        inicio = time.perf_counter()
+        tipo = None
+        try:
+            req = PersonaRequest.model_validate(dados)
+            if self.modo:
+                req.modo = self.modo
+            mensagem, usage = await asyncio.wait_for(
+                generate_personas_com_usage(req, usar_cache=self.usar_cache), self.timeout or None
+            )
+        except ValidationError as erro:
+            tipo, registro["erro"] = "invalido", str(erro)
+        except asyncio.TimeoutError:
+            tipo, registro["erro"] = "timeout", f"Passou de {self.timeout} segundos."
+        except Exception as erro:
+            logger.exception(f"Falha ao gerar as personas da linha {numero}.")
+            tipo, registro["erro"] = type(erro).__name__, str(erro)
+        else:
+            if usage is not None:
+                registro["tokens"] = usage.total_tokens
+                self.tokens["prompt"] += usage.prompt_tokens
+                self.tokens["completion"] += usage.completion_tokens
+                self.tokens["total"] += usage.total_tokens
+            if mensagem.parsed is None:
+                tipo, registro["erro"] = "sem_resultado", f"A IA não retornou as personas: {mensagem.refusal}"
+            else:
+                registro["resultado"] = mensagem.parsed.model_dump()
+
+        segundos = time.perf_counter() - inicio
+        registro["segundos"] = round(segundos, 3)
+        self._gravar(registro)
+        if tipo is None:
+            self.ok += 1
+            self._latencias.append(segundos)
+        else:
+            self.falhas[tipo] = self.falhas.get(tipo, 0) + 1
+            logger.warning(f"Linha {numero} ({dominio}): {tipo}.")
+
+    async def _trabalhar(self, fila: asyncio.Queue):
+        while True:
+            item = await fila.get()
+            try:
+                if item is None:
+                    return
+                await self._processar(*item)
+            finally:
+                fila.task_done()
+
+    async def _mostrar_progresso(self):
+        while True:
+            await asyncio.sleep(PERSONAS_LOTE_PROGRESSO)
+            print(self._linha_progresso(), flush=True)
+
+    def _linha_progresso(self) -> str:
+        minutos = (time.monotonic() - self._inicio) / 60
+        return (
+            f"[lote] {self.processados} processados ({self.ok} ok, {sum(self.falhas.values())} falhas), "
+            f"{self.pulados} pulados, {round(self.processados / minutos, 1) if minutos else 0} itens/min, "
+            f"{self.tokens['total']} tokens"
+        )
+
+    async def executar(self) -> dict:
+        concluidos, falhas_anteriores = await asyncio.to_thread(ler_checkpoint, self.saida)
+        if concluidos or falhas_anteriores:
+            print(f"[lote] retomando {self.saida}: {len(concluidos)} concluídos, {len(falhas_anteriores)} com falha.", flush=True)
+        pular = concluidos if self.refazer_falhas else concluidos | falhas_anteriores
+
+        pasta = os.path.dirname(self.saida)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._inicio = time.monotonic()
+        fila: asyncio.Queue = asyncio.Queue(maxsize=2 * self.concorrencia)
+        with open(self.saida, "a", encoding="utf-8") as self._arquivo, segundo_plano():
+            trabalhadores = [asyncio.create_task(self._trabalhar(fila)) for _ in range(self.concorrencia)]
+            progresso = asyncio.create_task(self._mostrar_progresso())
+            try:
+                vistos: set[str] = set()
+                for numero, dados in ler_entrada(self.entrada, self.formato):
+                    if self.limite is not None and self.lidos >= self.limite:
+                        break
+                    self.lidos += 1
+                    chave = chave_item(dados)
+                    if chave in pular:
+                        self.pulados += 1
+                        continue
+                    if chave in vistos:
+                        self.repetidos += 1
+                        continue
+                    vistos.add(chave)
+                    await fila.put((numero, dados, chave))
+                for _ in trabalhadores:
+                    await fila.put(None)
+                await asyncio.gather(*trabalhadores)
+            finally:
+                # Interrompido (Ctrl+C): o que já foi gravado fica no checkpoint
+                progresso.cancel()
+                for tarefa in trabalhadores:
+                    tarefa.cancel()
+                await asyncio.gather(progresso, *trabalhadores, return_exceptions=True)
+                self._arquivo = None
+        return self.relatorio()
+
+    def relatorio(self) -> dict:
+        segundos = time.monotonic() - self._inicio if self._inicio else 0.0
+        latencias = np.array(self._latencias)
+        return {
+            "entrada": self.entrada,
+            "saida": self.saida,
+            "lidos": self.lidos,
+            "pulados": self.pulados,
+            "repetidos": self.repetidos,
+            "processados": self.processados,
+            "ok": self.ok,
+            "falhas": sum(self.falhas.values()),
+            "falhas_por_tipo": dict(sorted(self.falhas.items())),
+            "segundos": round(segundos, 2),
+            "itens_por_minuto": round(60 * self.processados / segundos, 2) if segundos else 0.0,
+            "tokens": self.tokens,
+            "tokens_por_segundo": round(self.tokens["total"] / segundos, 1) if segundos else 0.0,
+            "tokens_por_item": round(self.tokens["total"] / self.ok) if self.ok else 0,
+            "p50_segundos": round(float(np.percentile(latencias, 50)), 3) if len(latencias) else None,
+            "p95_segundos": round(float(np.percentile(latencias, 95)), 3) if len(latencias) else None,
+        }
+
+
+def _argumentos(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Gera personas em lote a partir de PersonaRequests em JSONL ou CSV.")
+    parser.add_argument("entrada", help="Arquivo .jsonl ou .csv com um PersonaRequest por linha.")
+    parser.add_argument("saida", help="Arquivo .jsonl de resultados; também é o checkpoint para retomar.")
+    parser.add_argument("--formato", choices=("jsonl", "csv"), help="Padrão: pela extensão da entrada.")
+    parser.add_argument("--concorrencia", type=int, default=PERSONAS_LOTE_CONCORRENCIA)
+    parser.add_argument("--timeout", type=float, default=PERSONAS_LOTE_TIMEOUT, help="Segundos por item (0 desliga).")
+    parser.add_argument("--modo", choices=("unico", "paralelo"), help="Sobrepõe o modo de cada item.")
+    parser.add_argument("--sem-cache", action="store_true", help="Não usa o cache de respostas da IA.")
+    parser.add_argument("--sem-refazer-falhas", action="store_true", help="Também pula os itens que falharam antes.")
+    parser.add_argument("--limite", type=int, help="Processa só os primeiros N itens da entrada.")
+    parser.add_argument("--relatorio", help="Grava o relatório final em JSON neste arquivo.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    args = _argumentos(argv)
+    lote = LotePersonas(
+        args.entrada,
+        args.saida,
+        formato=args.formato,
+        concorrencia=args.concorrencia,
+        timeout=args.timeout,
+        modo=args.modo,
+        usar_cache=not args.sem_cache,
+        refazer_falhas=not args.sem_refazer_falhas,
+        limite=args.limite,
+    )
+    interrompido = False
+    try:
+        relatorio = asyncio.run(lote.executar())
+    except KeyboardInterrupt:
+        interrompido = True
+        relatorio = {**lote.relatorio(), "interrompido": True}
+    texto = json.dumps(relatorio, indent=4, ensure_ascii=False)
+    print(texto)
+    if args.relatorio:
+        with open(args.relatorio, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto + "\n")
+    if interrompido:
+        return 130
+    return 1 if relatorio["falhas"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+# plano.py
+
+import asyncio
+
+import metricas
+
+
+class Plano:
+    """
+    Plano de execução de etapas assíncronas com dependências entre elas.
+
+    Cada etapa começa assim que as suas dependências terminam, então etapas independentes
+    rodam ao mesmo tempo e a latência total é a do caminho mais longo, não a soma de todas.
+    A função de uma etapa recebe os resultados das dependências como argumentos nomeados.
+
+    Se uma dependência de `depende` resultar em None (ex.: loja não encontrada), a etapa é
+    pulada e também resulta em None; as de `opcionais` são passadas mesmo quando None.
+    Se uma etapa falhar, as demais são canceladas e a exceção é propagada.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._etapas: dict[str, tuple] = {}
+
+    def etapa(self, nome: str, funcao, depende: tuple[str, ...] = (), opcionais: tuple[str, ...] = ()) -> "Plano":
+        # Dependências precisam ser declaradas antes, o que também impede ciclos
+        for dependencia in (*depende, *opcionais):
+            if dependencia not in self._etapas:
+                raise ValueError(f"Etapa '{nome}' depende de '{dependencia}', que não foi declarada antes.")
+        self._etapas[nome] = (funcao, depende, opcionais)
+        return self
+
+    async def executar(self) -> dict:
+        tarefas: dict[str, asyncio.Task] = {}
+
+        async def rodar(nome: str):
+            funcao, depende, opcionais = self._etapas[nome]
+            argumentos = {dependencia: await tarefas[dependencia] for dependencia in (*depende, *opcionais)}
+            if any(argumentos[dependencia] is None for dependencia in depende):
+                return None
+            with metricas.medir("plano", f"{self.nome}.{nome}"):
+                return await funcao(**argumentos)
+
+        for nome in self._etapas:
+            tarefas[nome] = asyncio.ensure_future(rodar(nome))
+        try:
+            await asyncio.gather(*tarefas.values())
+        except BaseException:
+            for tarefa in tarefas.values():
+                tarefa.cancel()
+            await asyncio.gather(*tarefas.values(), return_exceptions=True)
+            raise
+        return {nome: tarefa.result() for nome, tarefa in tarefas.items()}
@@ -0,0 +1,227 @@
+# preaquecimento.py
+
+import asyncio
+import fcntl
+import logging
+import os
+import random
+import time
+
+from admissao import segundo_plano
+from contexto_ia import MSG_LOJA_NAO_ENCONTRADA, MSG_SEM_PEDIDOS, coletar_contexto_para_ia_async, contexto_cache
+from db import fetch_all_async
+from queries import GET_CONTAS_MAIS_RECENTES
+
+logger = logging.getLogger("uvicorn")
+
+PREAQUECIMENTO_LOJAS = int(os.getenv("PREAQUECIMENTO_LOJAS", "50"))
+PREAQUECIMENTO_INTERVALO = float(os.getenv("PREAQUECIMENTO_INTERVALO", "900"))  # mesmo TTL padrão do contexto
+PREAQUECIMENTO_JITTER = float(os.getenv("PREAQUECIMENTO_JITTER", "0.1"))  # fração do intervalo
+PREAQUECIMENTO_CONCORRENCIA = int(os.getenv("PREAQUECIMENTO_CONCORRENCIA", "4"))
+PREAQUECIMENTO_ORCAMENTO = float(os.getenv("PREAQUECIMENTO_ORCAMENTO", "300"))  # segundos por ciclo
+PREAQUECIMENTO_TRAVA = os.getenv("PREAQUECIMENTO_TRAVA", ".cache/preaquecimento.lock")
+# Horas (início-fim, horário local) em que os /insights também são pré-calculados
+PREAQUECIMENTO_INSIGHTS_HORAS = os.getenv("PREAQUECIMENTO_INSIGHTS_HORAS", "1-6")
+
+
+def _faixa_horas(texto: str) -> tuple[int, int]:
+    inicio, fim = texto.split("-", 1)
+    return int(inicio), int(fim)
+
+
+def _fora_de_pico(faixa: tuple[int, int]) -> bool:
+    hora = time.localtime().tm_hour
+    inicio, fim = faixa
+    if inicio <= fim:
+        return inicio <= hora <= fim
+    return hora >= inicio or hora <= fim  # faixa que passa da meia-noite, ex.: 22-5
+
+
+class Preaquecedor:
+    """
+    Recalcula periodicamente, em segundo plano, o contexto das lojas com pedidos mais
+    recentes, para que a primeira requisição do lojista não pague o caminho frio.
+
+    Cada ciclo tem um orçamento de tempo: as lojas que não couberem nele ficam para o
+    próximo. Fora do horário de pico pode também pré-calcular os /insights (`insights`),
+    o que deixa a resposta no cache do llm.py.
+    """
+
+    def __init__(
+        self,
+        lojas: int = PREAQUECIMENTO_LOJAS,
+        intervalo: float = PREAQUECIMENTO_INTERVALO,
+        jitter: float = PREAQUECIMENTO_JITTER,
+        concorrencia: int = PREAQUECIMENTO_CONCORRENCIA,
+        orcamento: float = PREAQUECIMENTO_ORCAMENTO,
+        trava: str | None = PREAQUECIMENTO_TRAVA,
+    ):
+        self.lojas = lojas
+        self.intervalo = intervalo
+        self.jitter = jitter
+        self.concorrencia = concorrencia
+        self.orcamento = orcamento
+        # A trava entre workers só vale com o cache de contexto em disco (CONTEXTO_CACHE_CAMINHO):
+        # sem ele cada worker tem o próprio cache em memória e precisa aquecê-lo sozinho
+        self.trava = trava if contexto_cache.caminho else None
+        self.faixa_insights = _faixa_horas(PREAQUECIMENTO_INSIGHTS_HORAS)
+
+        self._insights = None
+        self._tarefa: asyncio.Task | None = None
+        self._status: dict[str, dict] = {}
+
+        self.ciclos = 0
+        self.ciclos_pulados = 0
+        self.ultimo_ciclo: dict | None = None
+
+    def _adquirir_trava(self):
+        # Com vários workers do uvicorn, só o que conseguir a trava do arquivo roda o ciclo.
+        # A trava só dura o ciclo, então o arquivo guarda também quando o último começou:
+        # se outro processo rodou há menos de um intervalo, este pula a vez.
+        if not self.trava:
+            return None
+        pasta = os.path.dirname(self.trava)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        arquivo = open(self.trava, "a+")
+        try:
+            fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            arquivo.close()
+            return False
+        arquivo.seek(0)
+        try:
+            ultimo = float(arquivo.read().strip() or 0)
+        except ValueError:
+            ultimo = 0.0
+        if time.time() - ultimo < self.intervalo * (1 - self.jitter):
+            arquivo.close()
+            return False
+        arquivo.seek(0)
+        arquivo.truncate()
+        arquivo.write(repr(time.time()))
+        arquivo.flush()
+        return arquivo
+
+    async def _lojas_recentes(self) -> list[str]:
+        linhas = await fetch_all_async(GET_CONTAS_MAIS_RECENTES, (self.lojas,))
+        return [linha["conta_loja_dominio"] for linha in linhas]
+
+    async def _aquecer(self, dominio: str, com_insights: bool) -> bool:
+        status = self._status.setdefault(dominio, {})
+        inicio = time.monotonic()
+        try:
+            # As chamadas à IA do pré-aquecimento esperam as das requisições interativas
+            with segundo_plano():
+                # O mesmo coletor (e chave de cache) que /generate_personas, /insights e /improve_products leem
+                contexto = await coletar_contexto_para_ia_async(dominio, forcar=True)
+                status["contexto_em"] = time.time()
+                if com_insights and contexto not in (MSG_LOJA_NAO_ENCONTRADA, MSG_SEM_PEDIDOS):
+                    await self._insights(dominio)
+                    status["insights_em"] = time.time()
+            status["erro"] = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Pré-aquecimento: falha ao atualizar {dominio}.")
+            status["erro"] = repr(e)
+        status["duracao"] = round(time.monotonic() - inicio, 3)
+        return status["erro"] is None
+
+    async def ciclo(self) -> dict:
+        # flock e leitura/escrita do arquivo são bloqueantes: rodam em uma thread
+        trava = await asyncio.to_thread(self._adquirir_trava)
+        if trava is False:
+            self.ciclos_pulados += 1
+            return {"pulado": True}
+
+        try:
+            inicio = time.monotonic()
+            prazo = inicio + self.orcamento
+            com_insights = self._insights is not None and _fora_de_pico(self.faixa_insights)
+            dominios = await self._lojas_recentes()
+            # O status mostra só as lojas que ainda estão entre as mais recentes
+            self._status = {dominio: self._status.get(dominio, {}) for dominio in dominios}
+            semaforo = asyncio.Semaphore(self.concorrencia)
+            atualizadas = erros = 0
+
+            async def aquecer(dominio: str):
+                nonlocal atualizadas, erros
+                async with semaforo:
+                    if time.monotonic() >= prazo:
+                        return
+                    if await self._aquecer(dominio, com_insights):
+                        atualizadas += 1
+                    else:
+                        erros += 1
+
+            tarefas = [asyncio.create_task(aquecer(dominio)) for dominio in dominios]
+            if tarefas:
+                _, pendentes = await asyncio.wait(tarefas, timeout=max(0.0, prazo - time.monotonic()))
+                for tarefa in pendentes:
+                    tarefa.cancel()
+                await asyncio.gather(*pendentes, return_exceptions=True)
+
+            self.ciclos += 1
+            self.ultimo_ciclo = {
+                "inicio": time.time() - (time.monotonic() - inicio),
+                "duracao": round(time.monotonic() - inicio, 3),
+                "lojas": len(dominios),
+                "atualizadas": atualizadas,
+                "erros": erros,
+                "fora_do_orcamento": len(dominios) - atualizadas - erros,
+                "insights": com_insights,
+            }
+            logger.info(
+                f"Pré-aquecimento: {atualizadas}/{len(dominios)} lojas em {self.ultimo_ciclo['duracao']} segundos."
+            )
+            return self.ultimo_ciclo
+        finally:
+            if trava:
+                await asyncio.to_thread(trava.close)
+
+    async def _loop(self):
+        # Começa depois de um atraso aleatório para que vários processos não sincronizem
+        await asyncio.sleep(random.uniform(0, self.jitter * self.intervalo))
+        while True:
+            try:
+                await self.ciclo()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Pré-aquecimento: falha no ciclo.")
+            espera = self.intervalo * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(0.0, espera))
+
+    def iniciar(self, insights=None):
+        """`insights`: corrotina opcional (dominio_loja) que pré-calcula os /insights da loja."""
+        if self._tarefa is not None and not self._tarefa.done():
+            return
+        self._insights = insights
+        self._tarefa = asyncio.create_task(self._loop(), name="preaquecimento")
+
+    async def parar(self):
+        if self._tarefa is None:
+            return
+        self._tarefa.cancel()
+        try:
+            await self._tarefa
+        except asyncio.CancelledError:
+            pass
+        self._tarefa = None
+
+    def estatisticas(self) -> dict:
+        return {
+            "ativo": self._tarefa is not None and not self._tarefa.done(),
+            "lojas": self.lojas,
+            "intervalo": self.intervalo,
+            "concorrencia": self.concorrencia,
+            "orcamento": self.orcamento,
+            "ciclos": self.ciclos,
+            "ciclos_pulados": self.ciclos_pulados,
+            "ultimo_ciclo": self.ultimo_ciclo,
+            "status_lojas": dict(self._status),
+        }
+
+
+preaquecedor = Preaquecedor()
@@ -1,5 +1,8 @@
 # queries.py
 
+# Todas as consultas usam parâmetros posicionais (?) em vez de str.format, para evitar
+# SQL injection e permitir que o texto da consulta seja preparado uma vez e reaproveitado.
+
 GET_PEDIDOS_ULTIMOS_30_DIAS = """
 SELECT
 	A.pedido_venda_id,
@@ -30,7 +33,7 @@ INNER JOIN lojaintegrada.configuracao_tb_pagamento E
 INNER JOIN lojaintegrada.cliente_tb_cliente F 
 	ON F.cliente_id = A.cliente_id
 WHERE
-	A.conta_id = {conta_id}
+	A.conta_id = ?
 	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
 GROUP BY
 	A.pedido_venda_id,
@@ -51,10 +54,72 @@ ORDER BY
 	A.pedido_venda_id DESC
 LIMIT 500;
 """
+# Pedidos novos desde a última sincronização do armazém local (pedidos_locais.py).
+# Com marca_id = 0 e marca_data antiga, traz a janela completa de 30 dias.
+# Paginada por (data de criação, pedido_venda_id): os parâmetros 4 a 6 são o último
+# pedido da página anterior (data, data, id) e o 7º é o tamanho da página.
+GET_PEDIDOS_NOVOS = """
+SELECT
+	A.pedido_venda_id,
+	DATE_FORMAT(A.pedido_venda_data_criacao, '%Y-%m-%d') AS data_pedido,
+	DATE_FORMAT(A.pedido_venda_data_criacao, '%H:%i:%s') AS hora_pedido,
+	DATE_FORMAT(A.pedido_venda_data_criacao, '%W') AS dia_semana_pedido,
+	A.cliente_id,
+	SUBSTRING_INDEX(F.cliente_nome, ' ', 1) as cliente_nome, 
+	F.cliente_data_nascimento,
+	F.cliente_sexo,
+	A.pedido_venda_valor_desconto,
+	A.pedido_venda_valor_subtotal,
+	A.pedido_venda_utm_campaign,
+	GROUP_CONCAT(B.pedido_venda_item_nome SEPARATOR ' | ') AS produtos,
+	C.pedido_venda_endereco_cidade,
+	C.pedido_venda_endereco_estado,
+	E.pagamento_nome
+FROM
+	lojaintegrada.pedido_tb_pedido_venda A
+INNER JOIN lojaintegrada.pedido_tb_pedido_venda_item B 
+	ON A.pedido_venda_id = B.pedido_venda_id
+INNER JOIN lojaintegrada.pedido_tb_pedido_venda_endereco C 
+	ON C.pedido_venda_endereco_id = A.pedido_venda_endereco_entrega_id 
+INNER JOIN lojaintegrada.pedido_tb_pedido_venda_pagamento D 
+	ON D.pedido_venda_id = A.pedido_venda_id 
+INNER JOIN lojaintegrada.configuracao_tb_pagamento E 
+	ON E.pagamento_id = D.pagamento_id 
+INNER JOIN lojaintegrada.cliente_tb_cliente F 
+	ON F.cliente_id = A.cliente_id
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+	AND (A.pedido_venda_id > ? OR A.pedido_venda_data_criacao >= ?)
+	AND (
+		A.pedido_venda_data_criacao > ?
+		OR (A.pedido_venda_data_criacao = ? AND A.pedido_venda_id > ?)
+	)
+GROUP BY
+	A.pedido_venda_id,
+	A.pedido_venda_data_criacao,
+	DATE_FORMAT(A.pedido_venda_data_criacao, '%H:%i:%s'),
+	DATE_FORMAT(A.pedido_venda_data_criacao, '%W'),
+	A.cliente_id,
+	F.cliente_nome,
+	F.cliente_data_nascimento,
+	F.cliente_sexo,
+	A.pedido_venda_valor_desconto,
+	A.pedido_venda_valor_subtotal,
+	A.pedido_venda_utm_campaign,
+	C.pedido_venda_endereco_cidade,
+	C.pedido_venda_endereco_estado,
+	E.pagamento_nome
+ORDER BY
+	A.pedido_venda_data_criacao,
+	A.pedido_venda_id
+LIMIT ?;
+"""
+
 GET_CONTA_ID_POR_DOMINIO = """
 SELECT conta_id
 FROM lojaintegrada.plataforma_tb_conta
-WHERE conta_loja_dominio = '{dominio}'
+WHERE conta_loja_dominio = ?
 LIMIT 1;
 """
 
@@ -63,7 +128,7 @@ SELECT tc.conta_id , tc.conta_loja_nome, tc.conta_loja_descricao, ta.atividade_n
 FROM lojaintegrada.plataforma_tb_conta tc
 LEFT JOIN lojaintegrada.plataforma_tb_conta_atividade tca ON tca.conta_id = tc.conta_id
 LEFT JOIN lojaintegrada.plataforma_tb_atividade ta ON ta.atividade_id = tca.atividade_id
-WHERE conta_loja_dominio = '{dominio}'
+WHERE conta_loja_dominio = ?
 LIMIT 1;
 """
 
@@ -88,6 +153,274 @@ inner join lojaintegrada.catalogo_tb_categoria E
 where
 	A.produto_tipo = 'normal' and
 	A.produto_ativo = true and
-	A.conta_id = {conta_id}
+	A.conta_id = ?
 limit 10;
 """
+
+# Catálogo completo (sem LIMIT), um produto por linha; o segundo parâmetro é o maior
+# produto_id já sincronizado (0 para carregar tudo)
+GET_CATALOGO_LOJA = """
+select
+	A.produto_id,
+	A.produto_nome,
+	B.produto_preco_cheio,
+	B.produto_preco_promocional,
+	GROUP_CONCAT(E.categoria_nome SEPARATOR ', ') as categorias,
+	C.seo_title,
+	C.seo_description
+from
+	lojaintegrada.catalogo_tb_produto A
+inner join lojaintegrada.catalogo_tb_produto_preco B on
+	B.produto_id = A.produto_id
+inner join lojaintegrada.marketing_tb_seo C on
+	C.seo_linha_id = A.produto_id
+inner join lojaintegrada.catalogo_tb_produto_categoria D
+	on D.produto_id = A.produto_id
+inner join lojaintegrada.catalogo_tb_categoria E
+	on E.categoria_id = D.categoria_id
+where
+	A.produto_tipo = 'normal' and
+	A.produto_ativo = true and
+	A.conta_id = ? and
+	A.produto_id > ?
+group by
+	A.produto_id,
+	A.produto_nome,
+	B.produto_preco_cheio,
+	B.produto_preco_promocional,
+	C.seo_title,
+	C.seo_description
+order by A.produto_id;
+"""
+
+# O resolvedor (resolvedor.py) procura o domínio já normalizado, em minúsculas: o valor
+# gravado também é comparado em minúsculas para lojas cadastradas com letras maiúsculas
+GET_DETALHES_CONTA_POR_VARIANTES_DOMINIO = """
+SELECT tc.conta_id , tc.conta_loja_nome, tc.conta_loja_descricao, ta.atividade_nome
+FROM lojaintegrada.plataforma_tb_conta tc
+LEFT JOIN lojaintegrada.plataforma_tb_conta_atividade tca ON tca.conta_id = tc.conta_id
+LEFT JOIN lojaintegrada.plataforma_tb_atividade ta ON ta.atividade_id = tca.atividade_id
+WHERE LOWER(conta_loja_dominio) IN (?, ?)
+LIMIT 1;
+"""
+
+# Contas com pedidos nos últimos 30 dias, usadas para pré-carregar o resolvedor de domínios
+GET_CONTAS_ATIVAS = """
+SELECT tc.conta_id, tc.conta_loja_dominio, tc.conta_loja_nome, tc.conta_loja_descricao, ta.atividade_nome
+FROM lojaintegrada.plataforma_tb_conta tc
+LEFT JOIN lojaintegrada.plataforma_tb_conta_atividade tca ON tca.conta_id = tc.conta_id
+LEFT JOIN lojaintegrada.plataforma_tb_atividade ta ON ta.atividade_id = tca.atividade_id
+WHERE tc.conta_loja_dominio IS NOT NULL
+	AND tc.conta_id IN (
+		SELECT DISTINCT conta_id
+		FROM lojaintegrada.pedido_tb_pedido_venda
+		WHERE pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+	);
+"""
+
+# Lojas com pedidos mais recentes, usadas pelo pré-aquecimento em segundo plano (preaquecimento.py)
+GET_CONTAS_MAIS_RECENTES = """
+SELECT tc.conta_id, tc.conta_loja_dominio, MAX(A.pedido_venda_data_criacao) AS ultimo_pedido
+FROM lojaintegrada.pedido_tb_pedido_venda A
+INNER JOIN lojaintegrada.plataforma_tb_conta tc
+	ON tc.conta_id = A.conta_id
+WHERE
+	A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+	AND tc.conta_loja_dominio IS NOT NULL
+GROUP BY tc.conta_id, tc.conta_loja_dominio
+ORDER BY ultimo_pedido DESC
+LIMIT ?;
+"""
+
+# Consultas em lote (/insights/batch). O número de marcadores do IN é fixo para que o texto
+# seja sempre o mesmo e possa ser preparado; lotes menores repetem o último valor.
+LOTE_DOMINIOS = 50  # cada domínio ocupa dois marcadores (com e sem www.)
+LOTE_CONTAS = 50
+
+GET_DETALHES_CONTAS_POR_DOMINIOS = f"""
+SELECT tc.conta_loja_dominio, tc.conta_id, tc.conta_loja_nome, tc.conta_loja_descricao, ta.atividade_nome
+FROM lojaintegrada.plataforma_tb_conta tc
+LEFT JOIN lojaintegrada.plataforma_tb_conta_atividade tca ON tca.conta_id = tc.conta_id
+LEFT JOIN lojaintegrada.plataforma_tb_atividade ta ON ta.atividade_id = tca.atividade_id
+WHERE LOWER(conta_loja_dominio) IN ({", ".join("?" * (2 * LOTE_DOMINIOS))});
+"""
+
+# Mesmas colunas da GET_PEDIDOS_ULTIMOS_30_DIAS mais o conta_id, com o limite de 500
+# pedidos aplicado por conta (ROW_NUMBER particionado) em vez de no resultado inteiro
+GET_PEDIDOS_ULTIMOS_30_DIAS_POR_CONTAS = f"""
+SELECT
+	P.conta_id,
+	P.pedido_venda_id,
+	P.data_pedido,
+	P.hora_pedido,
+	P.dia_semana_pedido,
+	P.cliente_id,
+	P.cliente_nome,
+	P.cliente_data_nascimento,
+	P.cliente_sexo,
+	P.pedido_venda_valor_desconto,
+	P.pedido_venda_valor_subtotal,
+	P.pedido_venda_utm_campaign,
+	P.produtos,
+	P.pedido_venda_endereco_cidade,
+	P.pedido_venda_endereco_estado,
+	P.pagamento_nome
+FROM (
+	SELECT
+		A.conta_id,
+		A.pedido_venda_id,
+		DATE_FORMAT(A.pedido_venda_data_criacao, '%Y-%m-%d') AS data_pedido,
+		DATE_FORMAT(A.pedido_venda_data_criacao, '%H:%i:%s') AS hora_pedido,
+		DATE_FORMAT(A.pedido_venda_data_criacao, '%W') AS dia_semana_pedido,
+		A.cliente_id,
+		SUBSTRING_INDEX(F.cliente_nome, ' ', 1) as cliente_nome,
+		F.cliente_data_nascimento,
+		F.cliente_sexo,
+		A.pedido_venda_valor_desconto,
+		A.pedido_venda_valor_subtotal,
+		A.pedido_venda_utm_campaign,
+		GROUP_CONCAT(B.pedido_venda_item_nome SEPARATOR ' | ') AS produtos,
+		C.pedido_venda_endereco_cidade,
+		C.pedido_venda_endereco_estado,
+		E.pagamento_nome,
+		ROW_NUMBER() OVER (PARTITION BY A.conta_id ORDER BY A.pedido_venda_id DESC) AS posicao
+	FROM
+		lojaintegrada.pedido_tb_pedido_venda A
+	INNER JOIN lojaintegrada.pedido_tb_pedido_venda_item B
+		ON A.pedido_venda_id = B.pedido_venda_id
+	INNER JOIN lojaintegrada.pedido_tb_pedido_venda_endereco C
+		ON C.pedido_venda_endereco_id = A.pedido_venda_endereco_entrega_id
+	INNER JOIN lojaintegrada.pedido_tb_pedido_venda_pagamento D
+		ON D.pedido_venda_id = A.pedido_venda_id
+	INNER JOIN lojaintegrada.configuracao_tb_pagamento E
+		ON E.pagamento_id = D.pagamento_id
+	INNER JOIN lojaintegrada.cliente_tb_cliente F
+		ON F.cliente_id = A.cliente_id
+	WHERE
+		A.conta_id IN ({", ".join("?" * LOTE_CONTAS)})
+		AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+	GROUP BY
+		A.conta_id,
+		A.pedido_venda_id,
+		A.pedido_venda_data_criacao,
+		DATE_FORMAT(A.pedido_venda_data_criacao, '%H:%i:%s'),
+		DATE_FORMAT(A.pedido_venda_data_criacao, '%W'),
+		A.cliente_id,
+		F.cliente_nome,
+		F.cliente_data_nascimento,
+		F.cliente_sexo,
+		A.pedido_venda_valor_desconto,
+		A.pedido_venda_valor_subtotal,
+		A.pedido_venda_utm_campaign,
+		C.pedido_venda_endereco_cidade,
+		C.pedido_venda_endereco_estado,
+		E.pagamento_nome
+) P
+WHERE P.posicao <= 500
+ORDER BY P.conta_id, P.pedido_venda_id DESC;
+"""
+
+# Agregados da persona calculados no StarRocks sobre toda a janela de 30 dias
+# (usados por analytics.gerar_insights_agregados; cada consulta retorna só o top-k)
+GET_AGREGADO_TICKET_MEDIO = """
+SELECT ROUND(AVG(A.pedido_venda_valor_subtotal), 2) AS ticket_medio
+FROM lojaintegrada.pedido_tb_pedido_venda A
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY);
+"""
+
+GET_AGREGADO_TOP_CLIENTES = """
+SELECT SUBSTRING_INDEX(F.cliente_nome, ' ', 1) AS valor, COUNT(*) AS total
+FROM lojaintegrada.pedido_tb_pedido_venda A
+INNER JOIN lojaintegrada.cliente_tb_cliente F
+	ON F.cliente_id = A.cliente_id
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+GROUP BY SUBSTRING_INDEX(F.cliente_nome, ' ', 1)
+ORDER BY total DESC
+LIMIT 3;
+"""
+
+GET_AGREGADO_TOP_PRODUTOS = """
+SELECT B.pedido_venda_item_nome AS valor, COUNT(*) AS total
+FROM lojaintegrada.pedido_tb_pedido_venda A
+INNER JOIN lojaintegrada.pedido_tb_pedido_venda_item B
+	ON A.pedido_venda_id = B.pedido_venda_id
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+GROUP BY B.pedido_venda_item_nome
+ORDER BY total DESC
+LIMIT 3;
+"""
+
+GET_AGREGADO_TOP_HORAS = """
+SELECT HOUR(A.pedido_venda_data_criacao) AS valor, COUNT(*) AS total
+FROM lojaintegrada.pedido_tb_pedido_venda A
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+GROUP BY HOUR(A.pedido_venda_data_criacao)
+ORDER BY total DESC
+LIMIT 3;
+"""
+
+GET_AGREGADO_TOP_DIAS = """
+SELECT DATE_FORMAT(A.pedido_venda_data_criacao, '%W') AS valor, COUNT(*) AS total
+FROM lojaintegrada.pedido_tb_pedido_venda A
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+GROUP BY DATE_FORMAT(A.pedido_venda_data_criacao, '%W')
+ORDER BY total DESC
+LIMIT 3;
+"""
+
+GET_AGREGADO_TOP_CAMPANHAS = """
+SELECT A.pedido_venda_utm_campaign AS valor, COUNT(*) AS total
+FROM lojaintegrada.pedido_tb_pedido_venda A
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+	AND A.pedido_venda_utm_campaign IS NOT NULL
+GROUP BY A.pedido_venda_utm_campaign
+ORDER BY total DESC
+LIMIT 3;
+"""
+
+GET_AGREGADO_GENERO = """
+SELECT F.cliente_sexo AS valor, COUNT(*) AS total
+FROM lojaintegrada.pedido_tb_pedido_venda A
+INNER JOIN lojaintegrada.cliente_tb_cliente F
+	ON F.cliente_id = A.cliente_id
+WHERE
+	A.conta_id = ?
+	AND A.pedido_venda_data_criacao >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+	AND F.cliente_sexo IS NOT NULL
+GROUP BY F.cliente_sexo
+ORDER BY total DESC;
+"""
+
+# Registro das consultas nomeadas usadas pelo db.py para estatísticas e cursores preparados
+CONSULTAS = {
+    "GET_PEDIDOS_ULTIMOS_30_DIAS": GET_PEDIDOS_ULTIMOS_30_DIAS,
+    "GET_PEDIDOS_NOVOS": GET_PEDIDOS_NOVOS,
+    "GET_CONTA_ID_POR_DOMINIO": GET_CONTA_ID_POR_DOMINIO,
+    "GET_DETALHES_CONTA_POR_DOMINIO": GET_DETALHES_CONTA_POR_DOMINIO,
+    "GET_PRODUTOS_LOJA": GET_PRODUTOS_LOJA,
+    "GET_CATALOGO_LOJA": GET_CATALOGO_LOJA,
+    "GET_DETALHES_CONTA_POR_VARIANTES_DOMINIO": GET_DETALHES_CONTA_POR_VARIANTES_DOMINIO,
+    "GET_CONTAS_ATIVAS": GET_CONTAS_ATIVAS,
+    "GET_CONTAS_MAIS_RECENTES": GET_CONTAS_MAIS_RECENTES,
+    "GET_DETALHES_CONTAS_POR_DOMINIOS": GET_DETALHES_CONTAS_POR_DOMINIOS,
+    "GET_PEDIDOS_ULTIMOS_30_DIAS_POR_CONTAS": GET_PEDIDOS_ULTIMOS_30_DIAS_POR_CONTAS,
+    "GET_AGREGADO_TICKET_MEDIO": GET_AGREGADO_TICKET_MEDIO,
+    "GET_AGREGADO_TOP_CLIENTES": GET_AGREGADO_TOP_CLIENTES,
+    "GET_AGREGADO_TOP_PRODUTOS": GET_AGREGADO_TOP_PRODUTOS,
+    "GET_AGREGADO_TOP_HORAS": GET_AGREGADO_TOP_HORAS,
+    "GET_AGREGADO_TOP_DIAS": GET_AGREGADO_TOP_DIAS,
+    "GET_AGREGADO_TOP_CAMPANHAS": GET_AGREGADO_TOP_CAMPANHAS,
+    "GET_AGREGADO_GENERO": GET_AGREGADO_GENERO,
+}
@@ -0,0 +1,215 @@
+# resolvedor.py
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import metricas
+from db import fetch_all, fetch_all_async, fetch_row, fetch_row_async
+from queries import (
+    GET_CONTAS_ATIVAS,
+    GET_DETALHES_CONTA_POR_VARIANTES_DOMINIO,
+    GET_DETALHES_CONTAS_POR_DOMINIOS,
+    LOTE_DOMINIOS,
+)
+
+logger = logging.getLogger("uvicorn")
+
+RESOLVEDOR_TTL_NEGATIVO = float(os.getenv("RESOLVEDOR_TTL_NEGATIVO", "300"))
+RESOLVEDOR_INTERVALO_ATUALIZACAO = float(os.getenv("RESOLVEDOR_INTERVALO_ATUALIZACAO", "3600"))
+
+
+class Conta(NamedTuple):
+    conta_id: int
+    loja_nome: str | None
+    descricao: str | None
+    atividade: str | None
+
+
+def normalizar_dominio(dominio: str) -> str:
+    # "HTTPS://WWW.Loja.com.br/produtos" -> "loja.com.br"
+    dominio = (dominio or "").strip().lower()
+    for prefixo in ("https://", "http://"):
+        if dominio.startswith(prefixo):
+            dominio = dominio[len(prefixo):]
+    for separador in ("/", "?", "#"):
+        dominio = dominio.split(separador, 1)[0]
+    dominio = dominio.rstrip(".")
+    if dominio.startswith("www."):
+        dominio = dominio[4:]
+    return dominio
+
+
+class ResolvedorDominios:
+    """
+    Índice em memória domínio -> Conta.
+
+    Pode ser pré-carregado com todas as contas ativas e atualizado em segundo plano;
+    domínios que não existem ficam em cache negativo por `ttl_negativo` segundos.
+    """
+
+    def __init__(self, ttl_negativo: float = RESOLVEDOR_TTL_NEGATIVO, intervalo_atualizacao: float = RESOLVEDOR_INTERVALO_ATUALIZACAO):
+        self.ttl_negativo = ttl_negativo
+        self.intervalo_atualizacao = intervalo_atualizacao
+
+        self._contas: dict[str, Conta] = {}
+        self._negativos: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.hits = 0
+        self.hits_negativos = 0
+        self.misses = 0
+        self.ultima_carga: float | None = None
+
+    def carregar_todas(self) -> int:
+        contas = {}
+        for linha in fetch_all(GET_CONTAS_ATIVAS):
+            dominio = normalizar_dominio(linha["conta_loja_dominio"])
+            if dominio and dominio not in contas:
+                contas[dominio] = Conta(
+                    linha["conta_id"],
+                    linha["conta_loja_nome"],
+                    linha["conta_loja_descricao"],
+                    linha["atividade_nome"],
+                )
+        with self._lock:
+            # Mantém contas resolvidas sob demanda que não estão na lista de ativas
+            self._contas = {**self._contas, **contas}
+            self._negativos.clear()
+            self.ultima_carga = time.time()
+        return len(contas)
+
+    def _da_memoria(self, dominio: str):
+        # Retorna (encontrado, conta); conta é None para domínios em cache negativo
+        with self._lock:
+            conta = self._contas.get(dominio)
+            if conta is not None:
+                self.hits += 1
+                return True, conta
+            expira_em = self._negativos.get(dominio)
+            if expira_em is not None:
+                if expira_em > time.monotonic():
+                    self.hits_negativos += 1
+                    return True, None
+                del self._negativos[dominio]
+            self.misses += 1
+        return False, None
+
+    def _registrar(self, dominio: str, linha) -> Conta | None:
+        with self._lock:
+            if not linha:
+                self._negativos[dominio] = time.monotonic() + self.ttl_negativo
+                return None
+            conta = Conta(linha[0], linha[1], linha[2], linha[3])
+            self._contas[dominio] = conta
+            return conta
+
+    @staticmethod
+    def _params(dominio: str) -> tuple:
+        return (dominio, f"www.{dominio}")
+
+    @metricas.medir("resolver")
+    def resolver(self, dominio_loja: str) -> Conta | None:
+        dominio = normalizar_dominio(dominio_loja)
+        encontrado, conta = self._da_memoria(dominio)
+        if encontrado:
+            return conta
+        return self._registrar(dominio, fetch_row(GET_DETALHES_CONTA_POR_VARIANTES_DOMINIO, self._params(dominio)))
+
+    async def resolver_async(self, dominio_loja: str) -> Conta | None:
+        with metricas.medir("resolver"):
+            dominio = normalizar_dominio(dominio_loja)
+            encontrado, conta = self._da_memoria(dominio)
+            if encontrado:
+                return conta
+            linha = await fetch_row_async(GET_DETALHES_CONTA_POR_VARIANTES_DOMINIO, self._params(dominio))
+            return self._registrar(dominio, linha)
+
+    @staticmethod
+    def _params_lote(dominios: list[str]) -> tuple:
+        params = [variante for dominio in dominios for variante in (dominio, f"www.{dominio}")]
+        return tuple(params + [params[-1]] * (2 * LOTE_DOMINIOS - len(params)))
+
+    async def resolver_varios_async(self, dominios_loja: list[str]) -> dict[str, Conta | None]:
+        """
+        Resolve vários domínios de uma vez: os que não estão em memória são buscados
+        com GET_DETALHES_CONTAS_POR_DOMINIOS, em lotes de LOTE_DOMINIOS.
+        """
+        with metricas.medir("resolver", "lote"):
+            return await self._resolver_varios_async(dominios_loja)
+
+    async def _resolver_varios_async(self, dominios_loja: list[str]) -> dict[str, Conta | None]:
+        resultado = {}
+        faltando: dict[str, list[str]] = {}
+        for dominio_loja in dominios_loja:
+            dominio = normalizar_dominio(dominio_loja)
+            encontrado, conta = self._da_memoria(dominio)
+            if encontrado:
+                resultado[dominio_loja] = conta
+            else:
+                faltando.setdefault(dominio, []).append(dominio_loja)
+
+        dominios = list(faltando)
+        lotes = [dominios[i:i + LOTE_DOMINIOS] for i in range(0, len(dominios), LOTE_DOMINIOS)]
+        respostas = await asyncio.gather(
+            *(fetch_all_async(GET_DETALHES_CONTAS_POR_DOMINIOS, self._params_lote(lote)) for lote in lotes)
+        )
+
+        linhas = {}
+        for resposta in respostas:
+            for linha in resposta:
+                linhas.setdefault(normalizar_dominio(linha["conta_loja_dominio"]), linha)
+
+        for dominio, originais in faltando.items():
+            linha = linhas.get(dominio)
+            if linha is not None:
+                linha = (linha["conta_id"], linha["conta_loja_nome"], linha["conta_loja_descricao"], linha["atividade_nome"])
+            conta = self._registrar(dominio, linha)
+            for dominio_loja in originais:
+                resultado[dominio_loja] = conta
+        return resultado
+
+    def invalidar(self, dominio_loja: str):
+        dominio = normalizar_dominio(dominio_loja)
+        with self._lock:
+            self._contas.pop(dominio, None)
+            self._negativos.pop(dominio, None)
+
+    def _loop_atualizacao(self):
+        while not self._parar.is_set():
+            try:
+                total = self.carregar_todas()
+                logger.info(f"Resolvedor de domínios: {total} contas ativas carregadas.")
+            except Exception:
+                logger.exception("Falha ao carregar as contas ativas no resolvedor de domínios.")
+            self._parar.wait(self.intervalo_atualizacao)
+
+    def iniciar(self):
+        # Faz a carga inicial e as atualizações periódicas em uma thread daemon
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop_atualizacao, name="resolvedor-dominios", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "contas": len(self._contas),
+                "negativos": len(self._negativos),
+                "hits": self.hits,
+                "hits_negativos": self.hits_negativos,
+                "misses": self.misses,
+                "ultima_carga": self.ultima_carga,
+            }
+
+
+resolvedor = ResolvedorDominios()
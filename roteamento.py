@@ -0,0 +1,193 @@
+# roteamento.py
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import metricas
+
+logger = logging.getLogger("uvicorn")
+
+# Com 0, cada rota usa sempre a primeira camada (o modelo que o endpoint usava antes)
+LLM_ROTEAMENTO = os.getenv("LLM_ROTEAMENTO", "1") == "1"
+
+
+class Camada(NamedTuple):
+    modelo: str
+    max_tokens: int
+
+
+class Rota(NamedTuple):
+    camadas: list[Camada]  # em ordem de preferência
+    slo: float  # segundos
+    prompt_pequeno: int  # até quantos tokens da parte variável do prompt (contexto da loja) a camada mais rápida basta
+
+
+def _rota(camadas, slo, prompt_pequeno=0) -> Rota:
+    return Rota([Camada(*c) for c in camadas], float(slo), int(prompt_pequeno))
+
+
+_ROTAS = {
+    "PERSONAS": _rota([("gpt-4o", 1000), ("gpt-4o-mini", 1000)], slo=20, prompt_pequeno=400),
+    "INSIGHTS": _rota([("gpt-4o", 1000), ("gpt-4o-mini", 1000)], slo=15, prompt_pequeno=300),
+    "MELHORIAS": _rota([("gpt-4o", 1500), ("gpt-4o-mini", 1500)], slo=30, prompt_pequeno=300),
+    "PERSONAS_ESTRUTURADAS": _rota([("gpt-4o-mini", 4000), ("gpt-4o", 4000)], slo=60),
+    "PERSONAS_PLANO": _rota([("gpt-4o-mini", 400), ("gpt-4o", 400)], slo=10),
+    "PERSONA": _rota([("gpt-4o-mini", 1200), ("gpt-4o", 1200)], slo=20),
+}
+
+# Ex.: LLM_ROTAS='{"INSIGHTS": {"camadas": [["gpt-4o-mini", 800]], "slo": 8, "prompt_pequeno": 0}}'
+for _nome, _config in json.loads(os.getenv("LLM_ROTAS") or "{}").items():
+    _ROTAS[_nome.upper()] = _rota(_config["camadas"], _config.get("slo", 30), _config.get("prompt_pequeno", 0))
+
+# Latência esperada por modelo: fixa + prompt / prefill + completion / geração (tokens por segundo).
+# A velocidade de geração é ajustada pelas respostas observadas.
+_PERFIL_PADRAO = {"base": 0.8, "prefill": 4000.0, "geracao": 50.0}
+_PERFIS = {
+    "gpt-4o": {"base": 0.6, "prefill": 4000.0, "geracao": 60.0},
+    "gpt-4o-mini": {"base": 0.4, "prefill": 8000.0, "geracao": 100.0},
+}
+_PESO = 0.2  # média móvel exponencial
+
+
+def estimar_tokens_prompt(messages) -> int:
+    return sum(len(str(m.get("content") or "")) for m in messages or ()) // 4
+
+
+class Roteador:
+    """
+    Escolhe modelo e max_tokens de cada chamada à IA a partir da rota (endpoint), do tamanho
+    do prompt e do SLO de latência da rota.
+
+    Prompts pequenos vão direto para a camada mais rápida; os demais usam a primeira camada,
+    em ordem de preferência, cuja latência estimada cabe no SLO. Se a camada escolhida passar
+    do SLO ou falhar, a chamada é refeita nas outras (a última sem limite de tempo).
+    """
+
+    def __init__(self, rotas: dict[str, Rota] = _ROTAS, ativo: bool = LLM_ROTEAMENTO):
+        self.rotas = rotas
+        self.ativo = ativo
+        self._lock = threading.Lock()
+        self._geracao = {modelo: perfil["geracao"] for modelo, perfil in _PERFIS.items()}
+        self._completion: dict[str, float] = {}
+        self._contagens: dict[tuple[str, str], dict] = {}
+
+    def _perfil(self, modelo: str) -> dict:
+        return _PERFIS.get(modelo, _PERFIL_PADRAO)
+
+    def estimar_latencia(self, rota: str, camada: Camada, tokens_prompt: int) -> float:
+        perfil = self._perfil(camada.modelo)
+        completion = min(camada.max_tokens, self._completion.get(rota, camada.max_tokens / 2))
+        geracao = self._geracao.get(camada.modelo, perfil["geracao"])
+        return perfil["base"] + tokens_prompt / perfil["prefill"] + completion / geracao
+
+    def planejar(self, rota: str, messages, contexto: str | None = None) -> list[Camada]:
+        """
+        Camadas na ordem em que serão tentadas: a escolhida primeiro, depois as alternativas.
+
+        `contexto` é a parte variável do prompt (ex.: o contexto da loja). É ela que decide se o
+        prompt é pequeno: o template fixo de cada endpoint já passa de algumas centenas de tokens.
+        Sem ela, vale o prompt inteiro.
+        """
+        config = self.rotas[rota]
+        camadas = config.camadas
+        if not self.ativo or len(camadas) == 1:
+            return list(camadas)
+        tokens = estimar_tokens_prompt(messages)
+        latencias = [self.estimar_latencia(rota, c, tokens) for c in camadas]
+        mais_rapida = min(range(len(camadas)), key=latencias.__getitem__)
+        variaveis = tokens if contexto is None else len(contexto) // 4
+        if variaveis <= config.prompt_pequeno:
+            escolhida = mais_rapida
+        else:
+            escolhida = next((i for i, latencia in enumerate(latencias) if latencia <= config.slo), mais_rapida)
+        # Alternativas: primeiro as mais rápidas que a escolhida, depois as demais
+        alternativas = sorted((i for i in range(len(camadas)) if i != escolhida), key=latencias.__getitem__)
+        return [camadas[escolhida], *(camadas[i] for i in alternativas)]
+
+    def aplicar(self, camada: Camada, kwargs: dict) -> dict:
+        return {**kwargs, "model": camada.modelo, "max_tokens": camada.max_tokens}
+
+    def registrar(self, rota: str, camada: Camada, resultado: str, segundos: float | None = None, usage=None, fallback: bool = False):
+        with self._lock:
+            contagem = self._contagens.setdefault(
+                (rota, camada.modelo),
+                {"chamadas": 0, "ok": 0, "slo_excedido": 0, "erros": 0, "como_alternativa": 0, "segundos_total": 0.0},
+            )
+            contagem["chamadas"] += 1
+            contagem[resultado] += 1
+            contagem["como_alternativa"] += fallback
+            if segundos is not None:
+                contagem["segundos_total"] += segundos
+        metricas.registro.incrementar("llm_rotas_total", rota=rota, modelo=camada.modelo, resultado=resultado)
+        if segundos is not None:
+            metricas.registro.observar("llm_rota_segundos", segundos, rota=rota, modelo=camada.modelo)
+        if resultado == "ok" and usage is not None and segundos is not None:
+            self._aprender(rota, camada, segundos, usage)
+
+    def _aprender(self, rota: str, camada: Camada, segundos: float, usage):
+        perfil = self._perfil(camada.modelo)
+        geracao = segundos - perfil["base"] - usage.prompt_tokens / perfil["prefill"]
+        with self._lock:
+            anterior = self._completion.get(rota)
+            valor = usage.completion_tokens
+            self._completion[rota] = valor if anterior is None else anterior + _PESO * (valor - anterior)
+            # Respostas do cache chegam em milissegundos e não dizem nada sobre o modelo
+            if geracao > 0 and usage.completion_tokens:
+                anterior = self._geracao.get(camada.modelo, perfil["geracao"])
+                self._geracao[camada.modelo] = anterior + _PESO * (usage.completion_tokens / geracao - anterior)
+
+    async def executar(self, rota: str, kwargs: dict, chamada, contexto: str | None = None):
+        """
+        Executa `chamada(kwargs_com_modelo, prazo)` pela rota, com as alternativas em caso de SLO
+        excedido ou erro.
+
+        `chamada` aplica o prazo só à requisição à API (asyncio.TimeoutError ao passar dele), não
+        à espera no controle de admissão: sob 429 a fila cresce, e trocar de modelo por causa
+        dela só mandaria mais carga à OpenAI. A última camada roda sem prazo.
+        """
+        config = self.rotas[rota]
+        camadas = self.planejar(rota, kwargs.get("messages"), contexto)
+        for indice, camada in enumerate(camadas):
+            ultima = indice == len(camadas) - 1
+            inicio = time.perf_counter()
+            try:
+                resposta = await chamada(self.aplicar(camada, kwargs), None if ultima else config.slo)
+            except asyncio.TimeoutError:
+                self.registrar(rota, camada, "slo_excedido", time.perf_counter() - inicio, fallback=indice > 0)
+                logger.warning(f"Rota {rota}: {camada.modelo} passou do SLO de {config.slo} segundos, tentando {camadas[indice + 1].modelo}.")
+                continue
+            except Exception:
+                self.registrar(rota, camada, "erros", time.perf_counter() - inicio, fallback=indice > 0)
+                if ultima:
+                    raise
+                logger.exception(f"Rota {rota}: falha em {camada.modelo}, tentando {camadas[indice + 1].modelo}.")
+                continue
+            self.registrar(rota, camada, "ok", time.perf_counter() - inicio, getattr(resposta, "usage", None), fallback=indice > 0)
+            return resposta
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            rotas = {}
+            for (rota, modelo), contagem in sorted(self._contagens.items()):
+                chamadas = contagem["chamadas"]
+                rotas.setdefault(rota, {})[modelo] = {
+                    **{k: v for k, v in contagem.items() if k != "segundos_total"},
+                    "latencia_media": round(contagem["segundos_total"] / chamadas, 3) if chamadas else None,
+                }
+            return {
+                "ativo": self.ativo,
+                "configuracao": {
+                    nome: {"camadas": [list(c) for c in r.camadas], "slo": r.slo, "prompt_pequeno": r.prompt_pequeno}
+                    for nome, r in self.rotas.items()
+                },
+                "geracao_tokens_por_segundo": {m: round(v, 1) for m, v in self._geracao.items()},
+                "rotas": rotas,
+            }
+
+
+roteador = Roteador()
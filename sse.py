@@ -0,0 +1,93 @@
+# sse.py
+
+import json
+
+
+def evento_sse(dados, evento: str | None = None) -> str:
+    linhas = []
+    if evento:
+        linhas.append(f"event: {evento}")
+    texto = dados if isinstance(dados, str) else json.dumps(dados, ensure_ascii=False)
+    linhas.extend(f"data: {linha}" for linha in texto.split("\n"))
+    return "\n".join(linhas) + "\n\n"
+
+
+class ExtratorElementosJson:
+    """
+    Lê um JSON que chega em pedaços (tokens do LLM) e devolve cada elemento da
+    lista `chave` do objeto principal assim que ele fecha, ex.: cada persona de
+    {"personas": [{...}, {...}]}. Texto fora do objeto (como cercas de markdown) é ignorado.
+    """
+
+    def __init__(self, chave: str):
+        self.chave = chave
+        self._texto = ""
+        self._pos = 0
+        self._profundidade = 0
+        self._em_string = False
+        self._escape = False
+        self._inicio_string = None
+        self._ultima_string = None
+        self._chave_atual = None
+        self._na_lista = False
+        self._inicio_elemento = None
+
+    def alimentar(self, pedaco: str) -> list[str]:
+        """Recebe mais texto e retorna o JSON bruto dos elementos que completaram."""
+        self._texto += pedaco
+        elementos = []
+        texto = self._texto
+        for i in range(self._pos, len(texto)):
+            c = texto[i]
+            if self._em_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._em_string = False
+                    if self._profundidade == 1:
+                        self._ultima_string = texto[self._inicio_string + 1:i]
+                    elif self._na_lista and self._profundidade == 2 and self._inicio_elemento == self._inicio_string:
+                        elementos.append(texto[self._inicio_elemento:i + 1])
+                        self._inicio_elemento = None
+                continue
+
+            if c == '"':
+                self._em_string = True
+                self._inicio_string = i
+                if self._na_lista and self._profundidade == 2 and self._inicio_elemento is None:
+                    self._inicio_elemento = i
+            elif c in "{[":
+                if self._na_lista and self._profundidade == 2 and self._inicio_elemento is None:
+                    self._inicio_elemento = i
+                if c == "[" and self._profundidade == 1 and self._chave_atual == self.chave:
+                    self._na_lista = True
+                self._profundidade += 1
+            elif c in "}]":
+                self._profundidade -= 1
+                if self._na_lista and self._profundidade == 2 and self._inicio_elemento is not None:
+                    elementos.append(texto[self._inicio_elemento:i + 1])
+                    self._inicio_elemento = None
+                elif self._na_lista and self._profundidade == 1:
+                    # Fim da lista: um escalar pendente (número, true...) termina aqui
+                    if self._inicio_elemento is not None:
+                        elementos.append(texto[self._inicio_elemento:i].strip())
+                        self._inicio_elemento = None
+                    self._na_lista = False
+            elif c == ":" and self._profundidade == 1:
+                self._chave_atual = self._ultima_string
+            elif c == ",":
+                if self._profundidade == 1:
+                    self._chave_atual = None
+                elif self._na_lista and self._profundidade == 2 and self._inicio_elemento is not None:
+                    elementos.append(texto[self._inicio_elemento:i].strip())
+                    self._inicio_elemento = None
+            elif not c.isspace() and self._na_lista and self._profundidade == 2 and self._inicio_elemento is None:
+                self._inicio_elemento = i
+        self._pos = len(texto)
+        return elementos
+
+    @property
+    def texto(self) -> str:
+        return self._texto
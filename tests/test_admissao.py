@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from admissao import ControladorAdmissao
+
+KWARGS = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+
+
+def _saldo_depois(chamada, cancelar: bool) -> tuple[float, float]:
+    """Executa `chamada` pelo controle de admissão; retorna (tokens debitados durante, saldo no fim)."""
+
+    async def rodar():
+        controlador = ControladorAdmissao(rpm=0, tpm=10000)
+        tarefa = asyncio.create_task(controlador.executar("TESTE", KWARGS, chamada))
+        await asyncio.sleep(0.01)
+        debitado = 10000 - controlador.tokens.disponivel
+        if cancelar:
+            tarefa.cancel()
+        with pytest.raises((asyncio.CancelledError, ValueError)):
+            await tarefa
+        return debitado, controlador.tokens.disponivel
+
+    return asyncio.run(rodar())
+
+
+def test_chamada_cancelada_devolve_a_reserva():
+    async def lenta():
+        await asyncio.sleep(10)
+
+    debitado, saldo = _saldo_depois(lenta, cancelar=True)
+    assert debitado > 0
+    assert saldo == pytest.approx(10000, abs=5)
+
+
+def test_erro_sem_nova_tentativa_devolve_a_reserva():
+    async def falha():
+        await asyncio.sleep(0.05)
+        raise ValueError("resposta inválida")
+
+    debitado, saldo = _saldo_depois(falha, cancelar=False)
+    assert debitado > 0
+    assert saldo == pytest.approx(10000, abs=5)
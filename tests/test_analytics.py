@@ -0,0 +1,28 @@
+import pandas as pd
+
+from analytics import _contar, gerar_insights_para_persona
+
+
+def test_empates_ficam_na_ordem_de_aparicao():
+    contagens = _contar({"a": pd.Series(["x", "y", "z", "z", "y", None]), "b": pd.Series(["q", "p", "p", "q"])})
+    assert list(contagens["a"].items()) == [("y", 2), ("z", 2), ("x", 1)]
+    assert list(contagens["b"].items()) == [("q", 2), ("p", 2)]
+
+
+def test_insights_com_empates_sao_estaveis():
+    df = pd.DataFrame(
+        {
+            "cliente_nome": ["Ana", "Bia", "Caio", "Caio", "Bia", "Ana"],
+            "hora_pedido": ["23:10:00", "13:00:00", "13:05:00", "23:00:00", "08:00:00", None],
+            "dia_semana_pedido": ["Mon", "Tue", "Tue", "Mon", "Wed", "Wed"],
+            "pedido_venda_utm_campaign": [None, "email", "email", None, "ads", "ads"],
+            "cliente_sexo": ["F", "M", "M", "F", "F", "M"],
+            "pedido_venda_valor_subtotal": [10, 20, 30, 40, 50, 60],
+            "produtos": ["P1 | P2", "P2", "P1", None, "P3", "P3"],
+        }
+    )
+    insights = gerar_insights_para_persona(df)
+    assert list(insights["top_clientes"]) == ["Ana", "Bia", "Caio"]
+    assert list(insights["horas_com_mais_vendas"]) == [23, 13, 8]
+    assert insights["produtos_mais_vendidos"] == [("P1", 2), ("P2", 2), ("P3", 2)]
+    assert list(insights["campanhas_mais_ativas"]) == ["email", "ads"]
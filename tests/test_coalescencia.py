@@ -0,0 +1,50 @@
+import asyncio
+
+from coalescencia import Coalescedor
+
+
+def test_chamada_depois_de_abandonar_inicia_novo_voo():
+    async def cenario():
+        coalescedor = Coalescedor("teste")
+        execucoes = 0
+
+        async def lento():
+            nonlocal execucoes
+            execucoes += 1
+            await asyncio.sleep(0.05)
+            return execucoes
+
+        primeira = asyncio.create_task(coalescedor.executar("chave", lento))
+        await asyncio.sleep(0)
+        primeira.cancel()
+        # A segunda chega logo depois do cancelamento da única que esperava, antes do
+        # done-callback da execução cancelada tirar a chave do registro
+        segunda = asyncio.create_task(coalescedor.executar("chave", lento))
+        await asyncio.gather(primeira, return_exceptions=True)
+        resultado = await segunda
+        return primeira.cancelled(), resultado, coalescedor.abandonadas
+
+    cancelada, resultado, abandonadas = asyncio.run(cenario())
+    assert cancelada
+    assert resultado == 2
+    assert abandonadas == 1
+
+
+def test_chamadas_concorrentes_compartilham_execucao():
+    async def cenario():
+        coalescedor = Coalescedor("teste")
+        execucoes = 0
+
+        async def lento():
+            nonlocal execucoes
+            execucoes += 1
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        resultados = await asyncio.gather(*(coalescedor.executar("chave", lento) for _ in range(5)))
+        return resultados, execucoes, coalescedor.em_andamento()
+
+    resultados, execucoes, em_andamento = asyncio.run(cenario())
+    assert resultados == ["ok"] * 5
+    assert execucoes == 1
+    assert em_andamento == 0
@@ -0,0 +1,14 @@
+import datetime
+
+from contexto_ia import formatar_amostra_para_prompt
+
+
+def test_datas_de_nascimento_invalidas_ficam_sem_idade():
+    amostra = [
+        {"cliente_data_nascimento": valor}
+        for valor in ("0000-00-00", "abc", None, "2999-01-01", datetime.date(1990, 1, 1))
+    ]
+    linhas = formatar_amostra_para_prompt(amostra).splitlines()
+    assert linhas[0] == "idade"
+    assert linhas[1:5] == ["-", "-", "-", "-"]
+    assert int(linhas[5]) >= 36
@@ -0,0 +1,38 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import main
+import metricas
+
+
+def test_stream_fecha_o_registro_depois_do_ultimo_pedaco(monkeypatch):
+    fechadas = []
+    fechar = metricas.Requisicao.fechar
+
+    def registrar(self):
+        fechadas.append((self.rota, [etapa for etapa, _, _ in self.etapas]))
+        fechar(self)
+
+    monkeypatch.setattr(metricas.Requisicao, "fechar", registrar)
+    monkeypatch.setattr(metricas, "METRICAS_CABECALHOS", True)
+    app = FastAPI()
+    app.middleware("http")(main.medir_requisicao)
+
+    @app.get("/stream")
+    async def stream():
+        async def gerar():
+            yield "a"
+            await asyncio.sleep(0.01)
+            metricas.registrar_etapa("llm", 0.01)
+            yield "b"
+
+        return StreamingResponse(gerar(), media_type="text/event-stream")
+
+    with TestClient(app) as cliente:
+        resposta = cliente.get("/stream")
+    assert resposta.text == "ab"
+    assert "Server-Timing" not in resposta.headers
+    assert fechadas == [("/stream", ["llm"])]
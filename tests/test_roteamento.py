@@ -0,0 +1,59 @@
+import asyncio
+
+from admissao import ControladorAdmissao
+from roteamento import Roteador, _rota
+
+ROTAS = {"TESTE": _rota([("lento", 100), ("rapido", 100)], slo=0.1)}
+KWARGS = {"messages": [{"role": "user", "content": "oi"}]}
+
+
+def _executar(segundos_api: float, pausa_fila: float):
+    async def rodar():
+        roteador = Roteador(rotas=ROTAS, ativo=False)
+        controlador = ControladorAdmissao(rpm=0, tpm=0)
+        controlador.pausar(pausa_fila)  # como depois de um 429
+        modelos = []
+
+        async def api(kwargs):
+            modelos.append(kwargs["model"])
+            await asyncio.sleep(segundos_api)
+            return kwargs["model"]
+
+        async def chamada(kwargs, prazo):
+            resultado, _ = await controlador.executar("TESTE", kwargs, lambda: api(kwargs), prazo=prazo)
+            return resultado
+
+        return await roteador.executar("TESTE", KWARGS, chamada), modelos
+
+    return asyncio.run(rodar())
+
+
+def test_espera_na_fila_nao_conta_para_o_slo():
+    resposta, modelos = _executar(segundos_api=0.01, pausa_fila=0.3)
+    assert resposta == "lento"
+    assert modelos == ["lento"]
+
+
+def test_api_lenta_passa_para_a_alternativa():
+    resposta, modelos = _executar(segundos_api=0.3, pausa_fila=0)
+    assert resposta == "rapido"
+    assert modelos == ["lento", "rapido"]
+
+
+def test_loja_pequena_vai_para_a_camada_rapida():
+    import main
+    from roteamento import estimar_tokens_prompt
+
+    roteador = Roteador(ativo=True)
+    # Contexto de uma loja com um único pedido
+    contexto = (
+        "Loja: Loja Teste. Atividade: Moda. Pedidos nos últimos 30 dias: 1. Ticket médio: R$ 120,00. "
+        "Produtos mais vendidos: Camiseta Básica (1). Gênero: Feminino 100%. Faixa de idade: 25-34 100%."
+    )
+    mensagens = main._mensagens_insights(contexto)
+    # Só o template fixo já passa do limite de prompt pequeno da rota
+    assert estimar_tokens_prompt(mensagens) > roteador.rotas["INSIGHTS"].prompt_pequeno
+    assert roteador.planejar("INSIGHTS", mensagens, contexto)[0].modelo == "gpt-4o-mini"
+
+    grande = contexto * 40
+    assert roteador.planejar("INSIGHTS", main._mensagens_insights(grande), grande)[0].modelo == "gpt-4o"
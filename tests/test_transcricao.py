@@ -0,0 +1,68 @@
+import asyncio
+import io
+import wave
+
+import numpy as np
+
+import transcricao
+from transcricao import LeitorWav
+
+TAXA = 16000
+# (início, fim) em segundos das pausas da fala no áudio de teste
+PAUSAS = [(8.5, 9.0), (17.3, 17.8)]
+DURACAO = 25.0
+
+
+def _wav_com_pausas() -> io.BytesIO:
+    tempo = np.arange(int(DURACAO * TAXA)) / TAXA
+    rng = np.random.default_rng(0)
+    sinal = 8000 * np.sin(2 * np.pi * 220 * tempo) + rng.normal(0, 1000, len(tempo))
+    for inicio, fim in PAUSAS:
+        sinal[int(inicio * TAXA):int(fim * TAXA)] = rng.normal(0, 20, int(fim * TAXA) - int(inicio * TAXA))
+    saida = io.BytesIO()
+    with wave.open(saida, "wb") as arquivo:
+        arquivo.setnchannels(1)
+        arquivo.setsampwidth(2)
+        arquivo.setframerate(TAXA)
+        arquivo.writeframes(sinal.astype("<i2").tobytes())
+    saida.seek(0)
+    return saida
+
+
+def test_cortes_ficam_nas_pausas():
+    leitor = LeitorWav(_wav_com_pausas(), segundos_por_trecho=10, segundos_busca=4)
+    assert leitor.trechos == 3
+    for corte, (inicio, fim) in zip(leitor.cortes[1:-1], PAUSAS):
+        assert inicio * TAXA <= corte <= fim * TAXA
+    assert all(b - a <= 10 * TAXA for a, b in zip(leitor.cortes, leitor.cortes[1:]))
+
+
+def test_arquivo_com_varios_trechos_reune_o_texto_em_ordem(monkeypatch):
+    monkeypatch.setattr(LeitorWav, "abrir", classmethod(lambda cls, arquivo: cls(arquivo, 10, 4)))
+    frames = []
+
+    async def transcrever(nome, arquivo, tipo):
+        assert nome.endswith(".wav")
+        with wave.open(arquivo, "rb") as wav:
+            frames.append(wav.getnframes())
+        await asyncio.sleep(0.01 * (3 - int(nome[:4])))  # os últimos terminam primeiro
+        return f"trecho{int(nome[:4])}"
+
+    monkeypatch.setattr(transcricao, "_transcrever", transcrever)
+    texto = asyncio.run(transcricao.transcrever_arquivo(_wav_com_pausas(), "audio/wav"))
+    assert texto == "trecho0 trecho1 trecho2"
+    assert sum(frames) == int(DURACAO * TAXA)
+
+
+def test_upload_unico_recebe_extensao_do_conteudo_ou_do_tipo(monkeypatch):
+    nomes = []
+
+    async def transcrever(nome, arquivo, tipo):
+        nomes.append(nome)
+        return ""
+
+    monkeypatch.setattr(transcricao, "_transcrever", transcrever)
+    asyncio.run(transcricao.transcrever_arquivo(io.BytesIO(b"OggS" + bytes(60)), None))
+    asyncio.run(transcricao.transcrever_arquivo(io.BytesIO(bytes(64)), "audio/webm;codecs=opus"))
+    asyncio.run(transcricao.transcrever_arquivo(io.BytesIO(bytes(64)), "application/octet-stream"))
+    assert nomes == ["audio.ogg", "audio.webm", "audio.wav"]
@@ -0,0 +1,181 @@
+# transcricao.py
+
+import asyncio
+import io
+import os
+import threading
+import wave
+import weakref
+
+import numpy as np
+
+import llm
+
+TRANSCRICAO_MODELO = os.getenv("TRANSCRICAO_MODELO", "whisper-1")
+# Gravações WAV mais longas que isso são divididas em trechos de no máximo esse tamanho
+TRANSCRICAO_TRECHO_SEGUNDOS = float(os.getenv("TRANSCRICAO_TRECHO_SEGUNDOS", "120"))
+# Cada corte é feito no ponto mais silencioso destes últimos segundos do trecho, para não partir palavras
+TRANSCRICAO_BUSCA_SILENCIO_SEGUNDOS = float(os.getenv("TRANSCRICAO_BUSCA_SILENCIO_SEGUNDOS", "10"))
+# Requisições de transcrição ao mesmo tempo no processo, somando os trechos de todos os
+# arquivos: os trechos de um arquivo são disparados juntos e esperam a vez aqui, e só os que
+# estão em andamento ficam em memória
+TRANSCRICAO_MAX_CONCORRENCIA = int(os.getenv("TRANSCRICAO_MAX_CONCORRENCIA", "4"))
+
+_JANELA_SILENCIO_SEGUNDOS = 0.05
+
+# A API deduz o formato pela extensão do nome enviado: ela vem do conteúdo do arquivo ou do
+# content_type, nunca do nome escolhido pelo cliente (ex.: "blob", sem extensão)
+_ASSINATURAS = (
+    (0, b"RIFF", ".wav"),
+    (0, b"fLaC", ".flac"),
+    (0, b"OggS", ".ogg"),
+    (0, b"ID3", ".mp3"),
+    (0, b"\x1aE\xdf\xa3", ".webm"),
+    (4, b"ftyp", ".m4a"),
+)
+_EXTENSOES_POR_TIPO = {
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/wave": ".wav",
+    "audio/flac": ".flac",
+    "audio/x-flac": ".flac",
+    "audio/ogg": ".ogg",
+    "audio/mpeg": ".mp3",
+    "audio/mp3": ".mp3",
+    "audio/webm": ".webm",
+    "video/webm": ".webm",
+    "audio/mp4": ".m4a",
+    "audio/x-m4a": ".m4a",
+    "video/mp4": ".mp4",
+}
+
+_semaforos = weakref.WeakKeyDictionary()
+
+
+def _semaforo() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaforo = _semaforos.get(loop)
+    if semaforo is None:
+        semaforo = _semaforos[loop] = asyncio.Semaphore(TRANSCRICAO_MAX_CONCORRENCIA)
+    return semaforo
+
+
+def _amplitudes(dados: bytes, largura: int, canais: int) -> np.ndarray | None:
+    """Amplitude absoluta média entre os canais, por frame; None para formatos sem suporte (ex.: 24 bits)."""
+    tipos = {1: np.uint8, 2: "<i2", 4: "<i4"}
+    if largura not in tipos:
+        return None
+    tamanho = len(dados) - len(dados) % (largura * canais)
+    amostras = np.frombuffer(dados[:tamanho], dtype=tipos[largura]).astype(np.float64)
+    if largura == 1:
+        amostras -= 128  # PCM de 8 bits não tem sinal
+    return np.abs(amostras.reshape(-1, canais)).mean(axis=1)
+
+
+class LeitorWav:
+    """
+    Lê trechos de um WAV direto do arquivo enviado, sem copiá-lo para o disco.
+
+    Os cortes entre trechos ficam no ponto mais silencioso do fim de cada trecho, para que
+    nenhuma palavra seja dividida entre dois deles. Cada trecho vira um WAV completo em
+    memória (mesmo formato do original), montado só quando vai ser enviado.
+    """
+
+    def __init__(
+        self,
+        arquivo,
+        segundos_por_trecho: float = TRANSCRICAO_TRECHO_SEGUNDOS,
+        segundos_busca: float = TRANSCRICAO_BUSCA_SILENCIO_SEGUNDOS,
+    ):
+        self._wav = wave.open(arquivo, "rb")
+        self._lock = threading.Lock()
+        self.parametros = self._wav.getparams()
+        self.frames_por_trecho = max(1, int(self.parametros.framerate * segundos_por_trecho))
+        # A busca fica na metade final do trecho, para os trechos não ficarem curtos demais
+        self.frames_busca = min(int(self.parametros.framerate * segundos_busca), self.frames_por_trecho // 2)
+        self.cortes = self._calcular_cortes()
+        self.trechos = len(self.cortes) - 1
+
+    def _calcular_cortes(self) -> list[int]:
+        total = self.parametros.nframes
+        cortes = [0]
+        while total - cortes[-1] > self.frames_por_trecho:
+            limite = cortes[-1] + self.frames_por_trecho
+            cortes.append(self._ponto_mais_silencioso(limite - self.frames_busca, limite))
+        cortes.append(total)
+        return cortes
+
+    def _ponto_mais_silencioso(self, inicio: int, fim: int) -> int:
+        janela = max(1, int(self.parametros.framerate * _JANELA_SILENCIO_SEGUNDOS))
+        if fim - inicio <= janela:
+            return fim
+        self._wav.setpos(inicio)
+        amplitudes = _amplitudes(self._wav.readframes(fim - inicio), self.parametros.sampwidth, self.parametros.nchannels)
+        if amplitudes is None or len(amplitudes) <= janela:
+            return fim
+        energia = np.convolve(amplitudes, np.ones(janela), "valid")
+        # Entre pontos igualmente silenciosos, o mais perto do fim (trechos maiores, menos cortes)
+        posicao = len(energia) - 1 - int(np.argmin(energia[::-1]))
+        return inicio + posicao + janela // 2
+
+    @classmethod
+    def abrir(cls, arquivo, segundos_por_trecho: float = TRANSCRICAO_TRECHO_SEGUNDOS) -> "LeitorWav | None":
+        # None quando o arquivo não é um WAV PCM: nesse caso ele é enviado inteiro
+        try:
+            arquivo.seek(0)
+            return cls(arquivo, segundos_por_trecho)
+        except (wave.Error, EOFError):
+            arquivo.seek(0)
+            return None
+
+    def trecho(self, indice: int) -> io.BytesIO:
+        inicio, fim = self.cortes[indice], self.cortes[indice + 1]
+        with self._lock:
+            self._wav.setpos(inicio)
+            frames = self._wav.readframes(fim - inicio)
+        saida = io.BytesIO()
+        with wave.open(saida, "wb") as wav:
+            wav.setparams(self.parametros)
+            wav.writeframes(frames)
+        saida.seek(0)
+        return saida
+
+
+def _extensao(arquivo, tipo: str | None) -> str:
+    arquivo.seek(0)
+    cabecalho = arquivo.read(12)
+    arquivo.seek(0)
+    for posicao, assinatura, extensao in _ASSINATURAS:
+        if cabecalho[posicao:posicao + len(assinatura)] == assinatura:
+            return extensao
+    if cabecalho[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return ".mp3"
+    return _EXTENSOES_POR_TIPO.get((tipo or "").split(";")[0].strip().lower(), ".wav")
+
+
+async def _transcrever(nome: str, arquivo, tipo: str | None) -> str:
+    resposta = await llm.transcrever(model=TRANSCRICAO_MODELO, file=(nome, arquivo, tipo))
+    return resposta.text.strip()
+
+
+async def transcrever_arquivo(arquivo, tipo: str | None = None) -> str:
+    """
+    Transcreve um arquivo já aberto (ex.: UploadFile.file, que o Starlette mantém em um
+    buffer próprio da requisição). WAVs longos são divididos em trechos, cortados em pausas
+    da fala; todos são disparados juntos, com no máximo TRANSCRICAO_MAX_CONCORRENCIA
+    requisições em andamento no processo, e o texto é reunido na ordem original.
+    """
+    leitor = await asyncio.to_thread(LeitorWav.abrir, arquivo)
+    if leitor is None or leitor.trechos == 1:
+        extensao = ".wav" if leitor is not None else await asyncio.to_thread(_extensao, arquivo, tipo)
+        async with _semaforo():
+            await asyncio.to_thread(arquivo.seek, 0)
+            return await _transcrever(f"audio{extensao}", arquivo, tipo)
+
+    async def transcrever_trecho(indice: int) -> str:
+        async with _semaforo():
+            dados = await asyncio.to_thread(leitor.trecho, indice)
+            return await _transcrever(f"{indice:04d}.wav", dados, "audio/wav")
+
+    textos = await asyncio.gather(*(transcrever_trecho(i) for i in range(leitor.trechos)))
+    return " ".join(texto for texto in textos if texto)